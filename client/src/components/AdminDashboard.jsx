@@ -46,7 +46,7 @@ import {
 import adminAIService from '../services/adminAIService';
 
 // Product Optimization Panel Component
-const ProductOptimizationPanel = ({ products, categories, onOptimize, onPatch, optimizationStatus, showNotification }) => {
+const ProductOptimizationPanel = ({ products, categories, onOptimize, onPatch, optimizationStatus, streamingText, showNotification }) => {
     const [selectedProduct, setSelectedProduct] = useState(null);
     const [optimizationData, setOptimizationData] = useState(null);
     const [searchTerm, setSearchTerm] = useState('');
@@ -162,6 +162,11 @@ const ProductOptimizationPanel = ({ products, categories, onOptimize, onPatch, o
                                             </button>
                                         </div>
                                     </div>
+                                    {status === 'optimizing' && streamingText[product.id] && (
+                                        <pre className="mt-3 max-h-40 overflow-y-auto whitespace-pre-wrap text-xs text-gray-600 bg-gray-50 p-3 rounded-lg">
+                                            {streamingText[product.id]}
+                                        </pre>
+                                    )}
                                 </div>
                             );
                         })}
@@ -772,6 +777,7 @@ const AIManagementTab = ({ products, categories, onProductUpdate, showNotificati
     const [aiAnalytics, setAiAnalytics] = useState(null);
     const [seoPerformance, setSeoPerformance] = useState(null);
     const [optimizationStatus, setOptimizationStatus] = useState({});
+    const [streamingText, setStreamingText] = useState({});
     const [isLoading, setIsLoading] = useState(false);
     const [activeAITab, setActiveAITab] = useState('optimize');
     const [selectedProducts, setSelectedProducts] = useState([]);
@@ -808,7 +814,11 @@ const AIManagementTab = ({ products, categories, onProductUpdate, showNotificati
         try {
             setOptimizationStatus(prev => ({ ...prev, [productId]: 'optimizing' }));
             
-            const result = await adminAIService.optimizeProduct(productId);
+            // Stream the response so the admin sees output from the first token
+            const result = await adminAIService.streamOptimizeProduct(productId, (text) => {
+                setStreamingText(prev => ({ ...prev, [productId]: text }));
+            });
+            setStreamingText(prev => ({ ...prev, [productId]: '' }));
             
             if (result.success) {
                 setOptimizationStatus(prev => ({ ...prev, [productId]: 'completed' }));
@@ -989,6 +999,7 @@ const AIManagementTab = ({ products, categories, onProductUpdate, showNotificati
                     onOptimize={handleOptimizeProduct}
                     onPatch={handlePatchProduct}
                     optimizationStatus={optimizationStatus}
+                    streamingText={streamingText}
                     showNotification={showNotification}
                 />
             )}
@@ -12,7 +12,7 @@ const Login = ({ onLogin }) => {
     const handleLogin = async () => {
         try {
             const response = await axios.post('https://myjamii-store.onrender.com/login', { username, password });
-            onLogin(response.data.user);
+            onLogin({ ...response.data.user, token: response.data.token });
 
             if (response.data.user.role === 'admin') {
                 navigate('/admin-dashboard');
@@ -14,6 +14,23 @@ class AdminAIService {
                 'Content-Type': 'application/json',
             }
         });
+        this.apiClient.interceptors.request.use((config) => {
+            config.headers = { ...config.headers, ...this.authHeaders() };
+            return config;
+        });
+    }
+
+    /**
+     * Bearer token of the logged-in user, stored with the user by the login page
+     * @returns {Object} Authorization header, or an empty object when logged out
+     */
+    authHeaders() {
+        try {
+            const user = JSON.parse(localStorage.getItem('myjamii_user'));
+            return user?.token ? { Authorization: `Bearer ${user.token}` } : {};
+        } catch {
+            return {};
+        }
     }
 
     /**
@@ -37,6 +54,66 @@ class AdminAIService {
         }
     }
 
+    /**
+     * Optimize a product while streaming the AI response as Server-Sent Events
+     * @param {number} productId - Product ID to optimize
+     * @param {Function} onToken - Called with the text received so far after each token
+     * @returns {Promise<Object>} Optimization results (same shape as optimizeProduct)
+     */
+    async streamOptimizeProduct(productId, onToken = () => {}) {
+        try {
+            const response = await fetch(`${this.baseURL}/admin/ai/products/${productId}/optimize/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
+                    ...this.authHeaders(),
+                }
+            });
+
+            if (!response.ok || !response.body) {
+                const data = await response.json().catch(() => ({}));
+                return { success: false, error: data.error || 'Failed to optimize product' };
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let streamedText = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // Events are separated by a blank line: "event: <name>\ndata: <json>"
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+
+                    if (event === 'token') {
+                        streamedText += data.text;
+                        onToken(streamedText);
+                    } else if (event === 'done') {
+                        return { success: true, data };
+                    } else if (event === 'error') {
+                        return { success: false, error: data.error || 'Failed to optimize product' };
+                    }
+                }
+            }
+
+            return { success: false, error: 'Optimization stream ended unexpectedly' };
+        } catch (error) {
+            console.error('Streaming product optimization failed:', error);
+            return {
+                success: false,
+                error: 'Failed to optimize product'
+            };
+        }
+    }
+
     /**
      * Get optimization status for a product
      * @param {number} productId - Product ID
@@ -0,0 +1,94 @@
+"""
+AI Bench - Throughput and tail latency of the AI endpoints against a running server
+Usage: python ai_bench.py --path /ai/products/{id}/meta-tags --ids 1-50 --requests 500 --concurrency 20
+Run the app with GROQ_BASE_URL pointing at groq_standin.py (or AI_REPLAY_MODE=replay) so no real
+Groq calls are made. Use fresh ids (or clear caches) to measure generation rather than cache hits.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+def parse_ids(spec: str):
+    """'1-50' or '3,7,9' -> list of ids"""
+    ids = []
+    for part in spec.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            ids.extend(range(int(start), int(end) + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run(args):
+    ids = itertools.cycle(parse_ids(args.ids))
+    ids_lock = threading.Lock()
+    body = json.loads(args.json) if args.json else {}
+    client = httpx.Client(base_url=args.url, timeout=args.timeout,
+                          limits=httpx.Limits(max_connections=args.concurrency))
+
+    def one_request(_):
+        with ids_lock:
+            path = args.path.format(id=next(ids))
+        start = time.perf_counter()
+        try:
+            if args.method == 'GET':
+                response = client.get(path)
+            else:
+                response = client.request(args.method, path, json=body)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = e.__class__.__name__
+        return status, (time.perf_counter() - start) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(one_request, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    client.close()
+
+    latencies = sorted(ms for _, ms in outcomes)
+    statuses = Counter(str(status) for status, _ in outcomes)
+    return {
+        'requests': len(outcomes),
+        'concurrency': args.concurrency,
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_rps': round(len(outcomes) / elapsed, 2) if elapsed else 0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 1),
+            'p90': round(percentile(latencies, 90), 1),
+            'p95': round(percentile(latencies, 95), 1),
+            'p99': round(percentile(latencies, 99), 1),
+            'max': round(latencies[-1], 1) if latencies else 0
+        },
+        'statuses': dict(statuses)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--path', default='/ai/products/{id}/meta-tags', help='{id} is replaced with a product id')
+    parser.add_argument('--method', default='POST', choices=['GET', 'POST'])
+    parser.add_argument('--json', help='request body for POST requests')
+    parser.add_argument('--ids', default='1-20', help="product ids to cycle through, e.g. '1-50' or '3,7,9'")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=60)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(parse_args()), indent=2))
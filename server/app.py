@@ -1,10 +1,17 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_restful import Api, Resource, reqparse
 from flask_sqlalchemy import SQLAlchemy
-from models import db, User, Product, Cart, CartItem, Category, AIGeneratedContent, SEOMetadata, AIUsageAnalytics
-from werkzeug.security import generate_password_hash, check_password_hash
+from models import db, User, Product, Cart, CartItem, Category, AIGeneratedContent, SEOMetadata, AIUsageAnalytics, StockMovement
+from services.inventory_ledger import inventory_ledger
+from services.stock_shards import stock_shards
+from services.auth_tokens import token_service, auth_required
+from services.password_hasher import password_hasher, HasherBusyError
+from services.rate_limiter import rate_limiter
+from services.model_registry import model_router
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_migrate import Migrate
+from sqlalchemy.exc import IntegrityError
 import os
 from dotenv import load_dotenv
 
@@ -12,6 +19,9 @@ load_dotenv()
 app = Flask(__name__)
 api = Api(app)
 CORS(app)
+# remote_addr comes from the X-Forwarded-For entry added by our own proxies (TRUSTED_PROXY_HOPS, one on Render),
+# never from one the client wrote
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv('TRUSTED_PROXY_HOPS', '1')))
 
 # Database configuration from environment
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
@@ -20,6 +30,9 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = os.getenv('SQLALCHEMY_TRACK_MODIF
 
 migrate = Migrate(app, db)
 db.init_app(app)
+token_service.init_app(app)
+rate_limiter.init_app(app)
+model_router.init_app(app)
 
 class UserLoginAPI(Resource):
     def post(self):
@@ -29,13 +42,31 @@ class UserLoginAPI(Resource):
         args = parser.parse_args()
 
         user = User.query.filter_by(username=args['username']).first()
-        if user and check_password_hash(user.password, args['password']):
+        try:
+            authenticated = user is not None and password_hasher.verify(user.password, args['password'])
+            if authenticated and password_hasher.needs_rehash(user.password):
+                # Upgrade hashes made with older parameters while we know the plaintext
+                user.password = password_hasher.hash(args['password'])
+                db.session.commit()
+        except HasherBusyError:
+            db.session.rollback()
+            return {'error': 'Login is busy, please retry shortly'}, 503, {'Retry-After': '1'}
+
+        if authenticated:
             return jsonify({
                 'message': 'User  logged in successfully',
-                'user': {'id': user.id, 'username': user.username, 'role': user.role}
+                'user': {'id': user.id, 'username': user.username, 'role': user.role},
+                **token_service.issue(user)
             })
         return jsonify({'error': 'Invalid username or password'}), 401
 
+class UserLogoutAPI(Resource):
+    method_decorators = [auth_required]
+
+    def post(self):
+        token_service.revoke(g.auth)
+        return jsonify({'message': 'User logged out successfully'})
+
 class UserSignupAPI(Resource):
     def post(self):
         parser = reqparse.RequestParser()
@@ -44,22 +75,48 @@ class UserSignupAPI(Resource):
         parser.add_argument('password', type=str, required=True)
         args = parser.parse_args()
 
-        if User.query.filter_by(username=args['username']).first():
-            return jsonify({'error': 'Username already exists'}), 400
+        try:
+            password_hash = password_hasher.hash(args['password'])
+        except HasherBusyError:
+            return {'error': 'Signup is busy, please retry shortly'}, 503, {'Retry-After': '1'}
 
         user = User(
             username=args['username'],
             email=args['email'],
-            password=generate_password_hash(args['password']),
+            password=password_hash,
             role='user'
         )
         db.session.add(user)
-        db.session.commit()
+
+        # One INSERT ... RETURNING id; the unique constraints decide conflicts
+        try:
+            db.session.flush()
+            created = {'id': user.id, 'username': user.username, 'role': user.role}
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            return {'error': self._conflict_message(e)}, 400
+
         return jsonify({
             'message': 'User  created successfully',
-            'user': {'id': user.id, 'username': user.username, 'role': user.role}
+            'user': created
         })
 
+    def _conflict_message(self, error):
+        """Map a unique constraint violation to the field that collided"""
+        diag = getattr(error.orig, 'diag', None)
+        detail = ' '.join(filter(None, [
+            getattr(diag, 'constraint_name', None),
+            getattr(diag, 'message_detail', None),
+            str(error.orig)
+        ])).lower()
+
+        if 'email' in detail:
+            return 'Email already exists'
+        if 'username' in detail:
+            return 'Username already exists'
+        return 'User already exists'
+
 class ProductAPI(Resource):
     def get(self, category_id=None):
         if category_id is None:
@@ -70,12 +127,13 @@ class ProductAPI(Resource):
                 return jsonify({'error': 'Category not found'}), 404
             products = category.products
 
+        stock_levels = inventory_ledger.stock_levels(products)
         output = [{
             'id': product.id,
             'name': product.name,
             'description': product.description,
             'price': product.price,
-            'stock': product.stock,
+            'stock': stock_levels[product.id],
             'image_url': product.image_url
         } for product in products]
 
@@ -135,7 +193,16 @@ class ProductAPI(Resource):
         if args['price'] is not None:
             product.price = args['price']
         if args['stock'] is not None:
-            product.stock = args['stock']
+            # Record the correction in the ledger rather than overwriting the row
+            if stock_shards.shard_counts(product.id):
+                delta = stock_shards.set_total(product.id, args['stock'])
+                if delta:
+                    inventory_ledger.record_movement(product.id, delta, 'adjustment', applied_to_shards=True)
+            else:
+                product = inventory_ledger.lock_product(product.id)
+                delta = args['stock'] - inventory_ledger.available_stock(product)
+                if delta:
+                    inventory_ledger.record_movement(product.id, delta, 'adjustment')
         if args['image_url'] is not None:
             product.image_url = args['image_url']
         if args['category_id'] is not None:
@@ -149,8 +216,13 @@ class ProductAPI(Resource):
         if not product:
             return jsonify({'error': 'Product not found'}), 404
 
-        db.session.delete(product)
-        db.session.commit()
+        # Stock ledger, snapshot and shard rows cascade; carts still holding the product block the delete
+        try:
+            db.session.delete(product)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return {'error': 'Product is still referenced (e.g. by a cart) and cannot be deleted'}, 409
         return jsonify({'message': 'Product deleted successfully'})
 
 class StockReductionAPI(Resource):
@@ -163,15 +235,100 @@ class StockReductionAPI(Resource):
         if not product:
             return jsonify({'error': 'Product not found'}), 404
 
-        if product.stock < args['quantity']:
+        shard_counts = stock_shards.shard_counts(product.id)
+        if shard_counts:
+            # Hot product: only one shard row is locked per sale
+            if not stock_shards.decrement(product.id, args['quantity'], shard_counts):
+                db.session.rollback()
+                return jsonify({'error': 'Not enough stock available'}), 400
+
+            inventory_ledger.record_movement(product.id, -args['quantity'], 'sale', applied_to_shards=True)
+            db.session.commit()
+            return jsonify({
+                'message': 'Stock reduced successfully',
+                'product_id': product.id,
+                'remaining_stock': max(sum(shard_counts.values()) - args['quantity'], 0)
+            })
+
+        # Check and insert under the product row lock, or two concurrent sales could both pass the check
+        product = inventory_ledger.lock_product(product.id)
+        available = inventory_ledger.available_stock(product)
+        if available < args['quantity']:
+            db.session.rollback()
             return jsonify({'error': 'Not enough stock available'}), 400
 
-        product.stock -= args['quantity']
+        # Append-only insert; products.stock is updated later by compaction
+        inventory_ledger.record_movement(product.id, -args['quantity'], 'sale')
         db.session.commit()
         return jsonify({
             'message': 'Stock reduced successfully',
             'product_id': product.id,
-            'remaining_stock': product.stock
+            'remaining_stock': available - args['quantity']
+        })
+
+class StockShardAPI(Resource):
+    def get(self, product_id):
+        product = Product.query.get(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        counts = stock_shards.shard_counts(product_id)
+        return jsonify({
+            'product_id': product.id,
+            'sharded': bool(counts),
+            'shards': [{'shard_index': i, 'count': c} for i, c in sorted(counts.items())],
+            'stock': sum(counts.values()) if counts else inventory_ledger.available_stock(product)
+        })
+
+    def post(self, product_id):
+        parser = reqparse.RequestParser()
+        parser.add_argument('shards', type=int, required=True)
+        args = parser.parse_args()
+
+        product = Product.query.get(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        if stock_shards.shard_counts(product_id):
+            stock_shards.disable(product)
+            db.session.flush()
+
+        try:
+            result = stock_shards.enable(product, args['shards'])
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+
+        db.session.commit()
+        return jsonify({'message': 'Stock sharding enabled', **result})
+
+    def delete(self, product_id):
+        product = Product.query.get(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        result = stock_shards.disable(product)
+        db.session.commit()
+        return jsonify({'message': 'Stock sharding disabled', **result})
+
+class StockMovementAPI(Resource):
+    def get(self, product_id):
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=int, default=50, location='args')
+        args = parser.parse_args()
+
+        product = Product.query.get(product_id)
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+
+        movements = StockMovement.query.filter_by(product_id=product_id).order_by(
+            StockMovement.id.desc()
+        ).limit(args['limit']).all()
+
+        return jsonify({
+            'product_id': product.id,
+            'stock': inventory_ledger.available_stock(product),
+            'movements': [m.to_dict() for m in movements]
         })
 
 class CategoryAPI(Resource):
@@ -377,6 +534,7 @@ class ProductSearchAPI(Resource):
             
             # Format output
             output = []
+            stock_levels = inventory_ledger.stock_levels(item['product'] for item in matching_products)
             for item in matching_products:
                 product = item['product']
                 
@@ -385,7 +543,7 @@ class ProductSearchAPI(Resource):
                     'name': product.name,
                     'description': product.description,
                     'price': product.price,
-                    'stock': product.stock,
+                    'stock': stock_levels[product.id],
                     'image_url': product.image_url,
                     'category_id': product.category_id,
                     'relevance_score': item['score'],
@@ -408,9 +566,11 @@ class ProductSearchAPI(Resource):
 # Import AI routes
 from routes.ai_routes import (
     AIProductDescriptionAPI, 
+    AIProductDescriptionStreamAPI,
     AIProductMetaTagsAPI, 
     AICategoryMetaTagsAPI, 
     AIBatchGenerationAPI, 
+    AIJobStatusAPI,
     AIAnalyticsAPI
 )
 
@@ -420,12 +580,14 @@ from routes.seo_routes import (
     SEOCategoryPageAPI,
     SEOHomepageAPI,
     DynamicSitemapAPI,
-    RobotsTxtAPI
+    RobotsTxtAPI,
+    SEOEventAPI
 )
 
 # Import Admin AI routes
 from routes.admin_ai_routes import (
     AdminProductOptimizationAPI,
+    AdminProductOptimizationStreamAPI,
     AdminProductPatchAPI,
     AdminPatchStatusAPI,
     AdminBatchOptimizationAPI,
@@ -433,19 +595,47 @@ from routes.admin_ai_routes import (
     AdminSEOPerformanceAPI
 )
 
+# Import Cart routes
+from routes.cart_routes import (
+    CartAPI,
+    CartItemsAPI,
+    CartItemAPI
+)
+
+from services.cart_store import redis_cart_store, cart_writer
+if redis_cart_store.is_enabled():
+    cart_writer.init_app(app)
+
+from services.groq_ai_service import groq_service
+groq_service.usage_sink.init_app(app)
+
+from services.counter_buffer import ai_content_counters, seo_counters
+ai_content_counters.init_app(app)
+seo_counters.init_app(app)
+
 # Original API routes
 api.add_resource(CategoryAPI, '/categories', '/categories/<int:category_id>')
 api.add_resource(UserLoginAPI, '/login')
 api.add_resource(UserSignupAPI, '/signup')
+api.add_resource(UserLogoutAPI, '/logout')
 api.add_resource(ProductAPI, '/products', '/products/category/<int:category_id>', '/products/<int:product_id>')
 api.add_resource(ProductSearchAPI, '/products/search')
 api.add_resource(StockReductionAPI, '/products/<int:product_id>/reduce_stock')
+api.add_resource(StockMovementAPI, '/products/<int:product_id>/stock-movements')
+api.add_resource(StockShardAPI, '/products/<int:product_id>/stock-shards')
+
+# Server-side cart routes
+api.add_resource(CartAPI, '/users/<int:user_id>/cart')
+api.add_resource(CartItemsAPI, '/users/<int:user_id>/cart/items')
+api.add_resource(CartItemAPI, '/users/<int:user_id>/cart/items/<int:product_id>')
 
 # AI-powered API routes
 api.add_resource(AIProductDescriptionAPI, '/ai/products/<int:product_id>/description')
+api.add_resource(AIProductDescriptionStreamAPI, '/ai/products/<int:product_id>/description/stream')
 api.add_resource(AIProductMetaTagsAPI, '/ai/products/<int:product_id>/meta-tags')
 api.add_resource(AICategoryMetaTagsAPI, '/ai/categories/<int:category_id>/meta-tags')
 api.add_resource(AIBatchGenerationAPI, '/ai/batch-generate')
+api.add_resource(AIJobStatusAPI, '/ai/jobs/<int:job_id>')
 api.add_resource(AIAnalyticsAPI, '/ai/analytics')
 
 # SEO server-side rendering routes (for crawlers)
@@ -454,15 +644,23 @@ api.add_resource(SEOCategoryPageAPI, '/seo/categories/<int:category_id>')
 api.add_resource(SEOHomepageAPI, '/seo/homepage')
 api.add_resource(DynamicSitemapAPI, '/sitemap.xml')
 api.add_resource(RobotsTxtAPI, '/robots.txt')
+api.add_resource(SEOEventAPI, '/seo/events')
 
 # Admin AI routes (for admin dashboard control)
 api.add_resource(AdminProductOptimizationAPI, '/admin/ai/products/<int:product_id>/optimize')
+api.add_resource(AdminProductOptimizationStreamAPI, '/admin/ai/products/<int:product_id>/optimize/stream')
 api.add_resource(AdminProductPatchAPI, '/admin/ai/products/<int:product_id>/patch')
 api.add_resource(AdminPatchStatusAPI, '/admin/ai/patch-status')
 api.add_resource(AdminBatchOptimizationAPI, '/admin/ai/batch-optimize')
 api.add_resource(AdminAIAnalyticsAPI, '/admin/ai/analytics')
 api.add_resource(AdminSEOPerformanceAPI, '/admin/ai/seo-performance')
 
+@app.cli.command('compact-stock')
+def compact_stock():
+    """Fold pending stock movements into products and hourly snapshots"""
+    result = inventory_ledger.compact_all()
+    print(f"Compacted {result['compacted_movements']} movements for {result['products_updated']} products")
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5555))
     app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Groq Stand-in - Local OpenAI/Groq-compatible chat completions server for load tests and CI
+Usage: python groq_standin.py [--port 8090] [--latency-ms 400] [--error-rate 0.02] ...
+Point the app at it with GROQ_BASE_URL=http://localhost:8090 (any GROQ_API_KEY value works).
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from flask import Flask, Response, jsonify, request
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StandinBehaviour:
+    """Latency, failure and rate limit settings, with a seeded RNG so runs are reproducible"""
+
+    def __init__(self, args):
+        self.args = args
+        self.canned = self._load_canned(args.canned)
+        self._random = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self._recent = deque()  # request timestamps in the last minute, for --rpm
+        # --model-latency "llama-3.3-70b-versatile=1800,..." overrides the median per model
+        self.model_latency = {
+            name.strip(): float(ms) for name, ms in
+            (part.split('=') for part in (args.model_latency or '').split(',') if '=' in part)
+        }
+
+    def _load_canned(self, path):
+        """[{"match": "substring of the prompt", "content": "text or JSON value"}, ...]"""
+        if not path:
+            return []
+        with open(path) as f:
+            return json.load(f)
+
+    def random(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def latency(self, model: str = '') -> float:
+        """Seconds until the response (or first token): lognormal around the median, capped at the max"""
+        median = self.model_latency.get(model, self.args.latency_ms)
+        with self._lock:
+            sample = median * math.exp(self._random.gauss(0, self.args.latency_sigma))
+        return min(sample, self.args.max_latency_ms) / 1000
+
+    def rate_limited(self) -> bool:
+        """True if this request exceeds --rpm, or is randomly rejected by --rate-limit-rate"""
+        if self.random() < self.args.rate_limit_rate:
+            return True
+        if not self.args.rpm:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.args.rpm:
+                return True
+            self._recent.append(now)
+        return False
+
+    def content_for(self, prompt: str) -> str:
+        """A canned answer in the shape each of the app's prompts asks for"""
+        for entry in self.canned:
+            if entry['match'] in prompt:
+                content = entry['content']
+                return content if isinstance(content, str) else json.dumps(content)
+
+        name = (re.search(r"(?:Product|Category) Name: (.*)", prompt) or re.search(r"- Name: (.*)", prompt))
+        name = name.group(1).strip() if name else 'Product'
+        ids = re.findall(r"- id: (\S+) \|", prompt)
+        if ids:
+            return json.dumps([
+                {'id': int(i) if i.isdigit() else i, 'title': f"Product {i} | Myjamii Store",
+                 'description': f"Shop product {i} at Myjamii Store with fast delivery and great prices.",
+                 'keywords': f"product {i}, buy online, myjamii store, kenya, best price"}
+                for i in ids
+            ])
+        if 'enhanced_description' in prompt:
+            return json.dumps({
+                'enhanced_description': f"{name} built for everyday use, with the details buyers ask about.",
+                'meta_title': f"{name} | Myjamii Store",
+                'meta_description': f"Buy {name} at Myjamii Store. Compare prices, read the details and order online today.",
+                'keywords': f"{name.lower()}, buy {name.lower()}, {name.lower()} price, myjamii store",
+                'unique_selling_points': ['Clear specifications', 'Competitive price', 'Fast delivery'],
+                'optimization_reasoning': 'Stand-in response'
+            })
+        if 'JSON' in prompt:
+            return json.dumps({
+                'title': f"{name} | Myjamii Store",
+                'description': f"Shop {name} at Myjamii Store with fast delivery and great prices.",
+                'keywords': f"{name.lower()}, buy online, myjamii store"
+            })
+        return (f"{name} brings dependable quality to your everyday routine. Designed with care and priced "
+                f"fairly, it is a practical choice you can count on. Order from Myjamii Store today.")
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_app(behaviour: StandinBehaviour) -> Flask:
+    app = Flask(__name__)
+    args = behaviour.args
+
+    def error(status: int, message: str, error_type: str, headers=None):
+        response = jsonify({'error': {'message': message, 'type': error_type}})
+        response.status_code = status
+        response.headers.update(headers or {})
+        return response
+
+    @app.post('/openai/v1/chat/completions')
+    def chat_completions():
+        body = request.get_json(force=True)
+        prompt = body['messages'][-1]['content']
+        model = body.get('model', 'llama-3.1-8b-instant')
+
+        if behaviour.rate_limited():
+            return error(429, 'Rate limit reached (stand-in)', 'rate_limit_exceeded',
+                         {'retry-after': str(args.retry_after)})
+        if behaviour.random() < args.error_rate:
+            time.sleep(behaviour.latency(model) / 2)
+            return error(500, 'Internal server error (stand-in)', 'internal_server_error')
+
+        content = behaviour.content_for(prompt)
+        max_tokens = body.get('max_tokens') or 8192
+        finish_reason = 'stop'
+        if _tokens(content) > max_tokens:
+            content, finish_reason = content[:max_tokens * 4], 'length'
+        usage = {'prompt_tokens': _tokens(prompt), 'completion_tokens': _tokens(content),
+                 'total_tokens': _tokens(prompt) + _tokens(content)}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get('stream'):
+            time.sleep(behaviour.latency(model) + usage['completion_tokens'] / args.tokens_per_second)
+            return jsonify({
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': finish_reason, 'logprobs': None}],
+                'usage': usage
+            })
+
+        def chunk(delta, finish=None, extra=None):
+            data = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish, 'logprobs': None}],
+                    **(extra or {})}
+            return f"data: {json.dumps(data)}\n\n"
+
+        def events():
+            time.sleep(behaviour.latency(model))
+            yield chunk({'role': 'assistant', 'content': ''})
+            pieces = re.findall(r"\S+\s*", content)
+            for piece in pieces:
+                time.sleep(_tokens(piece) / args.tokens_per_second)
+                yield chunk({'content': piece})
+            yield chunk({}, finish_reason, {'x_groq': {'id': completion_id, 'usage': usage}})
+            yield "data: [DONE]\n\n"
+
+        return Response(events(), mimetype='text/event-stream')
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=400, help='median time to response / first token')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='lognormal spread; 0 for a fixed latency')
+    parser.add_argument('--model-latency', help="per-model median latency, e.g. 'llama-3.3-70b-versatile=1800'")
+    parser.add_argument('--max-latency-ms', type=float, default=30000)
+    parser.add_argument('--tokens-per-second', type=float, default=800, help='generation speed after the first token')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests answered with a 429')
+    parser.add_argument('--rpm', type=int, default=0, help='requests per minute before 429s (0: unlimited)')
+    parser.add_argument('--retry-after', type=int, default=2, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--canned', help='JSON file of {"match", "content"} responses checked before the built-ins')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    logger.info(f"Groq stand-in on http://{args.host}:{args.port} (median latency {args.latency_ms}ms, "
+                f"errors {args.error_rate:.0%}, 429s {args.rate_limit_rate:.0%}, rpm {args.rpm or 'unlimited'})")
+    create_app(StandinBehaviour(args)).run(host=args.host, port=args.port, threaded=True)
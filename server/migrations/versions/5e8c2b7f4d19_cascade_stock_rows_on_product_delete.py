@@ -0,0 +1,33 @@
+"""Cascade stock ledger, snapshot and shard rows on product delete
+
+Revision ID: 5e8c2b7f4d19
+Revises: a91d4e6f2b73
+Create Date: 2026-10-19 18:22:09.640513
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8c2b7f4d19'
+down_revision = 'a91d4e6f2b73'
+branch_labels = None
+depends_on = None
+
+# The product_id foreign keys were created unnamed, so they carry PostgreSQL's default names
+TABLES = ('stock_movements', 'stock_snapshots', 'stock_shards')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(f'{table}_product_id_fkey', type_='foreignkey')
+            batch_op.create_foreign_key(f'{table}_product_id_fkey', 'products', ['product_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(f'{table}_product_id_fkey', type_='foreignkey')
+            batch_op.create_foreign_key(f'{table}_product_id_fkey', 'products', ['product_id'], ['id'])
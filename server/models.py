@@ -37,7 +37,7 @@ class Cart(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  
-    items = db.relationship('CartItem', backref='cart', lazy=True)
+    items = db.relationship('CartItem', backref='cart', lazy='selectin')
 
     def __repr__(self): 
         return f"<Cart {self.id} for User {self.user_id}>"
@@ -50,10 +50,10 @@ class CartItem(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
 
-    product = db.relationship('Product')
+    product = db.relationship('Product', lazy='joined')
 
     def __repr__(self):  
-        return f"<CartItem {self.product.name} (x{self.quantity})>"
+        return f"<CartItem product_id={self.product_id} (x{self.quantity})>"
 
 class Category(db.Model):
     __tablename__ = 'categories'  
@@ -76,6 +76,79 @@ class ProductCategory(db.Model):
         return f"<ProductCategory product_id={self.product_id}, category_id={self.category_id}>"
 
 
+class StockMovement(db.Model):
+    """Append-only ledger of stock changes, folded into products.stock by compaction"""
+    __tablename__ = 'stock_movements'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
+    quantity_delta = db.Column(db.Integer, nullable=False)   # negative for sales, positive for restocks
+    reason = db.Column(db.String(50), nullable=False)        # 'sale', 'adjustment', 'restock'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    compacted_at = db.Column(db.DateTime, nullable=True, index=True)  # null until folded into the product row
+    applied_to_shards = db.Column(db.Boolean, default=False, nullable=False)  # already applied to stock_shards, only snapshotted
+
+    # Deleting a product deletes its ledger in the database, without loading it
+    product = db.relationship('Product', backref=db.backref('stock_movements', cascade='all, delete-orphan', passive_deletes=True))
+
+    def __repr__(self):
+        return f"<StockMovement product_id={self.product_id} delta={self.quantity_delta} ({self.reason})>"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'quantity_delta': self.quantity_delta,
+            'reason': self.reason,
+            'applied_to_shards': self.applied_to_shards,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'compacted_at': self.compacted_at.isoformat() if self.compacted_at else None
+        }
+
+
+class StockShard(db.Model):
+    """One slice of a hot product's stock; decrements spread across shards to avoid a single row lock"""
+    __tablename__ = 'stock_shards'
+    __table_args__ = (db.UniqueConstraint('product_id', 'shard_index', name='uq_stock_shard_product_index'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    shard_index = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    product = db.relationship('Product', backref=db.backref('stock_shards', cascade='all, delete-orphan', passive_deletes=True))
+
+    def __repr__(self):
+        return f"<StockShard product_id={self.product_id} #{self.shard_index} count={self.count}>"
+
+
+class StockSnapshot(db.Model):
+    """Hourly roll-up of compacted stock movements per product"""
+    __tablename__ = 'stock_snapshots'
+    __table_args__ = (db.UniqueConstraint('product_id', 'hour', name='uq_stock_snapshot_product_hour'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)            # start of the hour bucket (UTC)
+    net_change = db.Column(db.Integer, default=0)
+    movement_count = db.Column(db.Integer, default=0)
+    closing_stock = db.Column(db.Integer, nullable=True)     # products.stock after the compaction that last touched this bucket
+
+    product = db.relationship('Product', backref=db.backref('stock_snapshots', cascade='all, delete-orphan', passive_deletes=True))
+
+    def __repr__(self):
+        return f"<StockSnapshot product_id={self.product_id} hour={self.hour}>"
+
+    def to_dict(self):
+        return {
+            'product_id': self.product_id,
+            'hour': self.hour.isoformat() if self.hour else None,
+            'net_change': self.net_change,
+            'movement_count': self.movement_count,
+            'closing_stock': self.closing_stock
+        }
+
+
 # AI-related models for content generation and analytics
 
 class AIGeneratedContent(db.Model):
@@ -88,11 +161,12 @@ class AIGeneratedContent(db.Model):
     entity_id = db.Column(db.Integer, nullable=True)         # product_id, category_id, etc.
     original_content = db.Column(db.Text)
     ai_content = db.Column(db.Text, nullable=False)
-    model_used = db.Column(db.String(50), default='mixtral-8x7b-32768')
+    model_used = db.Column(db.String(50))
     tokens_used = db.Column(db.Integer, default=0)
     generation_time_ms = db.Column(db.Integer, default=0)
     quality_score = db.Column(db.Float, default=0.0)         # Performance metric
     usage_count = db.Column(db.Integer, default=0)           # Track how often accessed
+    source_hash = db.Column(db.String(64))                   # hash of the product fields it was generated from
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -134,6 +208,7 @@ class SEOMetadata(db.Model):
     click_through_rate = db.Column(db.Float, default=0.0)
     impressions = db.Column(db.Integer, default=0)
     clicks = db.Column(db.Integer, default=0)
+    source_hash = db.Column(db.String(64))                   # hash of the product fields AI meta tags came from
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -175,7 +250,7 @@ class AIUsageAnalytics(db.Model):
     success = db.Column(db.Boolean, default=True)
     error_message = db.Column(db.Text)
     cost_cents = db.Column(db.Float, default=0.0)            # Track API costs in cents
-    model_used = db.Column(db.String(50), default='mixtral-8x7b-32768')
+    model_used = db.Column(db.String(50))
     user_ip = db.Column(db.String(45))                       # For tracking (optional)
     user_agent = db.Column(db.String(500))                   # For analytics
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -220,4 +295,51 @@ class AIPerformanceMetrics(db.Model):
     ai_content = db.relationship('AIGeneratedContent', backref='performance_metrics')
     
     def __repr__(self):
-        return f"<AIPerformanceMetrics {self.metric_type}: {self.metric_value}>"
\ No newline at end of file
+        return f"<AIPerformanceMetrics {self.metric_type}: {self.metric_value}>"
+
+class AIJob(db.Model):
+    """Durable background job for long-running AI batches, claimed by worker processes"""
+    __tablename__ = 'ai_jobs'
+    __table_args__ = (db.Index('ix_ai_jobs_status_run_after', 'status', 'run_after'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)      # 'batch_optimize', 'batch_generate', 'refresh_content'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'succeeded', 'failed'
+    payload = db.Column(db.JSON)                             # handler arguments
+    progress_total = db.Column(db.Integer, default=0)
+    progress_done = db.Column(db.Integer, default=0)
+    results = db.Column(db.JSON)                             # per-item results, appended as chunks finish
+    summary = db.Column(db.JSON)                             # handler return value once finished
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # not claimable before this time
+    locked_by = db.Column(db.String(100))                    # worker id holding the job
+    locked_at = db.Column(db.DateTime)                       # heartbeat, refreshed on each progress update
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<AIJob {self.id} {self.job_type} ({self.status})>"
+
+    def to_dict(self, include_results=True):
+        data = {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'progress': {
+                'total': self.progress_total or 0,
+                'done': self.progress_done or 0,
+                'percent': round((self.progress_done or 0) / self.progress_total * 100, 1) if self.progress_total else 0.0
+            },
+            'summary': self.summary,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_results:
+            data['results'] = self.results or []
+        return data
@@ -2,12 +2,20 @@
 Admin AI Routes - Intelligent Product Optimization and Analytics
 Admin-only endpoints for AI-powered SEO management
 """
-import asyncio
 from flask import request, jsonify
-from flask_restful import Resource, reqparse
+from flask_restful import Resource, reqparse, inputs
 from models import db, Product, Category, AIGeneratedContent, AIUsageAnalytics, SEOMetadata
 from services.intelligent_ai_service import intelligent_optimizer
+from services.ai_batch_jobs import enqueue_batch_optimize
+from services.groq_ai_service import groq_service
+from services.token_budget import BudgetExceededError
+from services.ai_resilience import CircuitOpenError
+from services.ai_streaming import sse_event, sse_response
+from services.ai_runtime import ai_runtime
+from services.auth_tokens import admin_required
+from services.inventory_ledger import inventory_ledger
 import logging
+import time
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
@@ -15,11 +23,17 @@ logger = logging.getLogger(__name__)
 class AdminProductOptimizationAPI(Resource):
     """Admin endpoint for intelligent product optimization"""
     
+    method_decorators = [admin_required]
+    
     def post(self, product_id):
         """Analyze and optimize a specific product with AI"""
         try:
-            result = asyncio.run(intelligent_optimizer.analyze_and_optimize_product(product_id))
+            result = intelligent_optimizer.analyze_and_optimize_product(product_id)
             return result
+        except BudgetExceededError as e:
+            return e.to_dict(), 429, {'Retry-After': str(e.retry_after)}
+        except CircuitOpenError as e:
+            return e.to_dict(), 503, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             logger.error(f"Product optimization failed: {e}")
             return {'error': 'Optimization failed', 'details': str(e)}, 500
@@ -53,7 +67,7 @@ class AdminProductOptimizationAPI(Resource):
                     'name': product.name,
                     'description': product.description,
                     'price': product.price,
-                    'stock': product.stock
+                    'stock': inventory_ledger.available_stock(product)
                 },
                 'has_optimization': latest_optimization is not None,
                 'optimization': latest_optimization.to_dict() if latest_optimization else None,
@@ -64,17 +78,70 @@ class AdminProductOptimizationAPI(Resource):
             logger.error(f"Failed to get optimization status: {e}")
             return {'error': 'Failed to get status'}, 500
 
+class AdminProductOptimizationStreamAPI(Resource):
+    """Admin endpoint streaming an intelligent product optimization as Server-Sent Events"""
+    
+    method_decorators = [admin_required]
+    
+    def post(self, product_id):
+        """
+        Relay the optimization JSON as 'token' events while it is generated, then save it and send
+        a 'done' event with the same body as the blocking endpoint, or an 'error' event.
+        """
+        product = Product.query.get(product_id)
+        if not product:
+            return {'error': 'Product not found'}, 404
+        if not intelligent_optimizer.client:
+            return {'success': False, 'error': 'AI client not available'}, 503
+        
+        product_context = intelligent_optimizer.load_product_context(product)
+        
+        def events():
+            yield sse_event('start', {'product_id': product_id})
+            try:
+                start_time = time.time()
+                optimization = None
+                for kind, payload in ai_runtime.iterate(intelligent_optimizer.stream_optimization(product_context)):
+                    if kind == 'token':
+                        yield sse_event('token', {'text': payload})
+                    else:
+                        optimization = payload
+                processing_time = int((time.time() - start_time) * 1000)
+                
+                if not optimization:
+                    yield sse_event('error', {'success': False, 'error': 'Failed to generate optimization'})
+                    return
+                
+                intelligent_optimizer.save_optimization_results(product, optimization, processing_time)
+                yield sse_event('done', {
+                    'success': True,
+                    'product_id': product_id,
+                    'original_description': product.description,
+                    'optimization': optimization,
+                    'processing_time_ms': processing_time,
+                    'market_analysis': product_context['market_context']
+                })
+            except (BudgetExceededError, CircuitOpenError) as e:
+                yield sse_event('error', e.to_dict())
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Product optimization streaming failed: {e}")
+                yield sse_event('error', {'error': 'Optimization failed', 'details': str(e)})
+        
+        return sse_response(events())
+
+
 class AdminProductPatchAPI(Resource):
     """Admin endpoint for applying AI optimizations to products"""
     
+    method_decorators = [admin_required]
+    
     def get(self, product_id):
         """Get patch status and preview for a product"""
         try:
-            result = asyncio.run(
-                intelligent_optimizer.patch_product_with_optimization(
-                    product_id, 
-                    apply_changes=False  # Preview only
-                )
+            result = intelligent_optimizer.patch_product_with_optimization(
+                product_id,
+                apply_changes=False  # Preview only
             )
             
             if result.get('success'):
@@ -108,15 +175,13 @@ class AdminProductPatchAPI(Resource):
     def post(self, product_id):
         """Apply AI optimization to product in database"""
         parser = reqparse.RequestParser()
-        parser.add_argument('apply_changes', type=bool, default=False)
+        parser.add_argument('apply_changes', type=inputs.boolean, default=False)
         args = parser.parse_args()
         
         try:
-            result = asyncio.run(
-                intelligent_optimizer.patch_product_with_optimization(
-                    product_id, 
-                    apply_changes=args['apply_changes']
-                )
+            result = intelligent_optimizer.patch_product_with_optimization(
+                product_id,
+                apply_changes=args['apply_changes']
             )
             return result
         except Exception as e:
@@ -126,6 +191,8 @@ class AdminProductPatchAPI(Resource):
 class AdminPatchStatusAPI(Resource):
     """Admin endpoint to check patch status for all products"""
     
+    method_decorators = [admin_required]
+    
     def get(self):
         """Get patch status for all optimized products"""
         try:
@@ -191,36 +258,69 @@ class AdminPatchStatusAPI(Resource):
 class AdminBatchOptimizationAPI(Resource):
     """Admin endpoint for batch product optimization"""
     
+    method_decorators = [admin_required]
+    
     def post(self):
         """Batch optimize multiple products"""
         parser = reqparse.RequestParser()
         parser.add_argument('category_id', type=int, required=False)
         parser.add_argument('limit', type=int, default=10)
         parser.add_argument('product_ids', type=list, location='json', required=False)
+        parser.add_argument('concurrency', type=int, required=False)
+        parser.add_argument('background', type=inputs.boolean, default=False)
         args = parser.parse_args()
         
         try:
-            if args.get('product_ids'):
-                # Optimize specific products
-                results = []
-                for product_id in args['product_ids']:
-                    result = asyncio.run(intelligent_optimizer.analyze_and_optimize_product(product_id))
-                    results.append(result)
-                
+            if args['background']:
+                # Hand the batch to the job worker; poll /ai/jobs/<id> for progress
+                job = enqueue_batch_optimize(
+                    category_id=args.get('category_id'),
+                    limit=args['limit'],
+                    product_ids=args.get('product_ids'),
+                    concurrency=args.get('concurrency')
+                )
                 return {
                     'success': True,
-                    'optimized_count': len([r for r in results if r.get('success')]),
-                    'results': results
-                }
-            else:
-                # Batch optimize by category
-                result = asyncio.run(
-                    intelligent_optimizer.batch_optimize_products(
-                        category_id=args.get('category_id'),
-                        limit=args['limit']
-                    )
+                    'job_id': job.id,
+                    'status': job.status,
+                    'total_products': job.progress_total,
+                    'status_url': f"/ai/jobs/{job.id}"
+                }, 202
+            
+            # Pre-flight the batch against the token budgets; there is no fallback optimization,
+            # so an exhausted budget defers the batch to the job queue or rejects it
+            products = intelligent_optimizer.select_batch_products(
+                args.get('category_id'), args['limit'], args.get('product_ids')
+            )
+            over_budget = groq_service.token_budget.check(
+                'intelligent_optimization', intelligent_optimizer.estimate_batch_tokens(products)
+            )
+            if over_budget and groq_service.token_budget.policy == 'defer':
+                job = enqueue_batch_optimize(
+                    product_ids=[product.id for product in products],
+                    concurrency=args.get('concurrency'),
+                    run_after=datetime.utcnow() + timedelta(seconds=over_budget.retry_after)
                 )
-                return result
+                return {
+                    'success': True,
+                    'deferred': True,
+                    'job_id': job.id,
+                    'status': job.status,
+                    'total_products': job.progress_total,
+                    'run_after': job.run_after.isoformat(),
+                    'status_url': f"/ai/jobs/{job.id}"
+                }, 202
+            if over_budget:
+                return over_budget.to_dict(), 429, {'Retry-After': str(over_budget.retry_after)}
+            
+            # Specific products or a category slice, optimized concurrently and saved in one commit
+            result = intelligent_optimizer.batch_optimize_products(
+                category_id=args.get('category_id'),
+                limit=args['limit'],
+                product_ids=args.get('product_ids'),
+                concurrency=args.get('concurrency')
+            )
+            return result
                 
         except Exception as e:
             logger.error(f"Batch optimization failed: {e}")
@@ -229,6 +329,8 @@ class AdminBatchOptimizationAPI(Resource):
 class AdminAIAnalyticsAPI(Resource):
     """Admin analytics for AI optimization performance"""
     
+    method_decorators = [admin_required]
+    
     def get(self):
         """Get comprehensive AI analytics dashboard data"""
         parser = reqparse.RequestParser()
@@ -334,6 +436,8 @@ class AdminAIAnalyticsAPI(Resource):
 class AdminSEOPerformanceAPI(Resource):
     """Admin SEO performance tracking and crawler analytics"""
     
+    method_decorators = [admin_required]
+    
     def get(self):
         """Get SEO performance metrics and crawler recognition data"""
         try:
@@ -1,15 +1,68 @@
 """
 AI API Routes - Server-side AI content generation endpoints
 """
-import asyncio
 from flask import request, jsonify
-from flask_restful import Resource, reqparse
+from flask_restful import Resource, reqparse, inputs
 from models import db, Product, Category, AIGeneratedContent, AIUsageAnalytics, SEOMetadata
 from services.groq_ai_service import groq_service
+from services.ai_runtime import ai_runtime
+from services.ai_batch_service import ai_batch_generator
+from services.ai_batch_jobs import enqueue_batch_generate
+from services.job_queue import job_queue
+from services.token_budget import BudgetExceededError
+from services.ai_streaming import sse_event, sse_response
+from services.counter_buffer import ai_content_counters
+from services.ai_freshness import content_freshness, source_hash, stored_source_hash
+from services.auth_tokens import admin_required
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _description_product_data(product: Product) -> dict:
+    """Product fields the description prompt is built from"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'category': product.category.name if product.category else 'General'
+    }
+
+def _store_product_description(product: Product, result: dict) -> AIGeneratedContent:
+    """Store a generated description with its usage analytics row and commit"""
+    ai_content = AIGeneratedContent(
+        content_type='product_description',
+        entity_type='product',
+        entity_id=product.id,
+        original_content=product.description,
+        ai_content=result['ai_description'],
+        model_used=result.get('model_used'),
+        tokens_used=result.get('tokens_used', 0),
+        generation_time_ms=result.get('generation_time_ms', 0),
+        usage_count=1,
+        source_hash=source_hash(product)
+    )
+    db.session.add(ai_content)
+    # Usage of the completion itself is recorded by GroqAIService
+    db.session.commit()
+    return ai_content
+
+def _fallback_description_response(product: Product, result: dict) -> dict:
+    """
+    Body for fallback text (AI unavailable, or the budget policy is 'fallback'): it is served
+    but not stored, so the product stays due for a real generation
+    """
+    return {
+        'success': True,
+        'cached': False,
+        'ai_generated': False,
+        'budget_exhausted': result.get('budget_exhausted', False),
+        'content': None,
+        'original_description': product.description,
+        'ai_description': result['ai_description']
+    }
+
 class AIProductDescriptionAPI(Resource):
     """Generate AI-enhanced product descriptions"""
     
@@ -30,67 +83,30 @@ class AIProductDescriptionAPI(Resource):
             ).first()
             
             if existing_content:
-                # Update usage count
-                existing_content.usage_count += 1
-                db.session.commit()
+                # Counted in a buffer that is flushed in batches, not a write per read
+                pending = ai_content_counters.incr(existing_content.id)
+                # Served as is; stale content is regenerated in the background
+                fresh = content_freshness.check('descriptions', product, existing_content)
                 
                 return {
                     'success': True,
                     'cached': True,
-                    'content': existing_content.to_dict(),
+                    'stale': not fresh,
+                    'content': {**existing_content.to_dict(),
+                                'usage_count': (existing_content.usage_count or 0) + pending},
                     'original_description': product.description,
                     'ai_description': existing_content.ai_content
                 }
             
-            # Prepare product data for AI
-            product_data = {
-                'id': product.id,
-                'name': product.name,
-                'description': product.description,
-                'price': product.price,
-                'category': product.category.name if product.category else 'General'
-            }
-            
             # Generate AI content
-            result = asyncio.run(groq_service.generate_product_description(product_data))
+            result = ai_runtime.run(groq_service.generate_product_description(_description_product_data(product)))
             
             if not result:
                 return {'error': 'Failed to generate AI description'}, 500
+            if not result.get('ai_generated'):
+                return _fallback_description_response(product, result)
             
-            # Store in database
-            ai_content = AIGeneratedContent(
-                content_type='product_description',
-                entity_type='product',
-                entity_id=product_id,
-                original_content=product.description,
-                ai_content=result['ai_description'],
-                model_used=result.get('model_used', 'mixtral-8x7b-32768'),
-                tokens_used=result.get('tokens_used', 0),
-                generation_time_ms=result.get('generation_time_ms', 0),
-                usage_count=1
-            )
-            
-            db.session.add(ai_content)
-            
-            # Log analytics
-            analytics = AIUsageAnalytics(
-                endpoint='ai_product_description',
-                request_type='product_description',
-                entity_type='product',
-                entity_id=product_id,
-                tokens_input=result.get('tokens_used', 0) // 2,  # Rough estimate
-                tokens_output=result.get('tokens_used', 0) // 2,
-                tokens_total=result.get('tokens_used', 0),
-                response_time_ms=result.get('generation_time_ms', 0),
-                success=True,
-                cost_cents=result.get('tokens_used', 0) * 0.27 / 1000000 * 100,  # Groq pricing
-                model_used=result.get('model_used', 'mixtral-8x7b-32768'),
-                user_ip=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
-            )
-            
-            db.session.add(analytics)
-            db.session.commit()
+            ai_content = _store_product_description(product, result)
             
             return {
                 'success': True,
@@ -100,29 +116,93 @@ class AIProductDescriptionAPI(Resource):
                 'ai_description': result['ai_description']
             }
             
+        except BudgetExceededError as e:
+            return e.to_dict(), 429, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             logger.error(f"AI description generation failed: {e}")
             
             # Log failed attempt
             try:
-                analytics = AIUsageAnalytics(
+                groq_service.usage_sink.record(
                     endpoint='ai_product_description',
                     request_type='product_description',
                     entity_type='product',
                     entity_id=product_id,
                     success=False,
-                    error_message=str(e),
-                    user_ip=request.remote_addr,
-                    user_agent=request.headers.get('User-Agent', '')
+                    error_message=str(e)
                 )
-                db.session.add(analytics)
-                db.session.commit()
             except Exception as log_error:
                 logger.error(f"Failed to log error: {log_error}")
             
             return {'error': 'Internal server error'}, 500
 
 
+class AIProductDescriptionStreamAPI(Resource):
+    """Stream an AI product description as Server-Sent Events"""
+    
+    def post(self, product_id):
+        """
+        Relay tokens as 'token' events while the description is generated, then send a 'done'
+        event with the same body as the blocking endpoint (its ai_description is authoritative).
+        Failures after the stream has started arrive as an 'error' event.
+        """
+        product = Product.query.get(product_id)
+        if not product:
+            return {'error': 'Product not found'}, 404
+        
+        existing_content = AIGeneratedContent.query.filter_by(
+            content_type='product_description',
+            entity_type='product',
+            entity_id=product_id,
+            is_active=True
+        ).first()
+        product_data = _description_product_data(product)
+        
+        def events():
+            yield sse_event('start', {'product_id': product_id})
+            try:
+                if existing_content:
+                    pending = ai_content_counters.incr(existing_content.id)
+                    fresh = content_freshness.check('descriptions', product, existing_content)
+                    yield sse_event('done', {
+                        'success': True,
+                        'cached': True,
+                        'stale': not fresh,
+                        'content': {**existing_content.to_dict(),
+                                    'usage_count': (existing_content.usage_count or 0) + pending},
+                        'original_description': product.description,
+                        'ai_description': existing_content.ai_content
+                    })
+                    return
+                
+                result = None
+                for kind, payload in ai_runtime.iterate(groq_service.stream_product_description(product_data)):
+                    if kind == 'token':
+                        yield sse_event('token', {'text': payload})
+                    else:
+                        result = payload
+                
+                if not result.get('ai_generated'):
+                    yield sse_event('done', _fallback_description_response(product, result))
+                    return
+                ai_content = _store_product_description(product, result)
+                yield sse_event('done', {
+                    'success': True,
+                    'cached': False,
+                    'content': ai_content.to_dict(),
+                    'original_description': product.description,
+                    'ai_description': result['ai_description']
+                })
+            except BudgetExceededError as e:
+                yield sse_event('error', e.to_dict())
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"AI description streaming failed: {e}")
+                yield sse_event('error', {'error': 'Internal server error'})
+        
+        return sse_response(events())
+
+
 class AIProductMetaTagsAPI(Resource):
     """Generate AI-optimized meta tags for products"""
     
@@ -141,9 +221,11 @@ class AIProductMetaTagsAPI(Resource):
             ).first()
             
             if existing_seo and existing_seo.is_ai_generated:
+                fresh = content_freshness.check('meta_tags', product, existing_seo)
                 return {
                     'success': True,
                     'cached': True,
+                    'stale': not fresh,
                     'seo_data': existing_seo.to_dict()
                 }
             
@@ -157,10 +239,24 @@ class AIProductMetaTagsAPI(Resource):
             }
             
             # Generate AI meta tags
-            result = asyncio.run(groq_service.generate_product_meta_tags(product_data))
+            result = ai_runtime.run(groq_service.generate_product_meta_tags(product_data))
             
             if not result:
                 return {'error': 'Failed to generate meta tags'}, 500
+            if not result.get('ai_generated'):
+                # Fallback tags are served but not stored as AI metadata
+                return {
+                    'success': True,
+                    'cached': False,
+                    'ai_generated': False,
+                    'budget_exhausted': result.get('budget_exhausted', False),
+                    'seo_data': existing_seo.to_dict() if existing_seo else None,
+                    'meta_tags': {
+                        'title': result.get('title', ''),
+                        'description': result.get('description', ''),
+                        'keywords': result.get('keywords', '')
+                    }
+                }
             
             # Store/update SEO metadata
             if existing_seo:
@@ -168,6 +264,7 @@ class AIProductMetaTagsAPI(Resource):
                 existing_seo.meta_description = result.get('description', '')
                 existing_seo.meta_keywords = result.get('keywords', '')
                 existing_seo.is_ai_generated = True
+                existing_seo.source_hash = stored_source_hash(product, result)
                 seo_data = existing_seo
             else:
                 seo_data = SEOMetadata(
@@ -176,26 +273,11 @@ class AIProductMetaTagsAPI(Resource):
                     meta_title=result.get('title', ''),
                     meta_description=result.get('description', ''),
                     meta_keywords=result.get('keywords', ''),
-                    is_ai_generated=True
+                    is_ai_generated=True,
+                    source_hash=stored_source_hash(product, result)
                 )
                 db.session.add(seo_data)
             
-            # Log analytics
-            analytics = AIUsageAnalytics(
-                endpoint='ai_product_meta_tags',
-                request_type='meta_tags',
-                entity_type='product',
-                entity_id=product_id,
-                tokens_total=result.get('tokens_used', 0),
-                response_time_ms=result.get('generation_time_ms', 0),
-                success=True,
-                cost_cents=result.get('tokens_used', 0) * 0.27 / 1000000 * 100,
-                model_used=result.get('model_used', 'mixtral-8x7b-32768'),
-                user_ip=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
-            )
-            
-            db.session.add(analytics)
             db.session.commit()
             
             return {
@@ -209,6 +291,8 @@ class AIProductMetaTagsAPI(Resource):
                 }
             }
             
+        except BudgetExceededError as e:
+            return e.to_dict(), 429, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             logger.error(f"AI meta tags generation failed: {e}")
             return {'error': 'Internal server error'}, 500
@@ -246,10 +330,24 @@ class AICategoryMetaTagsAPI(Resource):
             }
             
             # Generate AI meta tags
-            result = asyncio.run(groq_service.generate_category_meta_tags(category_data))
+            result = ai_runtime.run(groq_service.generate_category_meta_tags(category_data))
             
             if not result:
                 return {'error': 'Failed to generate category meta tags'}, 500
+            if not result.get('ai_generated'):
+                # Fallback tags are served but not stored as AI metadata
+                return {
+                    'success': True,
+                    'cached': False,
+                    'ai_generated': False,
+                    'budget_exhausted': result.get('budget_exhausted', False),
+                    'seo_data': existing_seo.to_dict() if existing_seo else None,
+                    'meta_tags': {
+                        'title': result.get('title', ''),
+                        'description': result.get('description', ''),
+                        'keywords': result.get('keywords', '')
+                    }
+                }
             
             # Store/update SEO metadata
             if existing_seo:
@@ -269,21 +367,6 @@ class AICategoryMetaTagsAPI(Resource):
                 )
                 db.session.add(seo_data)
             
-            # Log analytics
-            analytics = AIUsageAnalytics(
-                endpoint='ai_category_meta_tags',
-                request_type='meta_tags',
-                entity_type='category',
-                entity_id=category_id,
-                tokens_total=result.get('tokens_used', 0),
-                response_time_ms=result.get('generation_time_ms', 0),
-                success=True,
-                cost_cents=result.get('tokens_used', 0) * 0.27 / 1000000 * 100,
-                model_used=result.get('model_used', 'mixtral-8x7b-32768'),
-                user_ip=request.remote_addr
-            )
-            
-            db.session.add(analytics)
             db.session.commit()
             
             return {
@@ -297,6 +380,8 @@ class AICategoryMetaTagsAPI(Resource):
                 }
             }
             
+        except BudgetExceededError as e:
+            return e.to_dict(), 429, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             logger.error(f"AI category meta tags generation failed: {e}")
             return {'error': 'Internal server error'}, 500
@@ -306,100 +391,110 @@ class AIBatchGenerationAPI(Resource):
     """Batch generate AI content for multiple entities"""
     
     def post(self):
-        """Batch generate AI content"""
+        """Batch generate AI content with bounded concurrency and a single commit, or queue it as a job"""
         parser = reqparse.RequestParser()
         parser.add_argument('entity_type', type=str, required=True, choices=['products', 'categories'])
         parser.add_argument('content_type', type=str, required=True, choices=['descriptions', 'meta_tags'])
         parser.add_argument('entity_ids', type=list, location='json', required=False)
         parser.add_argument('limit', type=int, default=10)
+        parser.add_argument('concurrency', type=int, default=ai_batch_generator.default_concurrency)
+        parser.add_argument('item_timeout', type=float, default=ai_batch_generator.default_item_timeout)
+        parser.add_argument('background', type=inputs.boolean, default=False)
         args = parser.parse_args()
+        args['concurrency'] = ai_batch_generator.clamp_concurrency(args['concurrency'])
         
         try:
+            if args['background'] and args['entity_type'] == 'products':
+                job = enqueue_batch_generate(
+                    args['content_type'],
+                    entity_ids=args['entity_ids'],
+                    limit=args['limit'],
+                    concurrency=args['concurrency'],
+                    item_timeout=args['item_timeout']
+                )
+                return {
+                    'success': True,
+                    'job_id': job.id,
+                    'status': job.status,
+                    'total_items': job.progress_total,
+                    'status_url': f"/ai/jobs/{job.id}"
+                }, 202
+            
             results = []
             
             if args['entity_type'] == 'products':
-                if args['entity_ids']:
-                    products = Product.query.filter(Product.id.in_(args['entity_ids'])).all()
-                else:
-                    products = Product.query.limit(args['limit']).all()
+                products = ai_batch_generator.load_products(args['entity_ids'], args['limit'])
                 
-                for product in products:
-                    if args['content_type'] == 'descriptions':
-                        # Generate description
-                        result = asyncio.run(self._generate_product_description(product))
-                        results.append(result)
-                    elif args['content_type'] == 'meta_tags':
-                        # Generate meta tags
-                        result = asyncio.run(self._generate_product_meta(product))
-                        results.append(result)
+                # Pre-flight the whole batch against the token budgets before any call goes out
+                over_budget = groq_service.token_budget.check(
+                    *ai_batch_generator.estimate_tokens(products, args['content_type'])
+                )
+                if over_budget and groq_service.token_budget.policy == 'defer':
+                    job = enqueue_batch_generate(
+                        args['content_type'],
+                        entity_ids=[product.id for product in products],
+                        concurrency=args['concurrency'],
+                        item_timeout=args['item_timeout'],
+                        run_after=datetime.utcnow() + timedelta(seconds=over_budget.retry_after)
+                    )
+                    return {
+                        'success': True,
+                        'deferred': True,
+                        'job_id': job.id,
+                        'status': job.status,
+                        'total_items': job.progress_total,
+                        'run_after': job.run_after.isoformat(),
+                        'status_url': f"/ai/jobs/{job.id}"
+                    }, 202
+                if over_budget and groq_service.token_budget.policy == 'reject':
+                    raise over_budget
+                
+                results = ai_batch_generator.generate_for_products(
+                    products,
+                    args['content_type'],
+                    concurrency=args['concurrency'],
+                    item_timeout=args['item_timeout']
+                )
             
             db.session.commit()
             
+            total_tokens = sum(r.get('tokens_used', 0) for r in results)
+            failures = [r for r in results if not r['success']]
             return {
                 'success': True,
                 'batch_size': len(results),
+                'succeeded': len(results) - len(failures),
+                'failed': len(failures),
                 'results': results,
+                'failures': failures,
                 'total_cost_cents': sum(r.get('cost_cents', 0) for r in results),
-                'total_tokens': sum(r.get('tokens_used', 0) for r in results)
+                'total_tokens': total_tokens
             }
             
+        except BudgetExceededError as e:
+            db.session.rollback()
+            return e.to_dict(), 429, {'Retry-After': str(e.retry_after)}
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Batch AI generation failed: {e}")
             return {'error': 'Batch generation failed'}, 500
+
+
+class AIJobStatusAPI(Resource):
+    """Progress and per-item results of a background AI job"""
     
-    async def _generate_product_description(self, product):
-        """Helper method for batch description generation"""
-        product_data = {
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'price': product.price,
-            'category': product.category.name if product.category else 'General'
-        }
-        
-        result = await groq_service.generate_product_description(product_data)
-        
-        if result:
-            # Store in database
-            ai_content = AIGeneratedContent(
-                content_type='product_description',
-                entity_type='product',
-                entity_id=product.id,
-                original_content=product.description,
-                ai_content=result['ai_description'],
-                model_used=result.get('model_used', 'mixtral-8x7b-32768'),
-                tokens_used=result.get('tokens_used', 0),
-                generation_time_ms=result.get('generation_time_ms', 0)
-            )
-            db.session.add(ai_content)
-        
-        return result
+    method_decorators = [admin_required]
     
-    async def _generate_product_meta(self, product):
-        """Helper method for batch meta generation"""
-        product_data = {
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'price': product.price,
-            'category': product.category.name if product.category else 'General'
-        }
-        
-        result = await groq_service.generate_product_meta_tags(product_data)
+    def get(self, job_id):
+        parser = reqparse.RequestParser()
+        parser.add_argument('include_results', type=int, default=1, location='args')
+        args = parser.parse_args()
         
-        if result:
-            # Store in database
-            seo_data = SEOMetadata(
-                page_type='product',
-                entity_id=product.id,
-                meta_title=result.get('title', ''),
-                meta_description=result.get('description', ''),
-                meta_keywords=result.get('keywords', ''),
-                is_ai_generated=True
-            )
-            db.session.add(seo_data)
+        job = job_queue.get(job_id)
+        if job is None:
+            return {'error': 'Job not found'}, 404
         
-        return result
+        return {'success': True, 'job': job.to_dict(include_results=bool(args['include_results']))}
 
 
 class AIAnalyticsAPI(Resource):
@@ -461,6 +556,7 @@ class AIAnalyticsAPI(Resource):
                     'ai_content_generated': ai_content_count
                 },
                 'endpoint_stats': endpoint_stats,
+                'cache_stats': groq_service.cache.stats(),
                 'daily_usage': self._get_daily_usage_stats(start_date)
             }
             
@@ -0,0 +1,94 @@
+"""
+Cart API Routes - Server-persisted shopping carts for web and mobile clients
+"""
+from flask_restful import Resource, reqparse
+from models import db
+from services.cart_service import CartNotFoundError
+from services.cart_store import active_cart_store
+from services.auth_tokens import owner_required
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CartAPI(Resource):
+    """Read or clear a user's cart"""
+
+    method_decorators = [owner_required]
+
+    def get(self, user_id):
+        """Get the cart with items, products and totals"""
+        try:
+            return {'success': True, 'cart': active_cart_store().get_cart(user_id)}
+        except Exception as e:
+            logger.error(f"Cart retrieval failed: {e}")
+            return {'error': 'Failed to retrieve cart'}, 500
+
+    def delete(self, user_id):
+        """Remove all items from the cart"""
+        try:
+            return {'success': True, 'cart': active_cart_store().clear(user_id)}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Cart clear failed: {e}")
+            return {'error': 'Failed to clear cart'}, 500
+
+
+class CartItemsAPI(Resource):
+    """Add products to a user's cart"""
+
+    method_decorators = [owner_required]
+
+    def post(self, user_id):
+        """Add a product, merging with an existing line"""
+        parser = reqparse.RequestParser()
+        parser.add_argument('product_id', type=int, required=True)
+        parser.add_argument('quantity', type=int, default=1)
+        args = parser.parse_args()
+
+        if args['quantity'] < 1:
+            return {'error': 'Quantity must be at least 1'}, 400
+
+        try:
+            cart = active_cart_store().add_item(user_id, args['product_id'], args['quantity'])
+            return {'success': True, 'cart': cart}, 201
+        except CartNotFoundError as e:
+            db.session.rollback()
+            return {'error': str(e)}, 404
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Add to cart failed: {e}")
+            return {'error': 'Failed to add item to cart'}, 500
+
+
+class CartItemAPI(Resource):
+    """Update or remove a single cart line"""
+
+    method_decorators = [owner_required]
+
+    def put(self, user_id, product_id):
+        """Set the quantity of a line (0 removes it)"""
+        parser = reqparse.RequestParser()
+        parser.add_argument('quantity', type=int, required=True)
+        args = parser.parse_args()
+
+        try:
+            return {'success': True, 'cart': active_cart_store().set_quantity(user_id, product_id, args['quantity'])}
+        except CartNotFoundError as e:
+            db.session.rollback()
+            return {'error': str(e)}, 404
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Cart update failed: {e}")
+            return {'error': 'Failed to update cart'}, 500
+
+    def delete(self, user_id, product_id):
+        """Remove a line from the cart"""
+        try:
+            return {'success': True, 'cart': active_cart_store().remove_item(user_id, product_id)}
+        except CartNotFoundError as e:
+            db.session.rollback()
+            return {'error': str(e)}, 404
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Cart item removal failed: {e}")
+            return {'error': 'Failed to remove item from cart'}, 500
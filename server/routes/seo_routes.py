@@ -7,6 +7,9 @@ from flask import request, render_template_string, jsonify, make_response
 from flask_restful import Resource
 from models import db, Product, Category, SEOMetadata, AIGeneratedContent
 from services.groq_ai_service import groq_service
+from services.counter_buffer import seo_counters
+from services.ai_freshness import content_freshness
+from services.inventory_ledger import inventory_ledger
 import logging
 
 logger = logging.getLogger(__name__)
@@ -120,19 +123,27 @@ class SEOProductPageAPI(Resource):
                 is_active=True
             ).first()
             
+            # Never wait on Groq while rendering: missing or stale AI content is scheduled for
+            # regeneration and this render uses what is stored, or the fallback
+            content_freshness.check('descriptions', product, ai_content)
+            content_freshness.check('meta_tags', product, seo_data if seo_data and seo_data.is_ai_generated else None)
+            
             # Use AI content if available, otherwise fallback
             description = ai_content.ai_content if ai_content else product.description
             title = seo_data.meta_title if seo_data else f"{product.name} | Myjamii Store"
             meta_description = seo_data.meta_description if seo_data else f"Buy {product.name} for ${product.price}. High-quality products at Myjamii Store."
             keywords = seo_data.meta_keywords if seo_data else f"{product.name}, buy online, e-commerce"
             
+            # Sales are ledger movements, so products.stock lags until compaction
+            stock = inventory_ledger.available_stock(product)
+            
             # Prepare product data for structured data
             product_data = {
                 'id': product.id,
                 'name': product.name,
                 'description': description,
                 'price': product.price,
-                'stock': product.stock,
+                'stock': stock,
                 'image_url': product.image_url,
                 'category': product.category.name if product.category else 'General'
             }
@@ -159,7 +170,7 @@ class SEOProductPageAPI(Resource):
     <meta property="og:image" content="{{ product.image_url }}">
     <meta property="product:price:amount" content="{{ product.price }}">
     <meta property="product:price:currency" content="USD">
-    <meta property="product:availability" content="{{ 'in stock' if product.stock > 0 else 'out of stock' }}">
+    <meta property="product:availability" content="{{ 'in stock' if stock > 0 else 'out of stock' }}">
     
     <!-- Twitter Card -->
     <meta name="twitter:card" content="summary_large_image">
@@ -189,7 +200,7 @@ class SEOProductPageAPI(Resource):
             <div class="product-info">
                 <p class="price">${{ product.price }}</p>
                 <p class="category">Category: {{ product.category.name if product.category else 'General' }}</p>
-                <p class="availability">{{ 'In Stock' if product.stock > 0 else 'Out of Stock' }}</p>
+                <p class="availability">{{ 'In Stock' if stock > 0 else 'Out of Stock' }}</p>
             </div>
             
             <div class="description">
@@ -220,6 +231,7 @@ class SEOProductPageAPI(Resource):
                 meta_description=meta_description,
                 keywords=keywords,
                 product=product,
+                stock=stock,
                 description=description,
                 structured_data=json.dumps(structured_data, indent=2),
                 ai_content=ai_content,
@@ -573,4 +585,28 @@ Allow: /
             
         except Exception as e:
             logger.error(f"Robots.txt generation failed: {e}")
-            return {'error': 'Failed to generate robots.txt'}, 500
\ No newline at end of file
+            return {'error': 'Failed to generate robots.txt'}, 500
+
+
+class SEOEventAPI(Resource):
+    """Count impressions and clicks of SEO pages, e.g. from storefront beacons"""
+    
+    EVENT_COLUMNS = {'impression': 'impressions', 'click': 'clicks'}
+    
+    def post(self):
+        """Record one event; counts are buffered and written to SEOMetadata in batches"""
+        data = request.get_json(silent=True) or {}
+        column = self.EVENT_COLUMNS.get(data.get('event'))
+        if column is None:
+            return {'error': "event must be 'impression' or 'click'"}, 400
+        
+        seo_row = db.session.query(SEOMetadata.id).filter_by(
+            page_type=data.get('page_type', 'product'),
+            entity_id=data.get('entity_id'),
+            is_active=True
+        ).first()
+        if not seo_row:
+            return {'error': 'SEO metadata not found'}, 404
+        
+        seo_counters.incr(seo_row.id, column)
+        return {'success': True}, 202
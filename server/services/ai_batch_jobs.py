@@ -0,0 +1,135 @@
+"""
+AI Batch Jobs - Background job handlers for catalog optimization and batch generation
+Item ids are resolved at submit time; handlers work through them in chunks and resume after a retry
+"""
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from models import db, Product, AIJob
+from services.job_queue import job_queue, JobDeferred
+from services.groq_ai_service import groq_service
+from services.ai_batch_service import ai_batch_generator
+from services.intelligent_ai_service import intelligent_optimizer
+from services.ai_freshness import content_freshness, REFRESH_CONTENT
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_OPTIMIZE = 'batch_optimize'
+BATCH_GENERATE = 'batch_generate'
+
+CHUNK_SIZE = int(os.getenv('AI_JOB_CHUNK_SIZE', '10'))
+
+def _remaining_chunks(job: AIJob):
+    """Chunks of the payload's item ids that have not been reported as done yet"""
+    ids = job.payload.get('item_ids', [])[job.progress_done or 0:]
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+def _summarize(job: AIJob) -> Dict[str, Any]:
+    results = job.results or []
+    succeeded = sum(1 for r in results if r.get('success'))
+    return {
+        'processed': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded
+    }
+
+def _check_budget(endpoint: str, tokens: int):
+    """
+    Defer the job until the exhausted token budget window resets, or until the circuit
+    breaker would let calls through again (instead of filling the chunk with fallbacks)
+    """
+    error = groq_service.token_budget.check(endpoint, tokens)
+    if error:
+        raise JobDeferred(error.retry_after, str(error))
+    breaker = groq_service.resilience.breaker
+    if breaker.is_open():
+        raise JobDeferred(int(breaker.reset_timeout), 'Groq circuit breaker open')
+
+def enqueue_batch_optimize(category_id: Optional[int] = None, limit: int = 10,
+                           product_ids: Optional[List[int]] = None,
+                           concurrency: Optional[int] = None,
+                           run_after: Optional[datetime] = None) -> AIJob:
+    """Queue an intelligent optimization run over the same products the synchronous endpoint would pick"""
+    if product_ids:
+        item_ids = [row.id for row in db.session.query(Product.id).filter(Product.id.in_(product_ids)).order_by(Product.id)]
+    else:
+        query = db.session.query(Product.id)
+        if category_id:
+            query = query.filter(Product.category_id == category_id)
+        item_ids = [row.id for row in query.order_by(Product.id).limit(limit)]
+
+    return job_queue.enqueue(BATCH_OPTIMIZE, {
+        'item_ids': item_ids,
+        'category_id': category_id,
+        'concurrency': concurrency
+    }, total=len(item_ids), run_after=run_after)
+
+def enqueue_batch_generate(content_type: str, entity_ids: Optional[List[int]] = None, limit: int = 10,
+                           concurrency: Optional[int] = None, item_timeout: Optional[float] = None,
+                           run_after: Optional[datetime] = None) -> AIJob:
+    """Queue description or meta tag generation for a set of products"""
+    item_ids = [product.id for product in ai_batch_generator.load_products(entity_ids, limit)]
+    return job_queue.enqueue(BATCH_GENERATE, {
+        'item_ids': item_ids,
+        'content_type': content_type,
+        'concurrency': concurrency,
+        'item_timeout': item_timeout
+    }, total=len(item_ids), run_after=run_after)
+
+@job_queue.register(BATCH_OPTIMIZE)
+def run_batch_optimize(job: AIJob, progress) -> Dict[str, Any]:
+    total_tokens = 0
+    for chunk in _remaining_chunks(job):
+        products = Product.query.filter(Product.id.in_(chunk)).all()
+        _check_budget('intelligent_optimization', intelligent_optimizer.estimate_batch_tokens(products))
+        result = intelligent_optimizer.batch_optimize_products(
+            product_ids=chunk,
+            concurrency=job.payload.get('concurrency'),
+            commit=False
+        )
+        if not result.get('success'):
+            raise RuntimeError(result.get('error', 'Batch optimization failed'))
+        total_tokens += result['batch_summary']['total_tokens']
+        # Keep the per-item results small; the full optimization is stored in ai_generated_content.
+        # progress() commits the staged rows with the job update, so a retry never redoes a saved chunk
+        progress([
+            {key: r[key] for key in ('product_id', 'success', 'error', 'processing_time_ms') if key in r}
+            for r in result['results']
+        ], count=len(chunk))
+
+    return {**_summarize(job), 'total_tokens': total_tokens}
+
+@job_queue.register(BATCH_GENERATE)
+def run_batch_generate(job: AIJob, progress) -> Dict[str, Any]:
+    payload = job.payload
+    for chunk in _remaining_chunks(job):
+        products = ai_batch_generator.load_products(chunk)
+        _check_budget(*ai_batch_generator.estimate_tokens(products, payload['content_type']))
+        results = ai_batch_generator.generate_for_products(
+            products,
+            payload['content_type'],
+            concurrency=payload.get('concurrency'),
+            item_timeout=payload.get('item_timeout')
+        )
+        # progress() commits the staged content rows together with the job update
+        progress(results, count=len(chunk))
+
+    return _summarize(job)
+
+@job_queue.register(REFRESH_CONTENT)
+def run_refresh_content(job: AIJob, progress) -> Dict[str, Any]:
+    """Regenerate stale or missing content; products refreshed since they were queued are skipped"""
+    content_type = job.payload['content_type']
+    skipped = 0
+    for chunk in _remaining_chunks(job):
+        products = content_freshness.needs_refresh(ai_batch_generator.load_products(chunk), content_type)
+        skipped += len(chunk) - len(products)
+        results = []
+        if products:
+            _check_budget(*ai_batch_generator.estimate_tokens(products, content_type))
+            results = ai_batch_generator.generate_for_products(products, content_type)
+        progress(results, count=len(chunk))
+
+    return {**_summarize(job), 'skipped': skipped}
@@ -0,0 +1,177 @@
+"""
+AI Batch Service - Batch generation of product descriptions and meta tags
+Shared by the synchronous /ai/batch-generate endpoint and the background job worker
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.orm import joinedload
+from models import db, Product, AIGeneratedContent, SEOMetadata
+from services.groq_ai_service import groq_service
+from services.ai_runtime import ai_runtime, gather_bounded
+from services.ai_freshness import source_hash, stored_source_hash
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AIBatchGenerator:
+    """Fans out Groq generation for a set of products and stages the resulting rows"""
+
+    def __init__(self):
+        self.default_concurrency = int(os.getenv('AI_BATCH_CONCURRENCY', '5'))
+        # Upper bound on a caller-requested concurrency, so one batch cannot drain the Groq rate limit
+        self.max_concurrency = int(os.getenv('AI_BATCH_MAX_CONCURRENCY', '10'))
+        self.default_item_timeout = float(os.getenv('AI_BATCH_ITEM_TIMEOUT_SECONDS', '30'))
+        # Products per meta tag completion; 1 turns packing off
+        self.meta_pack_size = int(os.getenv('AI_META_PACK_SIZE', '10'))
+
+    def load_products(self, entity_ids: Optional[List[int]] = None, limit: int = 10) -> List[Product]:
+        """Products with their category joined, either by id or the first `limit`"""
+        query = Product.query.options(joinedload(Product.category))
+        if entity_ids:
+            return query.filter(Product.id.in_(entity_ids)).all()
+        return query.order_by(Product.id).limit(limit).all()
+
+    def generate_for_products(self, products: List[Product], content_type: str,
+                              concurrency: Optional[int] = None,
+                              item_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Generate `content_type` ('descriptions' or 'meta_tags') for each product and add the rows
+        to the session without committing. Returns one result dict per product.
+        """
+        concurrency = self.clamp_concurrency(concurrency)
+        item_timeout = item_timeout or self.default_item_timeout
+        product_data = [self._product_data(product) for product in products]
+
+        if content_type == 'meta_tags' and self.meta_pack_size > 1:
+            # Several products per completion; results come back keyed by product id
+            store = self._store_meta_tags
+            by_id = ai_runtime.run(groq_service.generate_product_meta_tags_batch(
+                product_data,
+                pack_size=self.meta_pack_size,
+                concurrency=concurrency,
+                timeout=item_timeout
+            ))
+            outcomes = [
+                {'ok': True, 'result': by_id[data['id']]} if data['id'] in by_id
+                else {'ok': False, 'error': 'Meta tag generation failed'}
+                for data in product_data
+            ]
+        else:
+            if content_type == 'descriptions':
+                generate, store = groq_service.generate_product_description, self._store_descriptions
+            else:
+                generate, store = groq_service.generate_product_meta_tags, self._store_meta_tags
+
+            # Fan out all LLM calls on the AI runtime loop; wall time ~ slowest call per wave
+            outcomes = ai_runtime.run(gather_bounded(
+                [lambda data=data: generate(data) for data in product_data],
+                concurrency=concurrency,
+                timeout=item_timeout
+            ))
+
+        results, succeeded = [], []
+        for product, outcome in zip(products, outcomes):
+            if outcome['ok'] and outcome['result']:
+                # Fallback content is reported but not stored, so the product stays due for generation
+                if outcome['result'].get('ai_generated', True):
+                    succeeded.append((product, outcome['result']))
+                results.append({'product_id': product.id, 'success': True, **outcome['result']})
+            else:
+                results.append({
+                    'product_id': product.id,
+                    'success': False,
+                    'error': outcome.get('error', 'Empty AI response')
+                })
+
+        # Collect every row first so the caller can commit once
+        store(succeeded)
+        return results
+
+    def clamp_concurrency(self, concurrency: Optional[int]) -> int:
+        """The requested concurrency within 1..max_concurrency (the default when not given)"""
+        return max(1, min(concurrency or self.default_concurrency, self.max_concurrency))
+
+    def estimate_tokens(self, products: List[Product], content_type: str) -> Tuple[str, int]:
+        """(budget endpoint, worst-case tokens) for generating content_type for these products"""
+        product_data = [self._product_data(product) for product in products]
+        budget = groq_service.token_budget
+        if content_type == 'meta_tags' and self.meta_pack_size > 1:
+            packs = [product_data[i:i + self.meta_pack_size] for i in range(0, len(product_data), self.meta_pack_size)]
+            return 'generate_product_meta_tags_batch', sum(
+                budget.estimate_request(groq_service._build_packed_meta_prompt(pack), 120 * len(pack) + 100)
+                for pack in packs
+            )
+        if content_type == 'meta_tags':
+            return 'generate_product_meta_tags', sum(
+                budget.estimate_request(groq_service._build_product_meta_prompt(data), 500) for data in product_data
+            )
+        return 'generate_product_description', sum(
+            budget.estimate_request(groq_service._build_product_description_prompt(data), 800) for data in product_data
+        )
+
+    def _product_data(self, product: Product) -> Dict[str, Any]:
+        return {
+            'id': product.id,
+            'name': product.name,
+            'description': product.description,
+            'price': product.price,
+            'category': product.category.name if product.category else 'General'
+        }
+
+    def _store_descriptions(self, succeeded):
+        """
+        Update the active description of each product in place (so refreshes keep usage counts),
+        or add one, prefetching existing rows in one query
+        """
+        if not succeeded:
+            return
+
+        existing = {
+            content.entity_id: content
+            for content in AIGeneratedContent.query.filter(
+                AIGeneratedContent.content_type == 'product_description',
+                AIGeneratedContent.entity_type == 'product',
+                AIGeneratedContent.entity_id.in_([product.id for product, _ in succeeded]),
+                AIGeneratedContent.is_active.is_(True)
+            ).all()
+        }
+
+        for product, result in succeeded:
+            content = existing.get(product.id)
+            if content is None:
+                content = AIGeneratedContent(content_type='product_description', entity_type='product',
+                                             entity_id=product.id)
+                db.session.add(content)
+            content.original_content = product.description
+            content.ai_content = result['ai_description']
+            content.model_used = result.get('model_used')
+            content.tokens_used = result.get('tokens_used', 0)
+            content.generation_time_ms = result.get('generation_time_ms', 0)
+            content.source_hash = source_hash(product)
+
+    def _store_meta_tags(self, succeeded):
+        """Update or add SEOMetadata rows for generated meta tags, prefetching existing rows in one query"""
+        if not succeeded:
+            return
+
+        existing = {
+            seo.entity_id: seo
+            for seo in SEOMetadata.query.filter(
+                SEOMetadata.page_type == 'product',
+                SEOMetadata.entity_id.in_([product.id for product, _ in succeeded])
+            ).all()
+        }
+
+        for product, result in succeeded:
+            seo_data = existing.get(product.id)
+            if seo_data is None:
+                seo_data = SEOMetadata(page_type='product', entity_id=product.id)
+                db.session.add(seo_data)
+            seo_data.meta_title = result.get('title', '')
+            seo_data.meta_description = result.get('description', '')
+            seo_data.meta_keywords = result.get('keywords', '')
+            seo_data.is_ai_generated = True
+            seo_data.source_hash = stored_source_hash(product, result)
+
+# Global instance
+ai_batch_generator = AIBatchGenerator()
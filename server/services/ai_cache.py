@@ -0,0 +1,144 @@
+"""
+AI Cache - Two-tier cache for generated AI content
+A per-process LRU with TTL answers repeat reads from memory; Redis is the shared second tier
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TwoTierCache:
+    """In-process LRU (bounded entries, short TTL) in front of an optional Redis client"""
+
+    def __init__(self, redis_client=None, max_entries: Optional[int] = None,
+                 memory_ttl: Optional[int] = None):
+        self.redis_client = redis_client
+        self.max_entries = max_entries or int(os.getenv('AI_CACHE_MEMORY_MAX_ENTRIES', '1000'))
+        # Other workers may rewrite a key in Redis, so memory copies live at most this long
+        self.memory_ttl = memory_ttl or int(os.getenv('AI_CACHE_MEMORY_TTL_SECONDS', '300'))
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'redis_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, key: str, value: Dict[str, Any], ttl: float):
+        expires_at = time.monotonic() + min(ttl, self.memory_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _from_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._counters['memory_hits'] += 1
+            return value
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached value (a shallow copy, so callers can add fields) or None"""
+        value = self._from_memory(key)
+        if value is not None:
+            return dict(value)
+
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline()
+                pipe.get(key)
+                pipe.ttl(key)
+                cached, ttl = pipe.execute()
+                if cached:
+                    value = json.loads(cached)
+                    self._remember(key, value, ttl if ttl and ttl > 0 else self.memory_ttl)
+                    self._count('redis_hits')
+                    return dict(value)
+            except Exception as e:
+                logger.warning(f"Cache read error: {e}")
+
+        self._count('misses')
+        return None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: int = 86400):
+        """Store in memory and, when available, in Redis with the full TTL"""
+        self._remember(key, dict(value), ttl)
+        self._count('writes')
+
+        if self.redis_client is not None:
+            try:
+                self.redis_client.setex(key, ttl, json.dumps(value, default=str))
+            except Exception as e:
+                logger.warning(f"Cache write error: {e}")
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """get() for coroutines on the AI loop: memory answers inline, a Redis round trip runs on a thread"""
+        value = self._from_memory(key)
+        if value is not None:
+            return dict(value)
+        if self.redis_client is None:
+            self._count('misses')
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Dict[str, Any], ttl: int = 86400):
+        """set() for coroutines on the AI loop, without blocking it on Redis"""
+        if self.redis_client is None:
+            self.set(key, value, ttl)
+        else:
+            await asyncio.to_thread(self.set, key, value, ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(key)
+            except Exception as e:
+                logger.warning(f"Cache delete error: {e}")
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        hits = counters['memory_hits'] + counters['redis_hits']
+        lookups = hits + counters['misses']
+        return {
+            **counters,
+            'hits': hits,
+            'lookups': lookups,
+            'hit_rate': round(hits / lookups * 100, 2) if lookups else 0.0,
+            'memory_entries': size,
+            'memory_max_entries': self.max_entries,
+            'backend': 'memory+redis' if self.redis_client is not None else 'memory'
+        }
+
+
+def content_hash_key(content_type: str, prompt: str, params: Dict[str, Any]) -> str:
+    """
+    Cache key derived from the rendered prompt plus model parameters.
+    Any change to the inputs yields a new key, and identical inputs share one entry.
+    """
+    canonical = json.dumps({'prompt': prompt, 'params': params}, sort_keys=True, default=str)
+    return f"ai:{content_type}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
@@ -0,0 +1,165 @@
+"""
+AI Freshness - Stale-while-revalidate for stored AI content
+Stored descriptions and meta tags are served at once; stale or missing ones are refreshed by a queued job
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy.orm import Session
+from models import db, Product, AIGeneratedContent, SEOMetadata, AIJob
+from services.job_queue import job_queue
+from services.groq_ai_service import groq_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+REFRESH_CONTENT = 'refresh_content'
+PARTIAL_SOURCE_HASH = 'partial'
+
+def source_hash(product: Product) -> str:
+    """Hash of the product fields the description and meta tag prompts are built from"""
+    fields = {
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'category': product.category.name if product.category else 'General'
+    }
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def stored_source_hash(product: Product, result: Dict) -> str:
+    """
+    The source_hash to store with generated content. Results with fields filled from defaults get
+    one that never matches, so serving them schedules a regeneration.
+    """
+    return PARTIAL_SOURCE_HASH if result.get('defaulted_fields') else source_hash(product)
+
+
+class ContentFreshness:
+    """
+    Decides whether stored AI content is stale (the product changed since it was generated, or it
+    is older than the max age) and schedules refreshes. Requests for the same content type within
+    refresh_delay seconds coalesce into one queued refresh_content job.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        self.max_age = timedelta(days=float(os.getenv('AI_CONTENT_MAX_AGE_DAYS', '30')))
+        self.refresh_delay = int(os.getenv('AI_REFRESH_DELAY_SECONDS', '30'))
+        self.max_batch = int(os.getenv('AI_REFRESH_MAX_BATCH', '200'))
+        # A product is scheduled at most once per version per this many seconds
+        self.dedupe_seconds = int(os.getenv('AI_REFRESH_DEDUPE_SECONDS', '3600'))
+        self._scheduled: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def is_stale(self, row, product: Product) -> bool:
+        """
+        True if the row was generated from different product fields or is past the max age.
+        Rows stored before hashes were recorded are judged on age alone.
+        """
+        if row.source_hash and row.source_hash != source_hash(product):
+            return True
+        generated_at = row.updated_at or row.created_at
+        return generated_at is not None and datetime.utcnow() - generated_at > self.max_age
+
+    def needs_refresh(self, products: List[Product], content_type: str) -> List[Product]:
+        """The products whose content of this type is missing or stale"""
+        if not products:
+            return []
+        ids = [product.id for product in products]
+        if content_type == 'descriptions':
+            rows = AIGeneratedContent.query.filter(
+                AIGeneratedContent.content_type == 'product_description',
+                AIGeneratedContent.entity_type == 'product',
+                AIGeneratedContent.entity_id.in_(ids),
+                AIGeneratedContent.is_active.is_(True)
+            ).all()
+        else:
+            rows = SEOMetadata.query.filter(
+                SEOMetadata.page_type == 'product',
+                SEOMetadata.entity_id.in_(ids),
+                SEOMetadata.is_active.is_(True),
+                SEOMetadata.is_ai_generated.is_(True)
+            ).all()
+        by_id = {row.entity_id: row for row in rows}
+        return [p for p in products if p.id not in by_id or self.is_stale(by_id[p.id], p)]
+
+    def _claim(self, key: str) -> bool:
+        """True for the first caller to schedule this key within dedupe_seconds, across workers with Redis"""
+        if self.redis_client is not None:
+            try:
+                return bool(self.redis_client.set(f"ai:refresh:{key}", 1, nx=True, ex=self.dedupe_seconds))
+            except Exception as e:
+                logger.warning(f"Redis refresh dedupe unavailable, using memory: {e}")
+        now = time.monotonic()
+        with self._lock:
+            if len(self._scheduled) > 10000:
+                self._scheduled = {k: t for k, t in self._scheduled.items() if t > now}
+            if self._scheduled.get(key, 0) > now:
+                return False
+            self._scheduled[key] = now + self.dedupe_seconds
+            return True
+
+    def schedule(self, content_type: str, product: Product) -> bool:
+        """
+        Queue a refresh of one product's content without waiting for it. Returns False when AI
+        generation is not configured or the product is already scheduled.
+        """
+        if groq_service.client is None:
+            return False
+        with db.session.no_autoflush:  # loading the category must not flush the caller's pending work
+            version = source_hash(product)[:16]
+        if not self._claim(f"{content_type}:{product.id}:{version}"):
+            return False
+        try:
+            self._enqueue(content_type, product.id)
+            return True
+        except Exception as e:
+            logger.error(f"Could not schedule {content_type} refresh for product {product.id}: {e}")
+            return False
+
+    def _enqueue(self, content_type: str, product_id: int) -> int:
+        """
+        Add the product to a refresh job that has not started yet, or queue a new one, returning
+        the job id. Runs in its own session: callers are read paths whose transaction and loaded
+        objects must not be committed, rolled back or expired here.
+        """
+        now = datetime.utcnow()
+        with Session(db.engine) as session:
+            # Only jobs due in the future: workers cannot claim them while we add to the payload
+            open_jobs = session.query(AIJob).filter(
+                AIJob.job_type == REFRESH_CONTENT,
+                AIJob.status == 'queued',
+                AIJob.run_after > now + timedelta(seconds=1)
+            ).order_by(AIJob.id).with_for_update().all()
+            for job in open_jobs:
+                item_ids = job.payload.get('item_ids', [])
+                if job.payload.get('content_type') == content_type and len(item_ids) < self.max_batch:
+                    if product_id not in item_ids:
+                        job.payload = {**job.payload, 'item_ids': item_ids + [product_id]}
+                        job.progress_total = len(item_ids) + 1
+                    session.commit()
+                    return job.id
+            session.rollback()
+
+            return job_queue.enqueue(REFRESH_CONTENT, {
+                'item_ids': [product_id],
+                'content_type': content_type
+            }, total=1, run_after=now + timedelta(seconds=self.refresh_delay), session=session).id
+
+    def check(self, content_type: str, product: Product, row) -> bool:
+        """
+        Whether the row can be served as fresh. Missing or stale content is scheduled for a refresh;
+        the caller serves what it has (or its fallback) either way.
+        """
+        if row is not None and not self.is_stale(row, product):
+            return True
+        self.schedule(content_type, product)
+        return False
+
+# Global instance
+content_freshness = ContentFreshness(groq_service.redis_client)
@@ -0,0 +1,227 @@
+"""
+AI Output - Pydantic schemas for structured completions, with tolerant JSON extraction and repair
+A completion that is nearly right is repaired or patched with field defaults instead of discarded
+"""
+import ast
+import json
+import re
+import threading
+from typing import Annotated, Any, Dict, List, Optional, Tuple, Type, Union
+from pydantic import BaseModel, BeforeValidator, StringConstraints, ValidationError
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _join_keywords(value: Any) -> Any:
+    """Models often return keywords as a list; the app stores a comma separated string"""
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(v).strip() for v in value if str(v).strip())
+    return value
+
+
+def _listify(value: Any) -> Any:
+    if isinstance(value, str):
+        return [line.strip(' -*•\t') for line in value.splitlines() if line.strip(' -*•\t')]
+    return value
+
+
+Text = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+Keywords = Annotated[Text, BeforeValidator(_join_keywords)]
+
+
+class MetaTags(BaseModel):
+    """Product and category meta tags"""
+    title: Text
+    description: Text
+    keywords: Keywords
+
+
+class PackedMetaTags(MetaTags):
+    """One product's entry in a packed meta tag response"""
+    id: Union[int, str]
+
+
+class Optimization(BaseModel):
+    """An intelligent product optimization"""
+    enhanced_description: Text
+    meta_title: Text
+    meta_description: Text
+    keywords: Keywords
+    unique_selling_points: Annotated[List[str], BeforeValidator(_listify)] = []
+    optimization_reasoning: str = ''
+
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+
+
+def _close_truncated(text: str) -> Optional[str]:
+    """
+    Complete JSON cut off mid-way (e.g. at max_tokens): drop everything after the last comma
+    outside a string, so a half-written member is lost rather than kept, then close the brackets
+    """
+    stack, in_string, escape = [], False, False
+    last_comma, stack_at_comma = None, []
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if stack:
+                stack.pop()
+        elif ch == ',':
+            last_comma, stack_at_comma = i, list(stack)
+    if not stack and not in_string:
+        return text
+    if last_comma is None or not stack_at_comma:
+        return None
+    return text[:last_comma] + ''.join(reversed(stack_at_comma))
+
+
+def extract_json(text: Optional[str], array: bool = False) -> Tuple[Any, Optional[str]]:
+    """
+    The JSON object (or array) in a completion, and how it was recovered: 'clean', 'repaired'
+    (code fences, surrounding prose, trailing commas, smart quotes, Python-style literals) or
+    'truncated' (cut off, with the half-written member dropped). Returns (None, None) when
+    nothing usable is found.
+    """
+    text = (text or '').strip()
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+
+    opener, closer = ('[', ']') if array else ('{', '}')
+    start = text.find(opener)
+    if start == -1:
+        return None, None
+    end = text.rfind(closer) + 1
+    candidate = text[start:end] if end > start else text[start:]
+
+    try:
+        return json.loads(candidate), 'clean'
+    except json.JSONDecodeError:
+        pass
+
+    def clean(value: str) -> str:
+        return _TRAILING_COMMA.sub(r"\1", value.translate(_SMART_QUOTES))
+
+    repaired = clean(candidate)
+    # Truncation is judged on everything after the opener: the last closer may belong to a nested value
+    for attempt, how in ((repaired, 'repaired'), (_close_truncated(clean(text[start:])), 'truncated')):
+        if attempt is None:
+            continue
+        try:
+            return json.loads(_TRAILING_COMMA.sub(r"\1", attempt)), how
+        except json.JSONDecodeError:
+            pass
+    try:
+        # Single quotes and True/False/None, as some models write Python dicts
+        value = ast.literal_eval(repaired)
+        if isinstance(value, (dict, list)):
+            return value, 'repaired'
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+    return None, None
+
+
+class StructuredOutputParser:
+    """
+    Validates completions against a schema. Fields that are missing or invalid are taken from
+    the caller's defaults (usually the fallback content) when given; counts outcomes per schema
+    so the parse failure rate can be watched.
+    """
+
+    OUTCOMES = ('clean', 'repaired', 'defaulted', 'failed')
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, schema: Type[BaseModel], outcome: str):
+        with self._lock:
+            counts = self._counts.setdefault(schema.__name__, dict.fromkeys(self.OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def _validate(self, schema: Type[BaseModel], data: Any,
+                  defaults: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """The validated fields, and the names of any filled in from defaults"""
+        if not isinstance(data, dict):
+            return None, []
+        try:
+            return schema.model_validate(data).model_dump(), []
+        except ValidationError as e:
+            bad = sorted({str(error['loc'][0]) for error in e.errors() if error['loc']})
+        if not defaults or not bad or any(field not in defaults for field in bad):
+            return None, bad
+        try:
+            return schema.model_validate({**data, **{field: defaults[field] for field in bad}}).model_dump(), bad
+        except ValidationError:
+            return None, bad
+
+    def parse(self, schema: Type[BaseModel], text: Optional[str],
+              defaults: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        A dict of the schema's fields, or None if the completion cannot be used. Results that
+        needed defaults list them under 'defaulted_fields', including fields a truncation cut
+        off; a result whose required fields all came from defaults is unusable.
+        """
+        data, how = extract_json(text)
+        result, defaulted = self._validate(schema, data, defaults)
+        if result is not None and how == 'truncated':
+            # Fields left out are defaults, and the last one written may have been cut short
+            dropped = [field for field in schema.model_fields if field not in data] + list(data)[-1:]
+            defaulted = sorted(set(defaulted) | set(dropped))
+        required = {name for name, field in schema.model_fields.items() if field.is_required()}
+        if result is not None and required <= set(defaulted):
+            result = None
+        if result is None:
+            self._count(schema, 'failed')
+            logger.warning(f"Unusable {schema.__name__} output (invalid fields: {defaulted or 'no JSON'}): "
+                           f"{(text or '')[:200]!r}")
+            return None
+        if defaulted:
+            self._count(schema, 'defaulted')
+            result['defaulted_fields'] = defaulted
+        else:
+            self._count(schema, how)
+        return result
+
+    def parse_list(self, schema: Type[BaseModel], text: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """
+        The valid items of a JSON array, or None if no array can be extracted. Invalid items
+        are dropped (and counted as failed) so the caller can retry just those; so is the last
+        item of a truncated array, which may have lost fields to the cut.
+        """
+        items, how = extract_json(text, array=True)
+        if not isinstance(items, list):
+            self._count(schema, 'failed')
+            logger.warning(f"Unusable {schema.__name__} list output: {(text or '')[:200]!r}")
+            return None
+        if how == 'truncated':
+            # Items before the cut are whole
+            items, how = items[:-1], 'clean'
+            self._count(schema, 'failed')
+        valid = []
+        for item in items:
+            result, _ = self._validate(schema, item, None)
+            self._count(schema, 'failed' if result is None else how)
+            if result is not None:
+                valid.append(result)
+        return valid
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {name: dict(c) for name, c in self._counts.items()}
+        for c in counts.values():
+            total = sum(c.values())
+            c['failure_rate'] = round(c['failed'] / total, 4) if total else 0.0
+        return counts
@@ -0,0 +1,181 @@
+"""
+AI Resilience - Deadlines, retries and a circuit breaker around Groq calls
+Retries use jittered exponential backoff and honour Retry-After; an open breaker fails fast
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from groq import APIConnectionError
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Groq while the circuit breaker is open"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Groq circuit breaker open, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'error': 'AI service temporarily unavailable', 'retry_after_seconds': self.retry_after}
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failed calls; open -> half-open after
+    `reset_timeout`, where a single probe call decides whether to close again or re-open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._counters = {'opened': 0, 'rejected': 0}
+
+    def _retry_after(self) -> int:
+        return max(1, int(self._opened_at + self.reset_timeout - time.monotonic() + 0.999))
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (does not claim the half-open probe)"""
+        with self._lock:
+            if self.state == 'open':
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self.state == 'half_open' and self._probing
+
+    def acquire(self) -> bool:
+        """Permission for one call; returns True if this call is the half-open probe"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            self._counters['rejected'] += 1
+            raise CircuitOpenError(self._retry_after() if self.state == 'open' else 1)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Groq circuit breaker closed")
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self._counters['opened'] += 1
+                    logger.warning(f"Groq circuit breaker opened after {self._failures} failures")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release_probe(self):
+        """Give up a probe that ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self._failures, **self._counters}
+
+
+class ResilientCaller:
+    """Runs one upstream request with an overall deadline, per-attempt timeouts, retries and a breaker"""
+
+    def __init__(self):
+        # Wall-clock budget for a call including every retry and backoff sleep
+        self.deadline = float(os.getenv('AI_CALL_DEADLINE_SECONDS', '20'))
+        self.attempt_timeout = float(os.getenv('AI_CALL_TIMEOUT_SECONDS', '10'))
+        self.max_retries = int(os.getenv('AI_CALL_MAX_RETRIES', '2'))
+        self.backoff_base = float(os.getenv('AI_RETRY_BASE_DELAY_SECONDS', '0.5'))
+        self.backoff_max = float(os.getenv('AI_RETRY_MAX_DELAY_SECONDS', '8'))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('AI_BREAKER_FAILURE_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('AI_BREAKER_RESET_SECONDS', '30'))
+        )
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'retries': 0, 'timeouts': 0, 'failures': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Timeouts, connection errors, rate limits and server errors; other 4xx are the caller's fault"""
+        if isinstance(error, (asyncio.TimeoutError, APIConnectionError)):
+            return True
+        status = getattr(error, 'status_code', None)
+        return status in (408, 409, 429) or (status is not None and status >= 500)
+
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """Seconds from the Retry-After / retry-after-ms headers of an API error, if present"""
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            if headers.get('retry-after'):
+                return float(headers['retry-after'])
+        except (TypeError, ValueError):
+            pass  # an HTTP-date; fall back to our own backoff
+        return None
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        # Full jitter keeps workers that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call(self, request: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        """
+        Await request() until it succeeds, fails with a non-retryable error, runs out of retries or
+        would pass the deadline. Raises CircuitOpenError without calling upstream while the breaker is open.
+        """
+        probe = self.breaker.acquire()
+        self._count('calls')
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        try:
+            while True:
+                remaining = expires_at - time.monotonic()
+                try:
+                    result = await asyncio.wait_for(request(), min(self.attempt_timeout, max(remaining, 0.01)))
+                    self.breaker.record_success()
+                    return result
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._count('timeouts')
+                    if not self._is_retryable(e):
+                        # Upstream answered; the request itself was bad
+                        self.breaker.record_success()
+                        raise
+                    delay = self._backoff(attempt, e)
+                    if attempt >= self.max_retries or time.monotonic() + delay >= expires_at:
+                        self._count('failures')
+                        self.breaker.record_failure()
+                        raise
+                    attempt += 1
+                    self._count('retries')
+                    logger.warning(f"Groq call failed ({e.__class__.__name__}: {e}), retry {attempt} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, 'breaker': self.breaker.stats()}
@@ -0,0 +1,96 @@
+"""
+AI Runtime - One long-lived asyncio event loop per worker process
+Request handlers submit AI coroutines here instead of calling asyncio.run per request
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AIRuntime:
+    """Background event loop thread that runs AI coroutines for synchronous Flask handlers"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, started lazily (and again after a fork)"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run_loop, args=(self._loop,),
+                                                name='ai-runtime-loop', daemon=True)
+                self._thread.start()
+                logger.info("AI runtime event loop started")
+            return self._loop
+
+    def _run_loop(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block the calling thread for its result"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+        """
+        Drive an async generator on the loop from a synchronous caller, one item at a time.
+        Closing the returned generator early (e.g. a disconnected SSE client) closes agen too.
+        """
+        done = object()
+
+        async def next_item():
+            try:
+                return await agen.__anext__()
+            except StopAsyncIteration:
+                return done
+
+        try:
+            while True:
+                item = self.run(next_item(), timeout)
+                if item is done:
+                    return
+                yield item
+        finally:
+            self.run(agen.aclose(), timeout)
+
+
+async def gather_bounded(factories: List[Callable[[], Coroutine]], concurrency: int = 5,
+                         timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Run coroutine factories with at most `concurrency` in flight and a per-item timeout.
+    Returns one {'ok': True, 'result': ...} or {'ok': False, 'error': ...} per factory, in order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(factory):
+        async with semaphore:
+            try:
+                return {'ok': True, 'result': await asyncio.wait_for(factory(), timeout)}
+            except asyncio.TimeoutError:
+                return {'ok': False, 'error': f"Timed out after {timeout}s"}
+            except Exception as e:
+                return {'ok': False, 'error': str(e)}
+
+    return await asyncio.gather(*(run_one(factory) for factory in factories))
+
+# Global instance
+ai_runtime = AIRuntime()
@@ -0,0 +1,111 @@
+"""
+AI Streaming - Token streaming from Groq and Server-Sent Events helpers
+Streams accumulate the full text so it can be parsed, cached and stored once the completion ends
+"""
+import asyncio
+import json
+import time
+import httpx
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+from flask import Response, stream_with_context
+from groq import APIError
+from services.model_registry import model_router
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CompletionStream:
+    """
+    One streamed chat completion under the service's token budget and resilience layer.
+    Iterate chunks() for text deltas; text, usage and finish_reason are complete afterwards.
+    """
+
+    def __init__(self, service, endpoint: str, prompt: str, params: Dict[str, Any], client=None):
+        self.service = service
+        self.endpoint = endpoint
+        self.prompt = prompt
+        self.params = params
+        self.client = client or service.client
+        self.text = ''
+        self.usage = None
+        self.finish_reason = None
+
+    # Not every stream reports usage; estimate it rather than record zero
+    @property
+    def prompt_tokens(self) -> int:
+        if self.usage is not None:
+            return self.usage.prompt_tokens
+        return self.service.token_budget.estimate_tokens(self.prompt)
+
+    @property
+    def completion_tokens(self) -> int:
+        if self.usage is not None:
+            return self.usage.completion_tokens
+        return self.service.token_budget.estimate_tokens(self.text)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    async def chunks(self) -> AsyncIterator[str]:
+        """
+        Yield text deltas as they arrive. Only opening the stream is retried; after that a gap
+        longer than the per-attempt timeout between chunks aborts it.
+        """
+        service = self.service
+        reservation = await service.token_budget.areserve(self.endpoint, self.prompt, self.params['max_tokens'])
+        stream = None
+        start = time.monotonic()
+        try:
+            stream = await service.resilience.call(lambda: self.client.chat.completions.create(
+                messages=[{"role": "user", "content": self.prompt}],
+                stream=True,
+                **self.params
+            ))
+            iterator = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), service.resilience.attempt_timeout)
+                except StopAsyncIteration:
+                    break
+                except (asyncio.TimeoutError, ConnectionError, httpx.TransportError):
+                    # A dropped connection surfaces as httpx.ReadError/RemoteProtocolError, not ConnectionError
+                    service.resilience.breaker.record_failure()
+                    raise
+
+                # Groq reports usage on the final chunk, under x_groq in older API versions
+                usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+                if usage is not None:
+                    self.usage = usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    self.finish_reason = choice.finish_reason
+                delta = getattr(choice.delta, 'content', None)
+                if delta:
+                    self.text += delta
+                    yield delta
+            model_router.record(self.params['model'], int((time.monotonic() - start) * 1000), True)
+        except (asyncio.TimeoutError, ConnectionError, httpx.TransportError, APIError):
+            model_router.record(self.params['model'], int((time.monotonic() - start) * 1000), False)
+            raise
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                await stream.close()
+            await service.token_budget.asettle(reservation, self.total_tokens if stream is not None else 0)
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events: Iterator[str], status: Optional[int] = None) -> Response:
+    """Stream events to the client with the request context kept alive and proxy buffering off"""
+    return Response(
+        stream_with_context(events),
+        status=status,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
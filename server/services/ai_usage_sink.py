@@ -0,0 +1,180 @@
+"""
+AI Usage Sink - Buffered AIUsageAnalytics writes, flushed in bulk by a write-behind worker
+Events are buffered in a Redis list (shared by all workers) when Redis is reachable, else in memory
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+from flask import has_request_context, request
+from sqlalchemy import insert
+from models import db, AIUsageAnalytics
+from services.write_behind import WriteBehindWorker
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Every row carries every column, so a flush can be one executemany INSERT
+ROW_DEFAULTS = {
+    'endpoint': 'unknown', 'request_type': 'unknown', 'entity_type': None, 'entity_id': None,
+    'tokens_input': 0, 'tokens_output': 0, 'tokens_total': 0, 'response_time_ms': 0,
+    'success': True, 'error_message': None, 'cost_cents': 0.0, 'model_used': None,
+    'user_ip': None, 'user_agent': None
+}
+
+class AIUsageSink:
+    """
+    Collects usage events from request handlers and the AI loop without touching the database.
+    The worker flushes every interval seconds, as soon as flush_batch_size events are waiting,
+    and once more on shutdown.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        self.buffer_key = 'ai:usage:buffer'
+        self.flush_batch_size = int(os.getenv('AI_USAGE_FLUSH_BATCH_SIZE', '200'))
+        # Oldest events are dropped past this many in memory, e.g. while the database is down
+        self.max_buffered = int(os.getenv('AI_USAGE_MAX_BUFFERED', '10000'))
+        # Events in a batch that failed this many inserts are dropped, so one bad row cannot stall the sink
+        self.max_flush_attempts = int(os.getenv('AI_USAGE_MAX_FLUSH_ATTEMPTS', '5'))
+        self.worker = WriteBehindWorker('ai-usage', self.flush,
+                                        interval=float(os.getenv('AI_USAGE_FLUSH_INTERVAL_SECONDS', '5')))
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'failed_flushes': 0}
+
+    def init_app(self, app):
+        """Start flushing to the app's database"""
+        self.worker.init_app(app)
+
+    def _event(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        event = {'created_at': datetime.utcnow().isoformat(), **fields}
+        if has_request_context() and 'user_ip' not in event:
+            event['user_ip'] = request.remote_addr
+            event['user_agent'] = request.headers.get('User-Agent', '')[:500]
+        event.setdefault('request_type', event.get('endpoint', 'unknown'))
+        if 'tokens_total' not in event:
+            event['tokens_total'] = event.get('tokens_input', 0) + event.get('tokens_output', 0)
+        return event
+
+    def record(self, **fields):
+        """Buffer one AIUsageAnalytics row; user ip and agent are filled in inside a request"""
+        self.record_many([fields])
+
+    def record_many(self, rows: List[Dict[str, Any]]):
+        events = [self._event(fields) for fields in rows]
+        if not events:
+            return
+        pending = None
+        # On the AI loop an RPUSH would stall every in-flight call; memory is flushed by the same worker
+        if self.redis_client is not None and not self._on_event_loop():
+            try:
+                pending = self.redis_client.rpush(self.buffer_key, *(json.dumps(e, default=str) for e in events))
+            except Exception as e:
+                logger.warning(f"Redis usage buffer unavailable, buffering in memory: {e}")
+        if pending is None:
+            with self._lock:
+                self._buffer.extend(events)
+                self._trim()
+                pending = len(self._buffer)
+        with self._lock:
+            self._stats['recorded'] += len(events)
+        if pending >= self.flush_batch_size:
+            self.worker.wake()
+
+    @staticmethod
+    def _on_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def _trim(self):
+        """Drop the oldest in-memory events past max_buffered; call with the lock held"""
+        overflow = max(0, len(self._buffer) - self.max_buffered)
+        for _ in range(overflow):
+            self._buffer.popleft()
+        self._stats['dropped'] += overflow
+
+    def _take(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Up to flush_batch_size buffered events, memory first: (from memory, from Redis)"""
+        with self._lock:
+            local = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.flush_batch_size))]
+        shared = []
+        if self.redis_client is not None and len(local) < self.flush_batch_size:
+            try:
+                raw = self.redis_client.lpop(self.buffer_key, self.flush_batch_size - len(local)) or []
+                shared = [json.loads(item) for item in raw]
+            except Exception as e:
+                logger.warning(f"Could not read the Redis usage buffer: {e}")
+        return local, shared
+
+    def _put_back(self, local: List[Dict[str, Any]], shared: List[Dict[str, Any]]):
+        """
+        Return the events of a failed flush to the head of the buffers they came from, counting the
+        attempt. Events that have failed max_flush_attempts inserts are dropped instead.
+        """
+        kept, dropped = ([], []), 0
+        for events, keep in ((local, kept[0]), (shared, kept[1])):
+            for event in events:
+                event['_attempts'] = event.get('_attempts', 0) + 1
+                if event['_attempts'] < self.max_flush_attempts:
+                    keep.append(event)
+                else:
+                    dropped += 1
+        if dropped:
+            logger.error(f"Dropping {dropped} AI usage events after {self.max_flush_attempts} failed inserts")
+        local, shared = kept
+        if shared:
+            try:
+                # LPUSH prepends one at a time, so push newest first to keep the order
+                self.redis_client.lpush(self.buffer_key, *(json.dumps(e, default=str) for e in reversed(shared)))
+                shared = []
+            except Exception as e:
+                logger.warning(f"Could not return usage events to Redis, buffering in memory: {e}")
+        with self._lock:
+            self._buffer.extendleft(reversed(local + shared))
+            self._trim()
+            self._stats['dropped'] += dropped
+
+    def flush(self) -> int:
+        """Insert buffered events in multi-row INSERTs until the buffer is empty"""
+        written = 0
+        while True:
+            local, shared = self._take()
+            events = local + shared
+            if not events:
+                return written
+            rows = [
+                {**ROW_DEFAULTS, **{k: v for k, v in e.items() if k in ROW_DEFAULTS},
+                 'created_at': datetime.fromisoformat(e['created_at'])}
+                for e in events
+            ]
+            try:
+                db.session.execute(insert(AIUsageAnalytics), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._put_back(local, shared)
+                with self._lock:
+                    self._stats['failed_flushes'] += 1
+                raise
+            written += len(rows)
+            with self._lock:
+                self._stats['written'] += len(rows)
+            if len(events) < self.flush_batch_size:
+                return written
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {**self._stats, 'buffered_in_memory': len(self._buffer)}
+        if self.redis_client is not None:
+            try:
+                stats['buffered_in_redis'] = self.redis_client.llen(self.buffer_key)
+            except Exception:
+                pass
+        return stats
@@ -0,0 +1,151 @@
+"""
+Auth Tokens - Stateless signed session tokens carrying user id and role
+Verification is an in-memory signature check; revocations are shared through Redis
+"""
+import os
+import secrets
+import threading
+import time
+from functools import wraps
+from typing import Optional, Dict, Any
+from flask import request, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from services.groq_ai_service import groq_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TokenService:
+    """Issues and verifies signed, expiring tokens without touching the database"""
+
+    def __init__(self, redis_client=None):
+        secret = os.getenv('SECRET_KEY')
+        # Checked by init_app: only a debug server may run on a per-process key
+        self.has_shared_secret = bool(secret)
+        self.serializer = URLSafeTimedSerializer(secret or secrets.token_hex(32), salt='myjamii-auth-token')
+        self.ttl_seconds = int(os.getenv('AUTH_TOKEN_TTL_SECONDS', '86400'))
+        self.redis_client = redis_client
+        self.revoked_key = 'auth:revoked'
+        self.revocation_refresh_seconds = float(os.getenv('AUTH_REVOCATION_REFRESH_SECONDS', '5'))
+        self._revoked: Dict[str, float] = {}
+        self._revoked_synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Refuse to start without SECRET_KEY outside debug: each worker would sign with its own
+        random key, so tokens would only verify on the worker that issued them
+        """
+        if self.has_shared_secret:
+            return
+        if not app.debug:
+            raise RuntimeError("SECRET_KEY is not set; it must be shared by all workers (use FLASK_DEBUG=1 for a local per-process key)")
+        logger.warning("SECRET_KEY not set, using a per-process key (debug only)")
+
+    def issue(self, user) -> Dict[str, Any]:
+        """Create a token for a user"""
+        token = self.serializer.dumps({
+            'uid': user.id,
+            'role': user.role or 'user',
+            'jti': secrets.token_urlsafe(12)
+        })
+        return {'token': token, 'token_type': 'Bearer', 'expires_in': self.ttl_seconds}
+
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the token payload, or None if it is invalid, expired or revoked"""
+        try:
+            payload, issued_at = self.serializer.loads(token, max_age=self.ttl_seconds, return_timestamp=True)
+        except (SignatureExpired, BadSignature):
+            return None
+
+        if self._is_revoked(payload.get('jti')):
+            return None
+
+        payload['exp'] = issued_at.timestamp() + self.ttl_seconds
+        return payload
+
+    def revoke(self, payload: Dict[str, Any]):
+        """Revoke a verified token until it would have expired anyway"""
+        jti, expires_at = payload['jti'], payload['exp']
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.zadd(self.revoked_key, {jti: expires_at})
+                pipe.zremrangebyscore(self.revoked_key, 0, time.time())
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Failed to publish token revocation: {e}")
+
+    def _is_revoked(self, jti: Optional[str]) -> bool:
+        now = time.time()
+        if self.redis_client and now - self._revoked_synced_at > self.revocation_refresh_seconds:
+            self._sync_revocations(now)
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > now
+
+    def _sync_revocations(self, now: float):
+        """Refresh the local copy of the revocation list (one Redis call every few seconds per worker)"""
+        self._revoked_synced_at = now
+        try:
+            entries = self.redis_client.zrangebyscore(self.revoked_key, now, '+inf', withscores=True)
+        except Exception as e:
+            logger.warning(f"Token revocation sync failed: {e}")
+            return
+        with self._lock:
+            self._revoked = {jti: score for jti, score in entries}
+
+    def from_request(self) -> Optional[Dict[str, Any]]:
+        """Verify the bearer token on the current request"""
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return None
+        return self.verify(header[7:].strip())
+
+# Global instance
+token_service = TokenService(groq_service.redis_client)
+
+
+def auth_required(f):
+    """Reject requests without a valid token; the payload is available as g.auth"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        payload = token_service.from_request()
+        if payload is None:
+            return {'error': 'Authentication required'}, 401
+        g.auth = payload
+        return f(*args, **kwargs)
+    return decorated
+
+
+def owner_required(f):
+    """Require a valid token for the user_id in the URL (admins may act for any user)"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        payload = token_service.from_request()
+        if payload is None:
+            return {'error': 'Authentication required'}, 401
+        if payload.get('uid') != kwargs.get('user_id') and payload.get('role') != 'admin':
+            return {'error': 'Not allowed to access this user'}, 403
+        g.auth = payload
+        return f(*args, **kwargs)
+    return decorated
+
+
+def admin_required(f):
+    """Require an admin token when ADMIN_AUTH_REQUIRED is enabled"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if os.getenv('ADMIN_AUTH_REQUIRED', 'false').lower() != 'true':
+            return f(*args, **kwargs)
+
+        payload = token_service.from_request()
+        if payload is None:
+            return {'error': 'Authentication required'}, 401
+        if payload.get('role') != 'admin':
+            return {'error': 'Admin access required'}, 403
+        g.auth = payload
+        return f(*args, **kwargs)
+    return decorated
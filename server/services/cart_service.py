@@ -0,0 +1,117 @@
+"""
+Cart Service - Server-persisted carts over the Cart/CartItem models
+Loads a cart with its items and products eagerly and computes totals in SQL
+"""
+from typing import Optional, Dict, Any
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload, joinedload
+from models import db, User, Product, Cart, CartItem
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CartNotFoundError(Exception):
+    """Raised when a cart, user or product referenced by a cart operation does not exist"""
+
+
+class CartService:
+    """Database-backed cart operations keyed by user id"""
+
+    def _load_cart(self, user_id: int) -> Optional[Cart]:
+        """Load the user's cart with all items and their products in one round of eager loading"""
+        return Cart.query.options(
+            selectinload(Cart.items).joinedload(CartItem.product)
+        ).filter_by(user_id=user_id).order_by(Cart.id).first()
+
+    def _get_or_create_cart(self, user_id: int) -> Cart:
+        cart = self._load_cart(user_id)
+        if cart:
+            return cart
+
+        if not User.query.get(user_id):
+            raise CartNotFoundError('User not found')
+
+        cart = Cart(user_id=user_id)
+        db.session.add(cart)
+        db.session.flush()
+        return cart
+
+    def _totals(self, cart_id: int) -> Dict[str, Any]:
+        """Item count and subtotal computed by the database"""
+        subtotal, item_count = db.session.query(
+            func.coalesce(func.sum(CartItem.quantity * Product.price), 0),
+            func.coalesce(func.sum(CartItem.quantity), 0)
+        ).join(Product, CartItem.product_id == Product.id).filter(
+            CartItem.cart_id == cart_id
+        ).one()
+        return {'subtotal': round(float(subtotal), 2), 'item_count': int(item_count)}
+
+    def serialize(self, user_id: int, cart: Optional[Cart]) -> Dict[str, Any]:
+        if cart is None:
+            return {'cart_id': None, 'user_id': user_id, 'items': [], 'subtotal': 0.0, 'item_count': 0}
+
+        return {
+            'cart_id': cart.id,
+            'user_id': cart.user_id,
+            'items': [{
+                'product_id': item.product_id,
+                'name': item.product.name,
+                'price': item.product.price,
+                'image_url': item.product.image_url,
+                'quantity': item.quantity,
+                'line_total': round(item.product.price * item.quantity, 2)
+            } for item in sorted(cart.items, key=lambda i: i.id)],
+            **self._totals(cart.id)
+        }
+
+    def get_cart(self, user_id: int) -> Dict[str, Any]:
+        return self.serialize(user_id, self._load_cart(user_id))
+
+    def load_quantities(self, user_id: int) -> Dict[int, int]:
+        """Persisted quantities per product id, used to hydrate other cart stores"""
+        cart = self._load_cart(user_id)
+        return {item.product_id: item.quantity for item in cart.items} if cart else {}
+
+    def add_item(self, user_id: int, product_id: int, quantity: int = 1) -> Dict[str, Any]:
+        """Add quantity of a product, merging with an existing line"""
+        if not Product.query.get(product_id):
+            raise CartNotFoundError('Product not found')
+
+        cart = self._get_or_create_cart(user_id)
+        item = next((i for i in cart.items if i.product_id == product_id), None)
+        if item:
+            item.quantity += quantity
+        else:
+            cart.items.append(CartItem(product_id=product_id, quantity=quantity))
+
+        db.session.commit()
+        return self.get_cart(user_id)
+
+    def set_quantity(self, user_id: int, product_id: int, quantity: int) -> Dict[str, Any]:
+        """Set a line's quantity; zero or less removes it"""
+        cart = self._load_cart(user_id)
+        item = next((i for i in cart.items if i.product_id == product_id), None) if cart else None
+        if not item:
+            raise CartNotFoundError('Item not in cart')
+
+        if quantity <= 0:
+            db.session.delete(item)
+        else:
+            item.quantity = quantity
+
+        db.session.commit()
+        return self.get_cart(user_id)
+
+    def remove_item(self, user_id: int, product_id: int) -> Dict[str, Any]:
+        return self.set_quantity(user_id, product_id, 0)
+
+    def clear(self, user_id: int) -> Dict[str, Any]:
+        cart = self._load_cart(user_id)
+        if cart:
+            CartItem.query.filter_by(cart_id=cart.id).delete(synchronize_session=False)
+            db.session.commit()
+            db.session.expire(cart)
+        return self.get_cart(user_id)
+
+# Global instance
+cart_service = CartService()
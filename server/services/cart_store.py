@@ -0,0 +1,193 @@
+"""
+Redis Cart Store - Active carts as Redis hashes with write-behind persistence
+Enabled with CART_STORAGE=redis; reuses the Redis connection from GroqAIService
+"""
+import os
+from typing import Dict, Any, List
+from sqlalchemy.orm import lazyload
+from models import db, User, Product, Cart, CartItem
+from services.cart_service import cart_service, CartNotFoundError
+from services.groq_ai_service import groq_service
+from services.write_behind import WriteBehindWorker
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOADED_FIELD = '_loaded'
+
+class RedisCartStore:
+    """Cart operations served from Redis hashes (product_id -> quantity), flushed to Postgres in batches"""
+
+    def __init__(self, redis_client=None, ttl_seconds: int = 7 * 86400, flush_batch_size: int = 500):
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.flush_batch_size = flush_batch_size
+        self.dirty_key = 'cart:dirty'
+
+    def is_enabled(self) -> bool:
+        return os.getenv('CART_STORAGE', 'database').lower() == 'redis' and self.redis_client is not None
+
+    def _key(self, user_id: int) -> str:
+        return f"cart:{user_id}"
+
+    def _hydrate(self, user_id: int, quantities: Dict[str, str]) -> Dict[int, int]:
+        """
+        Merge the persisted cart into a hash that has no load marker yet.
+        HSETNX on the marker makes sure only one request performs the merge.
+        """
+        key = self._key(user_id)
+        if self.redis_client.hsetnx(key, LOADED_FIELD, 1):
+            pipe = self.redis_client.pipeline(transaction=False)
+            for product_id, quantity in cart_service.load_quantities(user_id).items():
+                pipe.hincrby(key, product_id, quantity)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.hgetall(key)
+            quantities = pipe.execute()[-1]
+        return self._parse(quantities)
+
+    def _parse(self, raw: Dict[str, str]) -> Dict[int, int]:
+        return {
+            int(field): int(value)
+            for field, value in raw.items()
+            if field != LOADED_FIELD and int(value) > 0
+        }
+
+    def _mutate(self, user_id: int, commands) -> Dict[int, int]:
+        """Apply commands, mark the cart dirty and read it back in a single pipelined round trip"""
+        key = self._key(user_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        commands(pipe, key)
+        pipe.sadd(self.dirty_key, user_id)
+        pipe.expire(key, self.ttl_seconds)
+        pipe.hgetall(key)
+        raw = pipe.execute()[-1]
+        if LOADED_FIELD not in raw:
+            return self._hydrate(user_id, raw)
+        return self._parse(raw)
+
+    def _serialize(self, user_id: int, quantities: Dict[int, int]) -> Dict[str, Any]:
+        products = {
+            p.id: p for p in Product.query.filter(Product.id.in_(list(quantities))).all()
+        } if quantities else {}
+
+        items = [{
+            'product_id': product_id,
+            'name': products[product_id].name,
+            'price': products[product_id].price,
+            'image_url': products[product_id].image_url,
+            'quantity': quantity,
+            'line_total': round(products[product_id].price * quantity, 2)
+        } for product_id, quantity in sorted(quantities.items()) if product_id in products]
+
+        return {
+            'cart_id': None,
+            'user_id': user_id,
+            'items': items,
+            'subtotal': round(sum(i['line_total'] for i in items), 2),
+            'item_count': sum(i['quantity'] for i in items)
+        }
+
+    def get_cart(self, user_id: int) -> Dict[str, Any]:
+        raw = self.redis_client.hgetall(self._key(user_id))
+        quantities = self._hydrate(user_id, raw) if LOADED_FIELD not in raw else self._parse(raw)
+        return self._serialize(user_id, quantities)
+
+    def add_item(self, user_id: int, product_id: int, quantity: int = 1) -> Dict[str, Any]:
+        if db.session.query(Product.id).filter_by(id=product_id).first() is None:
+            raise CartNotFoundError('Product not found')
+        quantities = self._mutate(user_id, lambda pipe, key: pipe.hincrby(key, product_id, quantity))
+        return self._serialize(user_id, quantities)
+
+    def set_quantity(self, user_id: int, product_id: int, quantity: int) -> Dict[str, Any]:
+        raw = self.redis_client.hgetall(self._key(user_id))
+        current = self._hydrate(user_id, raw) if LOADED_FIELD not in raw else self._parse(raw)
+        if product_id not in current:
+            raise CartNotFoundError('Item not in cart')
+
+        if quantity <= 0:
+            quantities = self._mutate(user_id, lambda pipe, key: pipe.hdel(key, product_id))
+        else:
+            quantities = self._mutate(user_id, lambda pipe, key: pipe.hset(key, product_id, quantity))
+        return self._serialize(user_id, quantities)
+
+    def remove_item(self, user_id: int, product_id: int) -> Dict[str, Any]:
+        return self.set_quantity(user_id, product_id, 0)
+
+    def clear(self, user_id: int) -> Dict[str, Any]:
+        def commands(pipe, key):
+            pipe.delete(key)
+            pipe.hset(key, LOADED_FIELD, 1)
+        return self._serialize(user_id, self._mutate(user_id, commands))
+
+    def flush(self) -> int:
+        """Persist dirty carts to Postgres, one transaction per batch of users"""
+        written = 0
+        while True:
+            user_ids = [int(u) for u in self.redis_client.spop(self.dirty_key, self.flush_batch_size) or []]
+            if not user_ids:
+                return written
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.hgetall(self._key(user_id))
+            snapshots = dict(zip(user_ids, pipe.execute()))
+
+            try:
+                written += self._persist(snapshots)
+            except Exception as e:
+                db.session.rollback()
+                self.redis_client.sadd(self.dirty_key, *user_ids)
+                logger.error(f"Cart write-behind flush failed, requeued {len(user_ids)} carts: {e}")
+                return written
+
+            if len(user_ids) < self.flush_batch_size:
+                return written
+
+    def _persist(self, snapshots: Dict[int, Dict[str, str]]) -> int:
+        """Replace the items of each user's cart with the Redis contents"""
+        # A hash that has expired or was never hydrated carries no authoritative state
+        snapshots = {u: raw for u, raw in snapshots.items() if LOADED_FIELD in raw}
+        if not snapshots:
+            return 0
+
+        user_ids = list(snapshots)
+        carts = {}
+        for cart in Cart.query.options(lazyload(Cart.items)).filter(Cart.user_id.in_(user_ids)).order_by(Cart.id.desc()).all():
+            carts[cart.user_id] = cart  # lowest id wins, matching CartService
+
+        missing = [u for u in user_ids if u not in carts]
+        if missing:
+            existing_users = {uid for (uid,) in db.session.query(User.id).filter(User.id.in_(missing)).all()}
+            for user_id in existing_users:
+                carts[user_id] = Cart(user_id=user_id)
+                db.session.add(carts[user_id])
+            db.session.flush()
+
+        quantities = {u: self._parse(raw) for u, raw in snapshots.items() if u in carts}
+        product_ids = {pid for q in quantities.values() for pid in q}
+        known_products = {
+            pid for (pid,) in db.session.query(Product.id).filter(Product.id.in_(list(product_ids))).all()
+        } if product_ids else set()
+
+        CartItem.query.filter(
+            CartItem.cart_id.in_([carts[u].id for u in quantities])
+        ).delete(synchronize_session=False)
+
+        items: List[CartItem] = [
+            CartItem(cart_id=carts[user_id].id, product_id=product_id, quantity=quantity)
+            for user_id, cart_quantities in quantities.items()
+            for product_id, quantity in cart_quantities.items()
+            if product_id in known_products
+        ]
+        db.session.add_all(items)
+        db.session.commit()
+        return len(quantities)
+
+# Global instances
+redis_cart_store = RedisCartStore(groq_service.redis_client)
+cart_writer = WriteBehindWorker('carts', redis_cart_store.flush,
+                                interval=float(os.getenv('CART_FLUSH_INTERVAL_SECONDS', '5')))
+
+def active_cart_store():
+    """Redis store when CART_STORAGE=redis and Redis is reachable, otherwise the database"""
+    return redis_cart_store if redis_cart_store.is_enabled() else cart_service
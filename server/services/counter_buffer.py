@@ -0,0 +1,119 @@
+"""
+Counter Buffer - Hot counter columns incremented in Redis or memory and flushed in batched UPDATEs
+Serves AIGeneratedContent.usage_count and SEOMetadata impressions/clicks without a write per read
+"""
+import os
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, Tuple
+from sqlalchemy import case, func, update
+from models import db, AIGeneratedContent, SEOMetadata
+from services.groq_ai_service import groq_service
+from services.write_behind import WriteBehindWorker
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CounterBuffer:
+    """
+    Accumulates increments per (row id, column) with HINCRBY, or in a dict without Redis.
+    Each flush writes them in one UPDATE per chunk of rows:
+    SET col = col + CASE id WHEN 1 THEN 3 WHEN 7 THEN 1 ... END WHERE id IN (...)
+    """
+
+    def __init__(self, name: str, model, columns: Iterable[str], redis_client=None, flush_chunk_size: int = 500):
+        self.name = name
+        self.model = model
+        self.columns = tuple(columns)
+        self.redis_client = redis_client
+        self.flush_chunk_size = flush_chunk_size
+        self.key = f"counters:{name}"
+        self.worker = WriteBehindWorker(f"counters-{name}", self.flush,
+                                        interval=float(os.getenv('COUNTER_FLUSH_INTERVAL_SECONDS', '10')))
+        self._pending: Dict[Tuple[int, str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Start flushing to the app's database"""
+        self.worker.init_app(app)
+
+    def incr(self, row_id: int, column: str = None, amount: int = 1) -> int:
+        """
+        Count amount against a row's column (the first column by default). Returns the increments
+        pending for it, to add to the stored value when reporting the count back.
+        """
+        column = column or self.columns[0]
+        if column not in self.columns:
+            raise ValueError(f"{column} is not a buffered counter of {self.model.__tablename__}")
+        if self.redis_client is not None:
+            try:
+                return self.redis_client.hincrby(self.key, f"{row_id}:{column}", amount)
+            except Exception as e:
+                logger.warning(f"Redis counters unavailable, counting {self.name} in memory: {e}")
+        with self._lock:
+            self._pending[(row_id, column)] += amount
+            return self._pending[(row_id, column)]
+
+    def _take(self) -> Dict[Tuple[int, str], int]:
+        """Swap out everything buffered: the memory counts, and the Redis hash renamed away atomically"""
+        with self._lock:
+            counts, self._pending = dict(self._pending), defaultdict(int)
+        redis_counts = {}
+        if self.redis_client is not None:
+            flushing_key = f"{self.key}:flushing:{uuid.uuid4().hex}"
+            try:
+                if self.redis_client.exists(self.key):
+                    self.redis_client.rename(self.key, flushing_key)
+                    redis_counts = self.redis_client.hgetall(flushing_key)
+                    self.redis_client.delete(flushing_key)
+            except Exception as e:
+                logger.warning(f"Could not read Redis counters for {self.name}: {e}")
+        for field, amount in redis_counts.items():
+            row_id, column = field.rsplit(':', 1)
+            counts[(int(row_id), column)] = counts.get((int(row_id), column), 0) + int(amount)
+        return counts
+
+    def _put_back(self, counts: Dict[Tuple[int, str], int]):
+        """Keep increments from a failed flush for the next one (in memory, even if they came from Redis)"""
+        with self._lock:
+            for key, amount in counts.items():
+                self._pending[key] += amount
+
+    def flush(self) -> int:
+        """Write all buffered increments, returning the number of rows updated"""
+        counts = self._take()
+        counts = {key: amount for key, amount in counts.items() if amount}
+        if not counts:
+            return 0
+
+        by_row: Dict[int, Dict[str, int]] = defaultdict(dict)
+        for (row_id, column), amount in counts.items():
+            by_row[row_id][column] = amount
+        row_ids = sorted(by_row)  # a stable order keeps concurrent flushes from deadlocking
+        pk = self.model.id
+        try:
+            for start in range(0, len(row_ids), self.flush_chunk_size):
+                chunk = row_ids[start:start + self.flush_chunk_size]
+                values = {}
+                for column in self.columns:
+                    deltas = {row_id: by_row[row_id][column] for row_id in chunk if column in by_row[row_id]}
+                    if deltas:
+                        col = getattr(self.model, column)
+                        values[column] = func.coalesce(col, 0) + case(deltas, value=pk, else_=0)
+                if 'updated_at' in self.model.__table__.c:
+                    # A count is not an edit: keep updated_at, which freshness reads as the generation time
+                    values['updated_at'] = self.model.updated_at
+                db.session.execute(
+                    update(self.model).where(pk.in_(chunk)).values(values).execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._put_back(counts)
+            raise
+        return len(row_ids)
+
+# Global instances
+ai_content_counters = CounterBuffer('ai_content', AIGeneratedContent, ['usage_count'], groq_service.redis_client)
+seo_counters = CounterBuffer('seo_metadata', SEOMetadata, ['impressions', 'clicks'], groq_service.redis_client)
@@ -4,10 +4,23 @@ Groq AI Service - Server-side AI content generation with analytics and caching
 import os
 import json
 import time
+import asyncio
+from contextlib import aclosing
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
-from groq import Groq
 from flask import current_app
+from services.ai_cache import TwoTierCache, content_hash_key
+from services.single_flight import SingleFlight
+from services.ai_runtime import gather_bounded
+from services.token_budget import TokenBudget, BudgetExceededError
+from services.ai_resilience import ResilientCaller, CircuitOpenError
+from services.ai_streaming import CompletionStream
+from services.groq_client import create_groq_client
+from services.model_registry import model_router, cost_cents
+from services.ai_output import StructuredOutputParser, MetaTags, PackedMetaTags
+from services.ai_usage_sink import AIUsageSink
+from sqlalchemy import case, func
+from models import db, AIUsageAnalytics
 try:
     import redis
 except ImportError:
@@ -18,27 +31,40 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# AIUsageAnalytics.request_type of each completion endpoint
+REQUEST_TYPES = {
+    'generate_product_meta_tags': 'meta_tags',
+    'generate_product_meta_tags_batch': 'meta_tags',
+    'generate_category_meta_tags': 'meta_tags',
+    'generate_product_description': 'product_description',
+}
+
 class GroqAIService:
     """Server-side Groq AI service with caching, analytics, and error handling"""
     
     def __init__(self):
         self.client = None
         self.redis_client = None
+        self.cache = TwoTierCache()
+        self.single_flight = SingleFlight()
+        self.token_budget = TokenBudget()
+        self.resilience = ResilientCaller()
+        self.output_parser = StructuredOutputParser()
+        self.usage_sink = AIUsageSink()
         self.initialize_clients()
     
     def initialize_clients(self):
         """Initialize Groq and Redis clients"""
         try:
-            # Initialize Groq client
-            api_key = os.getenv('GROQ_API_KEY')
-            if not api_key:
+            # Initialize Groq client (async; all calls run on the shared AI runtime loop).
+            # Retries and timeouts are handled by self.resilience, not the SDK.
+            self.client = create_groq_client(timeout=self.resilience.attempt_timeout)
+            if self.client is None:
                 logger.warning("GROQ_API_KEY not found in environment variables")
-                return
-            
-            self.client = Groq(api_key=api_key)
-            logger.info("Groq client initialized successfully")
+            else:
+                logger.info("Groq client initialized successfully")
             
-            # Initialize Redis for caching (optional)
+            # Initialize Redis for caching (optional, shared with other services)
             if redis is None:
                 logger.warning("Redis package not installed, using memory cache")
                 self.redis_client = None
@@ -58,136 +84,311 @@ class GroqAIService:
                 except Exception as e:
                     logger.warning(f"Redis not available, using memory cache: {e}")
                     self.redis_client = None
+            
+            # Memory tier always on; Redis behind it when reachable
+            self.cache = TwoTierCache(self.redis_client)
+            self.single_flight = SingleFlight(self.redis_client)
+            self.token_budget = TokenBudget(self.redis_client)
+            self.usage_sink.redis_client = self.redis_client
                 
         except Exception as e:
             logger.error(f"Failed to initialize AI service: {e}")
     
     def is_available(self) -> bool:
-        """Check if AI service is available"""
-        return self.client is not None
+        """Check if AI service is available (configured, and the circuit breaker is not open)"""
+        return self.client is not None and not self.resilience.breaker.is_open()
     
-    def _get_cache_key(self, content_type: str, identifier: str) -> str:
-        """Generate cache key for content"""
-        return f"ai:{content_type}:{identifier}"
+    def _get_cache_key(self, content_type: str, prompt: str, params: Dict[str, Any]) -> str:
+        """
+        Generate cache key from the rendered prompt and completion parameters.
+        The routed model is left out, so a route change still hits content cached under another model.
+        """
+        return content_hash_key(content_type, prompt, {k: v for k, v in params.items() if k != 'model'})
     
-    def _get_cached_content(self, cache_key: str) -> Optional[Dict]:
-        """Get cached AI content"""
-        if not self.redis_client:
+    def _as_cache_hit(self, cached: Optional[Dict]) -> Optional[Dict]:
+        """A cached result as served to this request: nothing was spent, so it reports no tokens or cost"""
+        if cached is None:
             return None
-        
-        try:
-            cached = self.redis_client.get(cache_key)
-            if cached:
-                return json.loads(cached)
-        except Exception as e:
-            logger.warning(f"Cache read error: {e}")
-        return None
+        return {**cached, 'cached': True, 'tokens_used': 0, 'cost_cents': 0.0}
     
-    def _cache_content(self, cache_key: str, content: Dict, ttl: int = 86400):
-        """Cache AI content (default 24 hours)"""
-        if not self.redis_client:
+    async def _get_cached_content(self, cache_key: str) -> Optional[Dict]:
+        """Get cached AI content from the memory tier, then Redis (off the event loop)"""
+        return self._as_cache_hit(await self.cache.aget(cache_key))
+    
+    async def _cache_content(self, cache_key: str, content: Dict, ttl: int = 86400):
+        """Cache AI content (default 24 hours); results patched with defaults are not cached, so the next request retries"""
+        if content.get('defaulted_fields'):
             return
-        
+        await self.cache.aset(cache_key, content, ttl)
+    
+    async def _complete(self, endpoint: str, prompt: str, params: Dict[str, Any], client=None,
+                        deadline: Optional[float] = None):
+        """
+        Send one chat completion inside the token budget: the estimated cost is reserved up front
+        (BudgetExceededError if that would overflow a budget) and settled to actual usage afterwards.
+        The request runs under a deadline (the resilience default unless given) with retries;
+        CircuitOpenError while Groq is failing.
+        """
+        reservation = await self.token_budget.areserve(endpoint, prompt, params['max_tokens'])
+        completion = None
+        start = time.monotonic()
         try:
-            self.redis_client.setex(
-                cache_key, 
-                ttl, 
-                json.dumps(content, default=str)
-            )
-        except Exception as e:
-            logger.warning(f"Cache write error: {e}")
+            completion = await self.resilience.call(lambda: (client or self.client).chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                **params
+            ), deadline=deadline)
+            model_router.record(params['model'], int((time.monotonic() - start) * 1000), True)
+            return completion
+        except CircuitOpenError:
+            raise
+        except Exception:
+            # Feeds the router's success rate, so a failing model gets routed around
+            model_router.record(params['model'], int((time.monotonic() - start) * 1000), False)
+            raise
+        finally:
+            usage = getattr(completion, 'usage', None)
+            await self.token_budget.asettle(reservation, usage.total_tokens if usage else 0)
+    
+    def _params(self, task: str, prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """Completion parameters with the model the router picks for this task and prompt"""
+        model = model_router.choose(task, self.token_budget.estimate_tokens(prompt), max_tokens)
+        return {'model': model, 'temperature': temperature, 'max_tokens': max_tokens}
     
-    async def generate_product_meta_tags(self, product_data: Dict) -> Dict[str, Any]:
-        """Generate SEO-optimized meta tags for products"""
+    def stream_completion(self, endpoint: str, prompt: str, params: Dict[str, Any], client=None) -> CompletionStream:
+        """A streamed chat completion with the same budget and resilience handling as _complete"""
+        return CompletionStream(self, endpoint, prompt, params, client=client)
+    
+    async def generate_product_meta_tags(self, product_data: Dict, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Generate SEO-optimized meta tags for products (deadline bounds the completion, retries included)"""
         if not self.is_available():
             return self._get_fallback_meta_tags(product_data)
         
-        # Check cache first
-        cache_key = self._get_cache_key("meta_tags", f"product_{product_data.get('id')}")
-        cached = self._get_cached_content(cache_key)
+        prompt = self._build_product_meta_prompt(product_data)
+        params = self._params('meta_tags', prompt, 0.3, 500)
+        
+        # Check cache first; the key changes whenever the product fields in the prompt change
+        cache_key = self._get_cache_key("meta_tags", prompt, params)
+        cached = await self._get_cached_content(cache_key)
         if cached:
             logger.info(f"Cache hit for product meta tags: {product_data.get('id')}")
             return cached
         
+        # Concurrent requests for the same key wait on one generation (across workers too)
+        return await self.single_flight.do(
+            cache_key,
+            lambda: self._generate_product_meta_tags(product_data, prompt, params, cache_key, deadline),
+            lookup=lambda: self._as_cache_hit(self.cache.get(cache_key))
+        )
+    
+    async def _generate_product_meta_tags(self, product_data: Dict, prompt: str, params: Dict[str, Any],
+                                          cache_key: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Call Groq for product meta tags and cache the result"""
         start_time = time.time()
         
         try:
-            prompt = self._build_product_meta_prompt(product_data)
-            
-            completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192",
-                temperature=0.3,
-                max_tokens=500
-            )
+            completion = await self._complete('generate_product_meta_tags', prompt, params, deadline=deadline)
             
             response_time = int((time.time() - start_time) * 1000)
-            response_text = completion.choices[0].message.content.strip()
             
-            # Parse JSON response
-            try:
-                meta_data = json.loads(response_text)
-            except json.JSONDecodeError:
-                logger.warning("Failed to parse AI response as JSON, using fallback")
+            # Repair what we can; fields still missing come from the fallback rather than a new call
+            meta_data = self.output_parser.parse(MetaTags, completion.choices[0].message.content,
+                                                 defaults=self._get_fallback_meta_tags(product_data))
+            if meta_data is None:
+                self._log_unparsed_usage('generate_product_meta_tags', completion, response_time, params,
+                                         'product', product_data.get('id'))
                 return self._get_fallback_meta_tags(product_data)
             
             # Add metadata
             result = {
                 **meta_data,
                 'ai_generated': True,
-                'model_used': 'llama3-8b-8192',
+                'model_used': params['model'],
                 'generation_time_ms': response_time,
                 'tokens_used': completion.usage.total_tokens,
+                'cost_cents': cost_cents(params['model'], completion.usage.prompt_tokens, completion.usage.completion_tokens),
                 'generated_at': datetime.utcnow().isoformat()
             }
             
             # Cache the result
-            self._cache_content(cache_key, result)
+            await self._cache_content(cache_key, result)
             
             # Log analytics
             self._log_ai_usage(
                 endpoint='generate_product_meta_tags',
+                entity_type='product',
+                entity_id=product_data.get('id'),
                 tokens_input=completion.usage.prompt_tokens,
                 tokens_output=completion.usage.completion_tokens,
                 response_time_ms=response_time,
-                success=True
+                success=True,
+                model=params['model']
             )
             
             logger.info(f"Generated meta tags for product {product_data.get('id')} in {response_time}ms")
             return result
             
+        except BudgetExceededError as e:
+            return self.token_budget.over_budget(e, self._get_fallback_meta_tags(product_data))
+        except CircuitOpenError:
+            return self._get_fallback_meta_tags(product_data)
         except Exception as e:
             logger.error(f"AI generation failed: {e}")
             self._log_ai_usage(
                 endpoint='generate_product_meta_tags',
+                entity_type='product',
+                entity_id=product_data.get('id'),
                 success=False,
-                error_message=str(e)
+                error_message=str(e),
+                model=params['model']
             )
             return self._get_fallback_meta_tags(product_data)
     
+    async def generate_product_meta_tags_batch(self, products_data: List[Dict], pack_size: Optional[int] = None,
+                                               concurrency: int = 5,
+                                               timeout: Optional[float] = None) -> Dict[Any, Dict[str, Any]]:
+        """
+        Meta tags for many products, packing several into each chat completion.
+        Results are keyed by product id and cached under the same keys as single requests;
+        products that fail are left out of the returned dict. timeout bounds each completion
+        (a split or retried pack gets a fresh one), not the whole pack.
+        """
+        if not self.is_available():
+            return {data.get('id'): self._get_fallback_meta_tags(data) for data in products_data}
+        
+        pack_size = max(1, pack_size or int(os.getenv('AI_META_PACK_SIZE', '10')))
+        results, misses = {}, []
+        for data in products_data:
+            prompt = self._build_product_meta_prompt(data)
+            params = self._params('meta_tags', prompt, 0.3, 500)
+            cache_key = self._get_cache_key("meta_tags", prompt, params)
+            cached = await self._get_cached_content(cache_key)
+            if cached:
+                results[data.get('id')] = cached
+            else:
+                misses.append((data, cache_key))
+        
+        packs = [misses[i:i + pack_size] for i in range(0, len(misses), pack_size)]
+        outcomes = await gather_bounded(
+            [lambda pack=pack: self._generate_packed_meta_tags(pack, timeout) for pack in packs],
+            concurrency=concurrency
+        )
+        for pack, outcome in zip(packs, outcomes):
+            if outcome['ok']:
+                results.update(outcome['result'])
+            else:
+                logger.error(f"Packed meta tag generation failed for {len(pack)} products: {outcome['error']}")
+        
+        return results
+    
+    async def _generate_packed_meta_tags(self, pack: List[tuple],
+                                         deadline: Optional[float] = None) -> Dict[Any, Dict[str, Any]]:
+        """
+        One completion for a pack of (product_data, cache_key) pairs. An unparseable response splits
+        the pack in half; items missing or invalid in a good response are retried one by one, and
+        the products cut off from a truncated response are retried as a smaller pack.
+        """
+        if len(pack) == 1:
+            data, _ = pack[0]
+            result = await self.generate_product_meta_tags(data, deadline)
+            return {data.get('id'): result} if result.get('ai_generated') else {}
+        
+        prompt = self._build_packed_meta_prompt([data for data, _ in pack])
+        # ~90 output tokens per product plus room for the array syntax
+        params = self._params('meta_tags_batch', prompt, 0.3, min(8000, 120 * len(pack) + 100))
+        start_time = time.time()
+        
+        try:
+            completion = await self._complete('generate_product_meta_tags_batch', prompt, params, deadline=deadline)
+            response_time = int((time.time() - start_time) * 1000)
+            items = self.output_parser.parse_list(PackedMetaTags, completion.choices[0].message.content)
+        except (BudgetExceededError, CircuitOpenError):
+            # Leave the pack unfilled rather than splitting into more refused requests
+            raise
+        except Exception as e:
+            logger.warning(f"Packed meta tag request for {len(pack)} products failed: {e}")
+            items = None
+        
+        if not items:
+            # Malformed as a whole, or truncated before the first product: halve and try again
+            middle = len(pack) // 2
+            left, right = await asyncio.gather(
+                self._generate_packed_meta_tags(pack[:middle], deadline),
+                self._generate_packed_meta_tags(pack[middle:], deadline)
+            )
+            return {**left, **right}
+        
+        self._log_ai_usage(
+            endpoint='generate_product_meta_tags_batch',
+            tokens_input=completion.usage.prompt_tokens,
+            tokens_output=completion.usage.completion_tokens,
+            response_time_ms=response_time,
+            success=True,
+            model=params['model']
+        )
+        
+        by_id = {str(item['id']): item for item in items}
+        tokens_each = round(completion.usage.total_tokens / len(pack))
+        cost_each = cost_cents(params['model'], completion.usage.prompt_tokens, completion.usage.completion_tokens) / len(pack)
+        results, retry = {}, []
+        for data, cache_key in pack:
+            item = by_id.get(str(data.get('id')))
+            if not item:
+                retry.append((data, cache_key))
+                continue
+            result = {
+                'title': item['title'],
+                'description': item['description'],
+                'keywords': item['keywords'],
+                'ai_generated': True,
+                'model_used': params['model'],
+                'generation_time_ms': response_time,
+                'tokens_used': tokens_each,
+                'cost_cents': cost_each,
+                'generated_at': datetime.utcnow().isoformat()
+            }
+            await self._cache_content(cache_key, result)
+            results[data.get('id')] = result
+        
+        if retry and len(retry) < len(pack) and completion.choices[0].finish_reason == 'length':
+            logger.info(f"Repacking {len(retry)} of {len(pack)} meta tag items cut off by max_tokens")
+            results.update(await self._generate_packed_meta_tags(retry, deadline))
+        elif retry:
+            logger.info(f"Retrying {len(retry)} of {len(pack)} packed meta tag items individually")
+            retried = await asyncio.gather(*(self._generate_packed_meta_tags([entry], deadline) for entry in retry))
+            for partial in retried:
+                results.update(partial)
+        
+        return results
+    
     async def generate_product_description(self, product_data: Dict) -> Dict[str, Any]:
         """Generate AI-enhanced product descriptions"""
         if not self.is_available():
             return self._get_fallback_description(product_data)
         
-        # Check cache first
-        cache_key = self._get_cache_key("description", f"product_{product_data.get('id')}")
-        cached = self._get_cached_content(cache_key)
+        prompt = self._build_product_description_prompt(product_data)
+        params = self._params('description', prompt, 0.7, 800)
+        
+        # Check cache first; the key changes whenever the product fields in the prompt change
+        cache_key = self._get_cache_key("description", prompt, params)
+        cached = await self._get_cached_content(cache_key)
         if cached:
             logger.info(f"Cache hit for product description: {product_data.get('id')}")
             return cached
         
+        # Concurrent requests for the same key wait on one generation (across workers too)
+        return await self.single_flight.do(
+            cache_key,
+            lambda: self._generate_product_description(product_data, prompt, params, cache_key),
+            lookup=lambda: self._as_cache_hit(self.cache.get(cache_key))
+        )
+    
+    async def _generate_product_description(self, product_data: Dict, prompt: str, params: Dict[str, Any],
+                                            cache_key: str) -> Dict[str, Any]:
+        """Call Groq for a product description and cache the result"""
         start_time = time.time()
         
         try:
-            prompt = self._build_product_description_prompt(product_data)
-            
-            completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192",
-                temperature=0.7,
-                max_tokens=800
-            )
+            completion = await self._complete('generate_product_description', prompt, params)
             
             response_time = int((time.time() - start_time) * 1000)
             ai_description = completion.choices[0].message.content.strip()
@@ -196,102 +397,201 @@ class GroqAIService:
                 'original_description': product_data.get('description', ''),
                 'ai_description': ai_description,
                 'ai_generated': True,
-                'model_used': 'llama3-8b-8192',
+                'model_used': params['model'],
                 'generation_time_ms': response_time,
                 'tokens_used': completion.usage.total_tokens,
+                'cost_cents': cost_cents(params['model'], completion.usage.prompt_tokens, completion.usage.completion_tokens),
                 'generated_at': datetime.utcnow().isoformat()
             }
             
             # Cache the result
-            self._cache_content(cache_key, result)
+            await self._cache_content(cache_key, result)
             
             # Log analytics
             self._log_ai_usage(
                 endpoint='generate_product_description',
+                entity_type='product',
+                entity_id=product_data.get('id'),
                 tokens_input=completion.usage.prompt_tokens,
                 tokens_output=completion.usage.completion_tokens,
                 response_time_ms=response_time,
-                success=True
+                success=True,
+                model=params['model']
             )
             
             logger.info(f"Generated description for product {product_data.get('id')} in {response_time}ms")
             return result
             
+        except BudgetExceededError as e:
+            return self.token_budget.over_budget(e, self._get_fallback_description(product_data))
+        except CircuitOpenError:
+            return self._get_fallback_description(product_data)
         except Exception as e:
             logger.error(f"AI generation failed: {e}")
             self._log_ai_usage(
                 endpoint='generate_product_description',
+                entity_type='product',
+                entity_id=product_data.get('id'),
                 success=False,
-                error_message=str(e)
+                error_message=str(e),
+                model=params['model']
             )
             return self._get_fallback_description(product_data)
     
+    async def stream_product_description(self, product_data: Dict):
+        """
+        Like generate_product_description, but yields ('token', text) while the completion streams
+        and finally ('done', result). Cache hits and fallbacks arrive as a single 'done', whose
+        result is authoritative. Streams are not coalesced; the result is cached under the same key.
+        """
+        if not self.is_available():
+            yield 'done', self._get_fallback_description(product_data)
+            return
+        
+        prompt = self._build_product_description_prompt(product_data)
+        params = self._params('description', prompt, 0.7, 800)
+        cache_key = self._get_cache_key("description", prompt, params)
+        cached = await self._get_cached_content(cache_key)
+        if cached:
+            yield 'done', cached
+            return
+        
+        start_time = time.time()
+        stream = self.stream_completion('generate_product_description', prompt, params)
+        try:
+            # aclosing: a client that disconnects mid-stream closes the upstream request too
+            async with aclosing(stream.chunks()) as chunks:
+                async for text in chunks:
+                    yield 'token', text
+        except BudgetExceededError as e:
+            yield 'done', self.token_budget.over_budget(e, self._get_fallback_description(product_data))
+            return
+        except CircuitOpenError:
+            yield 'done', self._get_fallback_description(product_data)
+            return
+        except Exception as e:
+            logger.error(f"AI streaming generation failed: {e}")
+            self._log_ai_usage(
+                endpoint='generate_product_description',
+                entity_type='product',
+                entity_id=product_data.get('id'),
+                success=False,
+                error_message=str(e),
+                model=params['model']
+            )
+            yield 'done', self._get_fallback_description(product_data)
+            return
+        
+        response_time = int((time.time() - start_time) * 1000)
+        result = {
+            'original_description': product_data.get('description', ''),
+            'ai_description': stream.text.strip(),
+            'ai_generated': True,
+            'model_used': params['model'],
+            'generation_time_ms': response_time,
+            'tokens_used': stream.total_tokens,
+            'cost_cents': cost_cents(params['model'], stream.prompt_tokens, stream.completion_tokens),
+            'generated_at': datetime.utcnow().isoformat()
+        }
+        await self._cache_content(cache_key, result)
+        self._log_ai_usage(
+            endpoint='generate_product_description',
+            entity_type='product',
+            entity_id=product_data.get('id'),
+            tokens_input=stream.prompt_tokens,
+            tokens_output=stream.completion_tokens,
+            response_time_ms=response_time,
+            success=True,
+            model=params['model']
+        )
+        logger.info(f"Streamed description for product {product_data.get('id')} in {response_time}ms")
+        yield 'done', result
+    
     async def generate_category_meta_tags(self, category_data: Dict) -> Dict[str, Any]:
         """Generate SEO-optimized meta tags for category pages"""
         if not self.is_available():
             return self._get_fallback_category_meta(category_data)
         
-        cache_key = self._get_cache_key("meta_tags", f"category_{category_data.get('id')}")
-        cached = self._get_cached_content(cache_key)
+        prompt = self._build_category_meta_prompt(category_data)
+        params = self._params('category_meta', prompt, 0.3, 400)
+        
+        cache_key = self._get_cache_key("category_meta_tags", prompt, params)
+        cached = await self._get_cached_content(cache_key)
         if cached:
             return cached
         
+        # Concurrent requests for the same key wait on one generation (across workers too)
+        return await self.single_flight.do(
+            cache_key,
+            lambda: self._generate_category_meta_tags(category_data, prompt, params, cache_key),
+            lookup=lambda: self._as_cache_hit(self.cache.get(cache_key))
+        )
+    
+    async def _generate_category_meta_tags(self, category_data: Dict, prompt: str, params: Dict[str, Any],
+                                           cache_key: str) -> Dict[str, Any]:
+        """Call Groq for category meta tags and cache the result"""
         start_time = time.time()
         
         try:
-            prompt = f"""Generate SEO-optimized meta tags for this e-commerce category page:
-
-Category Name: {category_data.get('name', 'Category')}
-Description: {category_data.get('description', 'Premium products')}
-Store: Myjamii Store
-
-Generate a JSON response with:
-1. title (50-60 characters, include "Myjamii Store")
-2. description (150-160 characters, compelling category description)
-3. keywords (8-10 relevant keywords for this category)
-
-Focus on e-commerce SEO best practices and category-specific terms.
-Return only valid JSON format."""
-
-            completion = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192",
-                temperature=0.3,
-                max_tokens=400
-            )
+            completion = await self._complete('generate_category_meta_tags', prompt, params)
             
             response_time = int((time.time() - start_time) * 1000)
-            response_text = completion.choices[0].message.content.strip()
             
-            try:
-                meta_data = json.loads(response_text)
-            except json.JSONDecodeError:
+            meta_data = self.output_parser.parse(MetaTags, completion.choices[0].message.content,
+                                                 defaults=self._get_fallback_category_meta(category_data))
+            if meta_data is None:
+                self._log_unparsed_usage('generate_category_meta_tags', completion, response_time, params,
+                                         'category', category_data.get('id'))
                 return self._get_fallback_category_meta(category_data)
             
             result = {
                 **meta_data,
                 'ai_generated': True,
-                'model_used': 'llama3-8b-8192',
+                'model_used': params['model'],
                 'generation_time_ms': response_time,
                 'tokens_used': completion.usage.total_tokens,
+                'cost_cents': cost_cents(params['model'], completion.usage.prompt_tokens, completion.usage.completion_tokens),
                 'generated_at': datetime.utcnow().isoformat()
             }
             
-            self._cache_content(cache_key, result)
+            await self._cache_content(cache_key, result)
             self._log_ai_usage(
                 endpoint='generate_category_meta_tags',
+                entity_type='category',
+                entity_id=category_data.get('id'),
                 tokens_input=completion.usage.prompt_tokens,
                 tokens_output=completion.usage.completion_tokens,
                 response_time_ms=response_time,
-                success=True
+                success=True,
+                model=params['model']
             )
             
             return result
             
+        except BudgetExceededError as e:
+            return self.token_budget.over_budget(e, self._get_fallback_category_meta(category_data))
+        except CircuitOpenError:
+            return self._get_fallback_category_meta(category_data)
         except Exception as e:
             logger.error(f"AI generation failed: {e}")
             return self._get_fallback_category_meta(category_data)
     
+    def _build_category_meta_prompt(self, category_data: Dict) -> str:
+        """Build prompt for category meta tag generation"""
+        return f"""Generate SEO-optimized meta tags for this e-commerce category page:
+
+Category Name: {category_data.get('name', 'Category')}
+Description: {category_data.get('description', 'Premium products')}
+Store: Myjamii Store
+
+Generate a JSON response with:
+1. title (50-60 characters, include "Myjamii Store")
+2. description (150-160 characters, compelling category description)
+3. keywords (8-10 relevant keywords for this category)
+
+Focus on e-commerce SEO best practices and category-specific terms.
+Return only valid JSON format."""
+    
     def _build_product_meta_prompt(self, product_data: Dict) -> str:
         """Build prompt for product meta tag generation"""
         return f"""Generate SEO-optimized meta tags for this e-commerce product:
@@ -309,6 +609,26 @@ Generate a JSON response with:
 Focus on e-commerce SEO best practices and buying intent keywords.
 Return only valid JSON format."""
     
+    def _build_packed_meta_prompt(self, products_data: List[Dict]) -> str:
+        """Build one prompt covering several products; instructions are stated once"""
+        products = "\n".join(
+            f"- id: {data.get('id')} | Name: {data.get('name', 'Product')} | Category: {data.get('category', 'General')} "
+            f"| Price: ${data.get('price', '0')} | Description: {data.get('description', 'Premium quality product')}"
+            for data in products_data
+        )
+        return f"""Generate SEO-optimized meta tags for each of these e-commerce products:
+
+{products}
+
+For every product return an object with:
+1. id (the product id given above)
+2. title (50-60 characters, include "Myjamii Store")
+3. description (150-160 characters, compelling, include price and key benefits)
+4. keywords (5-8 relevant keywords separated by commas)
+
+Focus on e-commerce SEO best practices and buying intent keywords.
+Return only a valid JSON array with one object per product, in the same order."""
+    
     def _build_product_description_prompt(self, product_data: Dict) -> str:
         """Build prompt for product description generation"""
         return f"""Write an SEO-optimized e-commerce product description for:
@@ -361,39 +681,69 @@ Write an engaging product description that converts browsers to buyers."""
         }
     
     def _log_ai_usage(self, endpoint: str, tokens_input: int = 0, tokens_output: int = 0, 
-                      response_time_ms: int = 0, success: bool = True, error_message: str = None):
-        """Log AI usage for analytics (will be stored in database)"""
-        usage_data = {
-            'endpoint': endpoint,
-            'tokens_input': tokens_input,
-            'tokens_output': tokens_output,
-            'tokens_total': tokens_input + tokens_output,
-            'response_time_ms': response_time_ms,
-            'success': success,
-            'error_message': error_message,
-            'timestamp': datetime.utcnow().isoformat(),
-            'cost_estimate_cents': self._calculate_cost(tokens_input + tokens_output)
-        }
-        
-        # For now, log to console. Later we'll store in database.
-        logger.info(f"AI Usage: {json.dumps(usage_data)}")
+                      response_time_ms: int = 0, success: bool = True, error_message: str = None,
+                      model: str = None, entity_type: str = None, entity_id: int = None):
+        """Record one completion in AIUsageAnalytics through the buffered usage sink"""
+        self.usage_sink.record(
+            endpoint=endpoint,
+            request_type=REQUEST_TYPES.get(endpoint, endpoint),
+            entity_type=entity_type,
+            entity_id=entity_id,
+            tokens_input=tokens_input,
+            tokens_output=tokens_output,
+            response_time_ms=response_time_ms,
+            success=success,
+            error_message=error_message,
+            cost_cents=self._calculate_cost(tokens_input, tokens_output, model),
+            model_used=model
+        )
+    
+    def _log_unparsed_usage(self, endpoint: str, completion, response_time_ms: int, params: Dict[str, Any],
+                            entity_type: str = None, entity_id: int = None):
+        """Record the tokens spent on a completion whose output could not be used"""
+        self._log_ai_usage(
+            endpoint=endpoint,
+            entity_type=entity_type,
+            entity_id=entity_id,
+            tokens_input=completion.usage.prompt_tokens,
+            tokens_output=completion.usage.completion_tokens,
+            response_time_ms=response_time_ms,
+            success=False,
+            error_message='Unparseable structured output',
+            model=params['model']
+        )
     
-    def _calculate_cost(self, total_tokens: int) -> float:
-        """Calculate estimated cost for Groq API usage"""
-        # Groq Mixtral-8x7b pricing: $0.27 per 1M input tokens, $0.27 per 1M output tokens
-        cost_per_token = 0.27 / 1_000_000
-        return total_tokens * cost_per_token * 100  # Return in cents
+    def _calculate_cost(self, tokens_input: int, tokens_output: int = 0, model: str = None) -> float:
+        """Cost in cents at the model's pricing from the model registry"""
+        return cost_cents(model, tokens_input, tokens_output)
     
     def get_usage_stats(self, days: int = 30) -> Dict[str, Any]:
-        """Get AI usage statistics for analytics dashboard"""
-        # This will be implemented when we have database storage
+        """
+        Get AI usage statistics for analytics dashboard. Totals come from the AIUsageAnalytics rows
+        of the last `days` days (events still buffered in the usage sink are not counted yet).
+        """
+        since = datetime.utcnow() - timedelta(days=days)
+        requests, tokens, cost, successes, response_time = db.session.query(
+            func.count(AIUsageAnalytics.id),
+            func.coalesce(func.sum(AIUsageAnalytics.tokens_total), 0),
+            func.coalesce(func.sum(AIUsageAnalytics.cost_cents), 0.0),
+            func.coalesce(func.sum(case((AIUsageAnalytics.success.is_(True), 1), else_=0)), 0),
+            func.avg(AIUsageAnalytics.response_time_ms)
+        ).filter(AIUsageAnalytics.created_at >= since).one()
         return {
-            'total_requests': 0,
-            'total_tokens': 0,
-            'total_cost_cents': 0,
-            'success_rate': 100.0,
-            'avg_response_time_ms': 0,
-            'cache_hit_rate': 0,
+            'total_requests': requests,
+            'total_tokens': int(tokens),
+            'total_cost_cents': round(float(cost), 4),
+            'success_rate': round(successes / requests * 100, 2) if requests else None,
+            'avg_response_time_ms': round(float(response_time or 0)),
+            'cache_hit_rate': self.cache.stats()['hit_rate'],
+            'cache': self.cache.stats(),
+            'single_flight': self.single_flight.stats(),
+            'token_budget': self.token_budget.usage(),
+            'resilience': self.resilience.stats(),
+            'models': model_router.stats(),
+            'structured_output': self.output_parser.stats(),
+            'usage_sink': self.usage_sink.stats(),
             'period_days': days
         }
 
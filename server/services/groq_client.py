@@ -0,0 +1,136 @@
+"""
+Groq Client - Construction of the AsyncGroq clients used by the AI services
+Supports a local stand-in server (GROQ_BASE_URL) and record/replay of completions (AI_REPLAY_MODE)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from groq import AsyncGroq
+from groq.types.chat import ChatCompletion, ChatCompletionChunk
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Both AI services may record into the same cassette file
+_cassette_lock = threading.Lock()
+
+def create_groq_client(timeout: float) -> Optional[AsyncGroq]:
+    """
+    An AsyncGroq client, or None without an API key. Retries are left to the resilience layer.
+    GROQ_BASE_URL points it at another server (e.g. groq_standin.py); AI_REPLAY_MODE=record|replay
+    wraps it in a RecordReplayClient, and replay needs no API key at all.
+    """
+    replay_mode = os.getenv('AI_REPLAY_MODE', '').lower()
+    api_key = os.getenv('GROQ_API_KEY') or ('replay' if replay_mode == 'replay' else None)
+    if not api_key:
+        return None
+
+    client = AsyncGroq(api_key=api_key, base_url=os.getenv('GROQ_BASE_URL') or None,
+                       max_retries=0, timeout=timeout)
+    if replay_mode in ('record', 'replay'):
+        return RecordReplayClient(client, replay_mode, os.getenv('AI_REPLAY_FILE', 'ai_cassette.jsonl'))
+    return client
+
+
+class RecordReplayClient:
+    """
+    Stands in for AsyncGroq's chat.completions. In record mode responses from the real client are
+    appended to a JSON lines cassette; in replay mode they are served from it, keyed by a hash of
+    the messages and parameters, so benchmarks and CI runs never reach Groq.
+    """
+
+    def __init__(self, client: AsyncGroq, mode: str, path: str):
+        self.client = client
+        self.mode = mode
+        self.path = path
+        # Sleep for the recorded latency when replaying, to keep timings realistic
+        self.replay_latency = os.getenv('AI_REPLAY_LATENCY', 'true').lower() == 'true'
+        self.chat = self  # so callers can keep using client.chat.completions.create
+        self.completions = self
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry['key']] = entry
+        logger.info(f"AI {mode} mode using {path} ({len(self._entries)} recorded completions)")
+
+    def _key(self, kwargs: Dict[str, Any]) -> str:
+        request = {k: v for k, v in kwargs.items() if k not in ('stream', 'timeout')}
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _record(self, key: str, latency_ms: int, response=None, chunks: Optional[List[Any]] = None):
+        entry = {'key': key, 'latency_ms': latency_ms}
+        if chunks is not None:
+            entry['chunks'] = [chunk.model_dump(mode='json') for chunk in chunks]
+        else:
+            entry['response'] = response.model_dump(mode='json')
+        with _cassette_lock:
+            self._entries[key] = entry
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    async def create(self, **kwargs):
+        key = self._key(kwargs)
+        stream = kwargs.get('stream', False)
+
+        if self.mode == 'replay':
+            entry = self._entries.get(key)
+            if entry is None or ('chunks' in entry) != stream:
+                raise LookupError(f"No recorded {'stream' if stream else 'completion'} for request {key[:12]}")
+            if self.replay_latency:
+                await asyncio.sleep(entry['latency_ms'] / 1000)
+            if stream:
+                return _ReplayStream([ChatCompletionChunk.model_validate(c) for c in entry['chunks']])
+            return ChatCompletion.model_validate(entry['response'])
+
+        start = time.monotonic()
+        response = await self.client.chat.completions.create(**kwargs)
+        if stream:
+            return _RecordingStream(response, lambda chunks: self._record(
+                key, int((time.monotonic() - start) * 1000), chunks=chunks))
+        self._record(key, int((time.monotonic() - start) * 1000), response=response)
+        return response
+
+
+class _ReplayStream:
+    """Async iterator over recorded chunks, shaped like groq's AsyncStream"""
+
+    def __init__(self, chunks: List[ChatCompletionChunk]):
+        self._chunks = chunks
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def close(self):
+        pass
+
+
+class _RecordingStream:
+    """Passes a live stream through while collecting its chunks; records only streams read to the end"""
+
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+
+    async def _iterate(self):
+        chunks = []
+        async for chunk in self._stream:
+            chunks.append(chunk)
+            yield chunk
+        self._on_complete(chunks)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def close(self):
+        await self._stream.close()
@@ -2,13 +2,22 @@
 Intelligent AI Product Optimization Service
 Analyzes complete product context and generates custom SEO enhancements
 """
-import asyncio
 import json
 import time
+from contextlib import aclosing
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-from groq import Groq
-from models import db, Product, Category, AIGeneratedContent, SEOMetadata, AIUsageAnalytics
+from sqlalchemy import func, insert
+from models import db, Product, Category, AIGeneratedContent, SEOMetadata
+from services.ai_runtime import ai_runtime, gather_bounded
+from services.groq_ai_service import groq_service
+from services.groq_client import create_groq_client
+from services.model_registry import cost_cents
+from services.ai_output import Optimization
+from services.ai_freshness import source_hash, stored_source_hash
+from services.inventory_ledger import inventory_ledger
+from services.token_budget import BudgetExceededError
+from services.ai_resilience import CircuitOpenError
 import os
 import logging
 
@@ -24,20 +33,21 @@ class IntelligentAIOptimizer:
     def initialize_client(self):
         """Initialize Groq AI client"""
         try:
-            api_key = os.getenv('GROQ_API_KEY')
-            if not api_key:
+            # Retries and timeouts come from groq_service.resilience, shared with GroqAIService
+            self.client = create_groq_client(timeout=groq_service.resilience.attempt_timeout)
+            if self.client is None:
                 logger.warning("GROQ_API_KEY not found")
                 return
             
-            self.client = Groq(api_key=api_key)
             logger.info("Intelligent AI optimizer initialized")
         except Exception as e:
             logger.error(f"Failed to initialize AI optimizer: {e}")
     
-    async def analyze_and_optimize_product(self, product_id: int) -> Dict[str, Any]:
+    def analyze_and_optimize_product(self, product_id: int) -> Dict[str, Any]:
         """
         Comprehensive product analysis and SEO optimization
-        Reads ALL product details and creates intelligent enhancements
+        Reads ALL product details and creates intelligent enhancements.
+        Database work stays on the calling thread; only the LLM call runs on the AI runtime loop.
         """
         if not self.client:
             return {"success": False, "error": "AI client not available"}
@@ -48,45 +58,13 @@ class IntelligentAIOptimizer:
             if not product:
                 return {"success": False, "error": "Product not found"}
             
-            category = Category.query.get(product.category_id) if product.category_id else None
-            
-            # Gather market intelligence
-            similar_products = Product.query.filter(
-                Product.category_id == product.category_id,
-                Product.id != product.id
-            ).limit(5).all()
-            
             # Create comprehensive product context
-            product_context = {
-                "id": product.id,
-                "name": product.name,
-                "original_description": product.description,
-                "price": float(product.price),
-                "stock_level": product.stock,
-                "category": {
-                    "name": category.name if category else "Uncategorized",
-                    "description": category.description if category else ""
-                },
-                "market_context": {
-                    "similar_products": [
-                        {
-                            "name": p.name,
-                            "price": float(p.price),
-                            "description": p.description[:100] + "..." if len(p.description) > 100 else p.description
-                        } for p in similar_products
-                    ],
-                    "price_range": {
-                        "min": min([float(p.price) for p in similar_products]) if similar_products else float(product.price),
-                        "max": max([float(p.price) for p in similar_products]) if similar_products else float(product.price),
-                        "average": sum([float(p.price) for p in similar_products]) / len(similar_products) if similar_products else float(product.price)
-                    }
-                }
-            }
+            product_context = self.load_product_context(product)
             
             start_time = time.time()
             
             # Generate intelligent optimization
-            optimization_result = await self._generate_intelligent_optimization(product_context)
+            optimization_result = ai_runtime.run(self._generate_intelligent_optimization(product_context))
             
             processing_time = int((time.time() - start_time) * 1000)
             
@@ -97,7 +75,7 @@ class IntelligentAIOptimizer:
             
             if optimization_result:
                 # Save to database
-                await self._save_optimization_results(product, optimization_result, processing_time)
+                self.save_optimization_results(product, optimization_result, processing_time)
                 
                 return {
                     "success": True,
@@ -110,15 +88,55 @@ class IntelligentAIOptimizer:
             
             return {"success": False, "error": "Failed to generate optimization"}
             
+        except (BudgetExceededError, CircuitOpenError):
+            # No fallback optimization exists, so let the route answer 429/503
+            raise
         except Exception as e:
             logger.error(f"Product optimization failed: {e}")
             return {"success": False, "error": str(e)}
     
-    async def _generate_intelligent_optimization(self, product_context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Generate intelligent SEO optimization based on complete product analysis"""
-        
-        # Create sophisticated prompt with market intelligence
-        prompt = f"""You are an expert e-commerce SEO specialist and product marketing analyst. 
+    def load_product_context(self, product: Product) -> Dict[str, Any]:
+        """Product context with its category and up to five similar products as market intelligence"""
+        category = Category.query.get(product.category_id) if product.category_id else None
+        similar_products = Product.query.filter(
+            Product.category_id == product.category_id,
+            Product.id != product.id
+        ).limit(5).all()
+        return self._build_product_context(product, category, similar_products,
+                                           inventory_ledger.available_stock(product))
+    
+    def _build_product_context(self, product: Product, category: Optional[Category],
+                               similar_products: List[Product], stock: int) -> Dict[str, Any]:
+        """Assemble the product, category and market context the optimization prompt is built from"""
+        return {
+            "id": product.id,
+            "name": product.name,
+            "original_description": product.description,
+            "price": float(product.price),
+            "stock_level": stock,
+            "category": {
+                "name": category.name if category else "Uncategorized",
+                "description": category.description if category else ""
+            },
+            "market_context": {
+                "similar_products": [
+                    {
+                        "name": p.name,
+                        "price": float(p.price),
+                        "description": (p.description or "")[:100] + "..." if len(p.description or "") > 100 else p.description
+                    } for p in similar_products
+                ],
+                "price_range": {
+                    "min": min([float(p.price) for p in similar_products]) if similar_products else float(product.price),
+                    "max": max([float(p.price) for p in similar_products]) if similar_products else float(product.price),
+                    "average": sum([float(p.price) for p in similar_products]) / len(similar_products) if similar_products else float(product.price)
+                }
+            }
+        }
+    
+    def _build_optimization_prompt(self, product_context: Dict[str, Any]) -> str:
+        """Create sophisticated prompt with market intelligence"""
+        return f"""You are an expert e-commerce SEO specialist and product marketing analyst. 
 
 PRODUCT TO OPTIMIZE:
 - Name: {product_context['name']}
@@ -157,117 +175,191 @@ Return ONLY valid JSON in this exact format:
     "unique_selling_points": ["Point 1", "Point 2", "Point 3"],
     "optimization_reasoning": "Brief explanation of why these changes will improve SEO performance"
 }}"""
-
+    
+    async def _generate_intelligent_optimization(self, product_context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Generate intelligent SEO optimization based on complete product analysis"""
+        prompt = self._build_optimization_prompt(product_context)
+        params = groq_service._params('optimization', prompt, 0.3, 1000)
+        
+        # Same content-hash cache as GroqAIService, so single and batch runs share results
+        cache_key = groq_service._get_cache_key("optimization", prompt, params)
+        cached = await groq_service._get_cached_content(cache_key)
+        if cached:
+            logger.info(f"Cache hit for product optimization: {product_context['id']}")
+            return cached
+        
+        # Admin and batch requests for the same product wait on one in-flight call
+        return await groq_service.single_flight.do(
+            cache_key,
+            lambda: self._request_optimization(prompt, params, cache_key, product_context),
+            lookup=lambda: groq_service._as_cache_hit(groq_service.cache.get(cache_key))
+        )
+    
+    async def _request_optimization(self, prompt: str, params: Dict[str, Any], cache_key: str,
+                                    product_context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Call Groq for an optimization, parse it and cache the result"""
         try:
-            completion = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192",
-                temperature=0.3,
-                max_tokens=1000
-            )
-            
-            response_text = completion.choices[0].message.content.strip()
+            completion = await groq_service._complete('intelligent_optimization', prompt, params, client=self.client)
             
-            # DEBUG: Log raw AI response
-            logger.info(f"🔍 DEBUG: Raw AI response: '{response_text[:200]}...' (length: {len(response_text)})")
-            
-            # Clean and parse JSON response
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            # Extract JSON from text that may have explanatory prefix
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            
-            if json_start != -1 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
-            
-            logger.info(f"🔍 DEBUG: Final JSON: '{response_text[:200]}...' (length: {len(response_text)})")
-            
-            result = json.loads(response_text)
+            result = self._parse_optimization_response(completion.choices[0].message.content, product_context)
+            if result is None:
+                return None
             
             # Add metadata
             result['tokens_used'] = completion.usage.total_tokens if completion.usage else 0
-            result['model_used'] = "llama3-8b-8192"
+            result['model_used'] = params['model']
+            if completion.usage:
+                result['cost_cents'] = cost_cents(params['model'], completion.usage.prompt_tokens,
+                                                  completion.usage.completion_tokens)
             
+            await groq_service._cache_content(cache_key, result)
             return result
             
+        except (BudgetExceededError, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"AI optimization generation failed: {e}")
             return None
     
-    async def _save_optimization_results(self, product: Product, optimization: Dict[str, Any], processing_time: int):
-        """Save optimization results to database with proper tracking"""
+    def _parse_optimization_response(self, response_text: str,
+                                     product_context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        The optimization from a completion, or None if unusable. Only enhanced_description is
+        essential; missing meta fields are taken from the standard fallback meta tags.
+        """
+        fallback = groq_service._get_fallback_meta_tags({
+            'name': product_context['name'],
+            'price': product_context['price'],
+            'category': product_context['category']['name']
+        })
+        return groq_service.output_parser.parse(Optimization, response_text, defaults={
+            'meta_title': fallback['title'],
+            'meta_description': fallback['description'],
+            'keywords': fallback['keywords']
+        })
+    
+    async def stream_optimization(self, product_context: Dict[str, Any]):
+        """
+        Yields ('token', text) while the optimization JSON streams, then ('done', optimization),
+        with optimization None if the response could not be parsed. A cached optimization
+        arrives as a single 'done'. Budget and breaker errors propagate, as in the blocking path.
+        """
+        prompt = self._build_optimization_prompt(product_context)
+        params = groq_service._params('optimization', prompt, 0.3, 1000)
+        cache_key = groq_service._get_cache_key("optimization", prompt, params)
+        cached = await groq_service._get_cached_content(cache_key)
+        if cached:
+            yield 'done', cached
+            return
+        
+        stream = groq_service.stream_completion('intelligent_optimization', prompt, params, client=self.client)
+        async with aclosing(stream.chunks()) as chunks:
+            async for text in chunks:
+                yield 'token', text
+        
+        result = self._parse_optimization_response(stream.text, product_context)
+        if result is None:
+            yield 'done', None
+            return
+        result['tokens_used'] = stream.total_tokens
+        result['model_used'] = params['model']
+        result['cost_cents'] = cost_cents(params['model'], stream.prompt_tokens, stream.completion_tokens)
+        await groq_service._cache_content(cache_key, result)
+        yield 'done', result
+    
+    def _optimization_cost(self, optimization: Dict[str, Any]) -> float:
+        """Cost in cents; optimizations cached before costs were recorded are priced on total tokens"""
+        if 'cost_cents' in optimization:
+            return optimization['cost_cents']
+        return cost_cents(optimization.get('model_used'), optimization.get('tokens_used', 0))
+    
+    def _optimization_rows(self, product: Product, optimization: Dict[str, Any], processing_time: int,
+                           existing_seo: Optional[SEOMetadata]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Column values for the content, SEO metadata and analytics rows of one optimization.
+        An existing SEO row is updated in place instead of producing a new one; analytics rows
+        go to the usage sink once the rest is committed. A cached optimization called no model,
+        so its analytics row has no model_used and stays out of the router's latency samples.
+        """
+        model_used = None if optimization.get('cached') else optimization.get('model_used')
+        rows = {
+            'content': [{
+                'content_type': 'intelligent_optimization',
+                'entity_type': 'product',
+                'entity_id': product.id,
+                'original_content': product.description,
+                'ai_content': json.dumps(optimization),
+                'model_used': optimization.get('model_used'),
+                'tokens_used': optimization.get('tokens_used', 0),
+                'generation_time_ms': processing_time,
+                'quality_score': 0.95,  # High quality due to intelligent analysis
+                'usage_count': 0,
+                'is_active': True
+            }],
+            'seo': [],
+            'analytics': [{
+                'endpoint': 'intelligent_optimization',
+                'request_type': 'product_optimization',
+                'entity_type': 'product',
+                'entity_id': product.id,
+                'tokens_total': optimization.get('tokens_used', 0),
+                'response_time_ms': processing_time,
+                'success': True,
+                'cost_cents': self._optimization_cost(optimization),
+                'model_used': model_used
+            }]
+        }
+        
+        if existing_seo:
+            existing_seo.meta_title = optimization.get('meta_title', '')
+            existing_seo.meta_description = optimization.get('meta_description', '')
+            existing_seo.meta_keywords = optimization.get('keywords', '')
+            existing_seo.is_ai_generated = True
+            existing_seo.source_hash = stored_source_hash(product, optimization)
+            existing_seo.updated_at = datetime.utcnow()
+        else:
+            rows['seo'].append({
+                'page_type': 'product',
+                'entity_id': product.id,
+                'meta_title': optimization.get('meta_title', ''),
+                'meta_description': optimization.get('meta_description', ''),
+                'meta_keywords': optimization.get('keywords', ''),
+                'is_ai_generated': True,
+                'source_hash': stored_source_hash(product, optimization),
+                'performance_score': 0.0,
+                'is_active': True
+            })
         
-        logger.info(f"🔍 DEBUG: Attempting to save optimization for product {product.id}")
+        return rows
+    
+    def save_optimization_results(self, product: Product, optimization: Dict[str, Any], processing_time: int):
+        """Save optimization results to database with proper tracking"""
         try:
-            # Save enhanced content
-            ai_content = AIGeneratedContent(
-                content_type='intelligent_optimization',
-                entity_type='product',
-                entity_id=product.id,
-                original_content=product.description,
-                ai_content=json.dumps(optimization),
-                model_used=optimization.get('model_used', 'llama3-8b-8192'),
-                tokens_used=optimization.get('tokens_used', 0),
-                generation_time_ms=processing_time,
-                quality_score=0.95,  # High quality due to intelligent analysis
-                usage_count=0,
-                is_active=True
-            )
-            db.session.add(ai_content)
-            
-            # Save/update SEO metadata
             existing_seo = SEOMetadata.query.filter_by(
                 page_type='product',
                 entity_id=product.id
             ).first()
-            
-            if existing_seo:
-                existing_seo.meta_title = optimization.get('meta_title', '')
-                existing_seo.meta_description = optimization.get('meta_description', '')
-                existing_seo.meta_keywords = optimization.get('keywords', '')
-                existing_seo.is_ai_generated = True
-                existing_seo.updated_at = datetime.utcnow()
-            else:
-                seo_metadata = SEOMetadata(
-                    page_type='product',
-                    entity_id=product.id,
-                    meta_title=optimization.get('meta_title', ''),
-                    meta_description=optimization.get('meta_description', ''),
-                    meta_keywords=optimization.get('keywords', ''),
-                    is_ai_generated=True,
-                    performance_score=0.0,
-                    is_active=True
-                )
-                db.session.add(seo_metadata)
-            
-            # Log analytics
-            analytics = AIUsageAnalytics(
-                endpoint='intelligent_optimization',
-                request_type='product_optimization',
-                entity_type='product',
-                entity_id=product.id,
-                tokens_total=optimization.get('tokens_used', 0),
-                response_time_ms=processing_time,
-                success=True,
-                cost_cents=optimization.get('tokens_used', 0) * 0.27 / 1000000 * 100,
-                model_used=optimization.get('model_used', 'llama3-8b-8192')
+            rows = self._optimization_rows(product, optimization, processing_time, existing_seo)
+            db.session.add_all(
+                [AIGeneratedContent(**r) for r in rows['content']] +
+                [SEOMetadata(**r) for r in rows['seo']]
             )
-            db.session.add(analytics)
-            
             db.session.commit()
-            logger.info(f"🔍 DEBUG: ✅ Optimization results SUCCESSFULLY saved for product {product.id}")
+            groq_service.usage_sink.record_many(rows['analytics'])
+            logger.info(f"Optimization results saved for product {product.id}")
             
         except Exception as e:
-            logger.error(f"🔍 DEBUG: ❌ Failed to save optimization results for product {product.id}: {e}")
+            logger.error(f"Failed to save optimization results for product {product.id}: {e}")
             db.session.rollback()
             raise e  # Re-raise so caller knows it failed
     
-    async def patch_product_with_optimization(self, product_id: int, apply_changes: bool = True) -> Dict[str, Any]:
+    def _bulk_insert_optimization_rows(self, rows: Dict[str, List[Dict[str, Any]]]):
+        """One multi-row INSERT per table for a whole batch"""
+        for model, key in ((AIGeneratedContent, 'content'), (SEOMetadata, 'seo')):
+            if rows[key]:
+                db.session.execute(insert(model), rows[key])
+    
+    def patch_product_with_optimization(self, product_id: int, apply_changes: bool = True) -> Dict[str, Any]:
         """
         Apply AI optimization directly to product in database
         Patches the actual product record with enhanced description and keywords
@@ -293,9 +385,11 @@ Return ONLY valid JSON in this exact format:
             if apply_changes:
                 # Backup original data
                 original_description = product.description
+                original_hash = source_hash(product)
                 
                 # Apply enhanced description to product
                 product.description = optimization_data.get('enhanced_description', product.description)
+                self._restamp_fresh_content(product, original_hash)
                 
                 # Mark as AI optimized (you might want to add this field to Product model)
                 # product.is_ai_optimized = True
@@ -325,42 +419,161 @@ Return ONLY valid JSON in this exact format:
             db.session.rollback()
             return {"success": False, "error": str(e)}
     
-    async def batch_optimize_products(self, category_id: Optional[int] = None, limit: int = 10) -> Dict[str, Any]:
-        """Batch optimize multiple products with intelligent analysis"""
+    def _restamp_fresh_content(self, product: Product, original_hash: str):
+        """
+        Move the product's active description and SEO rows that were fresh before an optimization
+        was applied to the new source hash, so applying it does not queue their regeneration
+        """
+        rows = AIGeneratedContent.query.filter_by(
+            content_type='product_description', entity_type='product', entity_id=product.id, is_active=True
+        ).all() + SEOMetadata.query.filter_by(page_type='product', entity_id=product.id, is_active=True).all()
+        new_hash = source_hash(product)
+        for row in rows:
+            if row.source_hash == original_hash:
+                row.source_hash = new_hash
+    
+    def _prefetch_similar_products(self, category_ids: List[int], per_category: int) -> Dict[int, List[Product]]:
+        """First `per_category` products of each category, in one windowed query"""
+        if not category_ids:
+            return {}
+        
+        ranked = db.session.query(
+            Product.id.label('product_id'),
+            func.row_number().over(partition_by=Product.category_id, order_by=Product.id).label('rank')
+        ).filter(Product.category_id.in_(category_ids)).subquery()
+        
+        similar = Product.query.join(ranked, Product.id == ranked.c.product_id).filter(
+            ranked.c.rank <= per_category
+        ).order_by(Product.id).all()
+        
+        by_category: Dict[int, List[Product]] = {}
+        for p in similar:
+            by_category.setdefault(p.category_id, []).append(p)
+        return by_category
+    
+    async def _timed_optimization(self, product_context: Dict[str, Any]):
+        start_time = time.time()
+        optimization = await self._generate_intelligent_optimization(product_context)
+        return optimization, int((time.time() - start_time) * 1000)
+    
+    def select_batch_products(self, category_id: Optional[int] = None, limit: int = 10,
+                              product_ids: Optional[List[int]] = None) -> List[Product]:
+        """
+        Specific products, or the first `limit` products (optionally within a category), in id order
+        as enqueue_batch_optimize picks them, so the sync and background paths agree
+        """
+        query = Product.query
+        if product_ids:
+            return query.filter(Product.id.in_(product_ids)).order_by(Product.id).all()
+        if category_id:
+            query = query.filter(Product.category_id == category_id)
+        return query.order_by(Product.id).limit(limit).all()
+    
+    def estimate_batch_tokens(self, products: List[Product]) -> int:
+        """Rough worst-case token cost of optimizing these products (prompt estimate + output allowance)"""
+        return sum(
+            groq_service.token_budget.estimate_request(
+                self._build_optimization_prompt(self._build_product_context(product, None, [], product.stock)), 1000
+            ) + 60  # category and competitor lines left out of the estimate
+            for product in products
+        )
+    
+    def batch_optimize_products(self, category_id: Optional[int] = None, limit: int = 10,
+                                product_ids: Optional[List[int]] = None,
+                                concurrency: Optional[int] = None,
+                                commit: bool = True) -> Dict[str, Any]:
+        """
+        Batch optimize multiple products with intelligent analysis.
+        Context is prefetched in a few bulk queries, LLM calls fan out with bounded
+        concurrency, and all result rows are written in one commit. With commit=False the
+        rows are only staged, so a job can commit them together with its progress.
+        """
+        if not self.client:
+            return {"success": False, "error": "AI client not available"}
+        
+        concurrency = concurrency or int(os.getenv('AI_OPTIMIZE_CONCURRENCY', '5'))
+        item_timeout = float(os.getenv('AI_OPTIMIZE_ITEM_TIMEOUT_SECONDS', '60'))
         
         try:
-            query = Product.query
-            if category_id:
-                query = query.filter(Product.category_id == category_id)
-            
-            products = query.limit(limit).all()
+            products = self.select_batch_products(category_id, limit, product_ids)
+            category_ids = list({p.category_id for p in products if p.category_id})
+            categories = {c.id: c for c in Category.query.filter(Category.id.in_(category_ids)).all()} if category_ids else {}
+            # One extra per category so a product can be excluded from its own competitor list
+            similar_by_category = self._prefetch_similar_products(category_ids, per_category=6)
+            stock_levels = inventory_ledger.stock_levels(products)
+            
+            contexts = [
+                self._build_product_context(
+                    product,
+                    categories.get(product.category_id),
+                    [p for p in similar_by_category.get(product.category_id, []) if p.id != product.id][:5],
+                    stock_levels[product.id]
+                )
+                for product in products
+            ]
+            
+            outcomes = ai_runtime.run(gather_bounded(
+                [lambda context=context: self._timed_optimization(context) for context in contexts],
+                concurrency=concurrency,
+                timeout=item_timeout
+            ))
+            
+            existing_seo = {
+                seo.entity_id: seo
+                for seo in SEOMetadata.query.filter(
+                    SEOMetadata.page_type == 'product',
+                    SEOMetadata.entity_id.in_([p.id for p in products])
+                ).all()
+            } if products else {}
             
             results = []
-            total_cost = 0
-            total_tokens = 0
-            
-            for product in products:
-                result = await self.analyze_and_optimize_product(product.id)
-                results.append(result)
+            batch_rows = {'content': [], 'seo': [], 'analytics': []}
+            for product, context, outcome in zip(products, contexts, outcomes):
+                optimization, processing_time = outcome['result'] if outcome['ok'] else (None, 0)
+                if not optimization:
+                    results.append({
+                        "success": False,
+                        "product_id": product.id,
+                        "error": outcome.get('error', "Failed to generate optimization")
+                    })
+                    continue
                 
-                if result.get('success'):
-                    optimization = result.get('optimization', {})
-                    total_tokens += optimization.get('tokens_used', 0)
-                    total_cost += optimization.get('tokens_used', 0) * 0.27 / 1000000
+                rows = self._optimization_rows(product, optimization, processing_time, existing_seo.get(product.id))
+                for key in batch_rows:
+                    batch_rows[key].extend(rows[key])
+                results.append({
+                    "success": True,
+                    "product_id": product.id,
+                    "original_description": product.description,
+                    "optimization": optimization,
+                    "processing_time_ms": processing_time,
+                    "market_analysis": context["market_context"]
+                })
+            
+            self._bulk_insert_optimization_rows(batch_rows)
+            if commit:
+                db.session.commit()
+            # The tokens were spent whether or not the caller's commit succeeds
+            groq_service.usage_sink.record_many(batch_rows['analytics'])
+            
+            successful = [r for r in results if r.get('success')]
+            total_tokens = sum(r['optimization'].get('tokens_used', 0) for r in successful)
+            total_cost_cents = sum(self._optimization_cost(r['optimization']) for r in successful)
             
             return {
                 "success": True,
-                "optimized_count": len([r for r in results if r.get('success')]),
+                "optimized_count": len(successful),
                 "total_products": len(products),
                 "results": results,
                 "batch_summary": {
                     "total_tokens": total_tokens,
-                    "total_cost_cents": total_cost * 100,
-                    "average_processing_time": sum([r.get('processing_time_ms', 0) for r in results if r.get('success')]) / len([r for r in results if r.get('success')]) if results else 0
+                    "total_cost_cents": total_cost_cents,
+                    "average_processing_time": sum(r['processing_time_ms'] for r in successful) / len(successful) if successful else 0
                 }
             }
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Batch optimization failed: {e}")
             return {"success": False, "error": str(e)}
 
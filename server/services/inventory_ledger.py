@@ -0,0 +1,184 @@
+"""
+Inventory Ledger - Append-only stock movements with periodic compaction
+"""
+import os
+from typing import Dict, Iterable, Any
+from datetime import datetime
+from sqlalchemy import func
+from models import db, Product, StockMovement, StockSnapshot, StockShard
+import logging
+
+logger = logging.getLogger(__name__)
+
+class InventoryLedger:
+    """Records stock changes as cheap inserts and folds them into products.stock in batches"""
+
+    def __init__(self, batch_size: int = 5000):
+        self.batch_size = batch_size
+        # Reads sum at most this many pending movements; compaction (a cron job) keeps far fewer pending
+        self.max_pending_scan = int(os.getenv('STOCK_PENDING_SCAN_LIMIT', '10000'))
+
+    def record_movement(self, product_id: int, quantity_delta: int, reason: str,
+                        applied_to_shards: bool = False) -> StockMovement:
+        """Append a movement to the current session (the caller commits)"""
+        movement = StockMovement(
+            product_id=product_id,
+            quantity_delta=quantity_delta,
+            reason=reason,
+            applied_to_shards=applied_to_shards
+        )
+        db.session.add(movement)
+        return movement
+
+    def pending_deltas(self, product_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Sum of not-yet-compacted movements per product, in one grouped query over at most
+        max_pending_scan rows (the oldest first, since compaction folds those next)
+        """
+        product_ids = list(product_ids)
+        if not product_ids:
+            return {}
+
+        pending = db.session.query(
+            StockMovement.product_id,
+            StockMovement.quantity_delta
+        ).filter(
+            StockMovement.product_id.in_(product_ids),
+            StockMovement.compacted_at.is_(None),
+            StockMovement.applied_to_shards.is_(False)
+        ).order_by(StockMovement.id).limit(self.max_pending_scan).subquery()
+        rows = db.session.query(
+            pending.c.product_id,
+            func.sum(pending.c.quantity_delta),
+            func.count()
+        ).group_by(pending.c.product_id).all()
+
+        if sum(count for _, _, count in rows) >= self.max_pending_scan:
+            logger.error(f"{self.max_pending_scan}+ uncompacted stock movements for products {product_ids[:10]}; "
+                         f"stock levels are approximate until compaction catches up")
+        return {product_id: int(delta or 0) for product_id, delta, _ in rows}
+
+    def shard_totals(self, product_ids: Iterable[int]) -> Dict[int, int]:
+        """Summed shard counts for the sharded products among product_ids"""
+        product_ids = list(product_ids)
+        if not product_ids:
+            return {}
+
+        rows = db.session.query(
+            StockShard.product_id,
+            func.sum(StockShard.count)
+        ).filter(StockShard.product_id.in_(product_ids)).group_by(StockShard.product_id).all()
+
+        return {product_id: int(total or 0) for product_id, total in rows}
+
+    def row_stock(self, product: Product) -> int:
+        """Stock tracked by the product row and its pending movements, ignoring shards"""
+        return product.stock + self.pending_deltas([product.id]).get(product.id, 0)
+
+    def stock_levels(self, products: Iterable[Product]) -> Dict[int, int]:
+        """Current available stock for each product (shard sum, or row value plus pending movements)"""
+        products = list(products)
+        pending = self.pending_deltas(p.id for p in products)
+        sharded = self.shard_totals(p.id for p in products)
+        return {
+            p.id: sharded[p.id] if p.id in sharded else p.stock + pending.get(p.id, 0)
+            for p in products
+        }
+
+    def available_stock(self, product: Product) -> int:
+        """Current available stock for a single product"""
+        return self.stock_levels([product])[product.id]
+
+    def lock_product(self, product_id: int) -> Product:
+        """
+        Re-read a product holding its row lock until the caller commits, so a stock check and
+        the movement it allows cannot interleave with another sale (compaction takes the same lock)
+        """
+        return Product.query.filter_by(id=product_id).populate_existing().with_for_update().one()
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Fold pending movements into products.stock and hourly snapshots.
+        Movements are kept for auditing and only stamped with compacted_at.
+        Movements already applied to stock shards only contribute to snapshots.
+        """
+        movements = StockMovement.query.filter(
+            StockMovement.compacted_at.is_(None)
+        ).order_by(StockMovement.id).limit(self.batch_size).all()
+
+        if not movements:
+            return {'compacted_movements': 0, 'products_updated': 0, 'snapshots_touched': 0}
+
+        product_deltas = {}
+        hourly = {}
+        for movement in movements:
+            row_delta = 0 if movement.applied_to_shards else movement.quantity_delta
+            product_deltas[movement.product_id] = product_deltas.get(movement.product_id, 0) + row_delta
+
+            hour = movement.created_at.replace(minute=0, second=0, microsecond=0)
+            bucket = hourly.setdefault((movement.product_id, hour), {'net_change': 0, 'movement_count': 0})
+            bucket['net_change'] += movement.quantity_delta
+            bucket['movement_count'] += 1
+
+        try:
+            # One atomic relative update per product instead of one per sale
+            for product_id, delta in product_deltas.items():
+                if delta:
+                    Product.query.filter_by(id=product_id).update(
+                        {Product.stock: Product.stock + delta},
+                        synchronize_session=False
+                    )
+
+            closing_stock = dict(
+                db.session.query(Product.id, Product.stock).filter(
+                    Product.id.in_(list(product_deltas))
+                ).all()
+            )
+            closing_stock.update(self.shard_totals(product_deltas))
+
+            existing_snapshots = {
+                (s.product_id, s.hour): s
+                for s in StockSnapshot.query.filter(
+                    StockSnapshot.product_id.in_(list(product_deltas)),
+                    StockSnapshot.hour.in_(list({hour for _, hour in hourly}))
+                ).all()
+            }
+
+            for (product_id, hour), bucket in hourly.items():
+                snapshot = existing_snapshots.get((product_id, hour))
+                if snapshot is None:
+                    snapshot = StockSnapshot(product_id=product_id, hour=hour, net_change=0, movement_count=0)
+                    db.session.add(snapshot)
+                snapshot.net_change += bucket['net_change']
+                snapshot.movement_count += bucket['movement_count']
+                snapshot.closing_stock = closing_stock.get(product_id)
+
+            StockMovement.query.filter(
+                StockMovement.id.in_([m.id for m in movements])
+            ).update({StockMovement.compacted_at: datetime.utcnow()}, synchronize_session=False)
+
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Stock compaction failed: {e}")
+            db.session.rollback()
+            raise
+
+        logger.info(f"Compacted {len(movements)} stock movements across {len(product_deltas)} products")
+        return {
+            'compacted_movements': len(movements),
+            'products_updated': len(product_deltas),
+            'snapshots_touched': len(hourly)
+        }
+
+    def compact_all(self) -> Dict[str, Any]:
+        """Run compaction batches until no pending movements remain"""
+        totals = {'compacted_movements': 0, 'products_updated': 0, 'snapshots_touched': 0}
+        while True:
+            result = self.compact()
+            for key in totals:
+                totals[key] += result[key]
+            if result['compacted_movements'] < self.batch_size:
+                return totals
+
+# Global instance
+inventory_ledger = InventoryLedger()
@@ -0,0 +1,184 @@
+"""
+Job Queue - Durable database-backed queue for long-running AI work
+Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED so several can poll the same table
+"""
+import os
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import and_, or_
+from models import db, AIJob
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JobDeferred(Exception):
+    """Raised by a handler to put its job back in the queue for later without using up an attempt"""
+
+    def __init__(self, delay_seconds: int, reason: str = ''):
+        super().__init__(reason or f"Deferred for {delay_seconds}s")
+        self.delay_seconds = delay_seconds
+
+
+class JobQueue:
+    """Enqueue, claim and run AIJob rows with per-type handlers, retries and progress reporting"""
+
+    def __init__(self):
+        self.handlers: Dict[str, Callable] = {}
+        self.poll_interval = float(os.getenv('AI_JOB_POLL_SECONDS', '2'))
+        # A running job whose heartbeat is older than this is assumed to belong to a dead worker
+        self.lock_timeout = int(os.getenv('AI_JOB_LOCK_TIMEOUT_SECONDS', '900'))
+        self.retry_delay = int(os.getenv('AI_JOB_RETRY_DELAY_SECONDS', '30'))
+        self.max_attempts = int(os.getenv('AI_JOB_MAX_ATTEMPTS', '3'))
+
+    def register(self, job_type: str):
+        """
+        Decorator for a handler(job, progress) -> summary dict.
+        progress(results, count=None) appends per-item results, advances progress_done and commits.
+        """
+        def decorator(fn):
+            self.handlers[job_type] = fn
+            return fn
+        return decorator
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any], total: int = 0,
+                run_after: Optional[datetime] = None, session=None) -> AIJob:
+        """Insert a queued job and commit so workers can see it (in db.session unless another session is given)"""
+        session = session or db.session
+        job = AIJob(
+            job_type=job_type,
+            status='queued',
+            payload=payload,
+            progress_total=total,
+            progress_done=0,
+            results=[],
+            attempts=0,
+            max_attempts=self.max_attempts,
+            run_after=run_after or datetime.utcnow()
+        )
+        session.add(job)
+        session.commit()
+        logger.info(f"Enqueued {job_type} job {job.id} ({total} items)")
+        return job
+
+    def get(self, job_id: int) -> Optional[AIJob]:
+        return db.session.get(AIJob, job_id)
+
+    def claim(self, worker_id: str) -> Optional[AIJob]:
+        """Lock the next due job (or one abandoned by a dead worker) and mark it running"""
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.lock_timeout)
+
+        job = AIJob.query.filter(or_(
+            and_(AIJob.status == 'queued', AIJob.run_after <= now),
+            and_(AIJob.status == 'running', AIJob.locked_at < stale)
+        )).order_by(AIJob.run_after, AIJob.id).with_for_update(skip_locked=True).first()
+
+        if job is None:
+            db.session.rollback()  # end the transaction instead of holding it open between polls
+            return None
+
+        if job.status == 'running':
+            logger.warning(f"Reclaiming job {job.id} from {job.locked_by} (no heartbeat since {job.locked_at})")
+        job.status = 'running'
+        job.locked_by = worker_id
+        job.locked_at = now
+        job.attempts = (job.attempts or 0) + 1
+        job.started_at = job.started_at or now
+        db.session.commit()
+        return job
+
+    def _progress_callback(self, job: AIJob) -> Callable:
+        def progress(results: List[Dict[str, Any]], count: Optional[int] = None):
+            # Reassign rather than mutate so the JSON column is flagged dirty
+            job.results = (job.results or []) + list(results)
+            job.progress_done = (job.progress_done or 0) + (len(results) if count is None else count)
+            job.locked_at = datetime.utcnow()
+            db.session.commit()
+        return progress
+
+    def run_job(self, job: AIJob):
+        """Run a claimed job's handler and record success, a scheduled retry or final failure"""
+        handler = self.handlers.get(job.job_type)
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job type '{job.job_type}'")
+            summary = handler(job, self._progress_callback(job))
+            job.status = 'succeeded'
+            job.summary = summary
+            job.error = None
+            job.finished_at = datetime.utcnow()
+            job.locked_by = None
+            db.session.commit()
+            logger.info(f"Job {job.id} ({job.job_type}) succeeded")
+
+        except JobDeferred as e:
+            db.session.rollback()
+            job = db.session.get(AIJob, job.id)
+            job.status = 'queued'
+            job.attempts = max(0, (job.attempts or 1) - 1)
+            job.run_after = datetime.utcnow() + timedelta(seconds=e.delay_seconds)
+            job.error = str(e)
+            job.locked_by = None
+            db.session.commit()
+            logger.info(f"Job {job.id} deferred until {job.run_after}: {e}")
+
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(AIJob, job.id)
+            job.error = str(e)
+            job.locked_by = None
+            if handler is not None and job.attempts < (job.max_attempts or 1):
+                # Handlers resume from progress_done, so a retry only redoes the unfinished items
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+                logger.warning(f"Job {job.id} failed (attempt {job.attempts}), retrying after {job.run_after}: {e}")
+            else:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+                logger.error(f"Job {job.id} ({job.job_type}) failed: {e}")
+            db.session.commit()
+
+    def run_next(self, worker_id: str) -> bool:
+        """Claim and run one job; False when nothing was due"""
+        job = self.claim(worker_id)
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+
+    def work(self, app, worker_id: Optional[str] = None, burst: bool = False,
+             stop_event: Optional[threading.Event] = None) -> int:
+        """
+        Poll for jobs until stopped (SIGTERM/SIGINT finish the current job first).
+        With burst=True, return as soon as the queue is empty. Returns the number of jobs run.
+        """
+        worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        stop_event = stop_event or threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: stop_event.set())
+
+        logger.info(f"AI job worker {worker_id} started")
+        processed = 0
+        while not stop_event.is_set():
+            try:
+                with app.app_context():
+                    ran = self.run_next(worker_id)
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} poll failed: {e}")
+                ran = False
+            if ran:
+                processed += 1
+            elif burst:
+                break
+            else:
+                stop_event.wait(self.poll_interval)
+
+        logger.info(f"AI job worker {worker_id} stopped after {processed} jobs")
+        return processed
+
+# Global instance
+job_queue = JobQueue()
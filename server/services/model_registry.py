@@ -0,0 +1,190 @@
+"""
+Model Registry - Groq models with pricing and limits, and per-task model routing
+The router prefers cheap models for short tasks and steers away from models that are slow or failing
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import case, func
+from models import db, AIUsageAnalytics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens; typical_latency_ms is used until enough calls have been observed
+MODELS: Dict[str, Dict[str, Any]] = {
+    'llama-3.1-8b-instant': {
+        'input_per_million': 0.05, 'output_per_million': 0.08,
+        'context_window': 131072, 'max_output_tokens': 8192, 'typical_latency_ms': 600
+    },
+    'llama-3.3-70b-versatile': {
+        'input_per_million': 0.59, 'output_per_million': 0.79,
+        'context_window': 131072, 'max_output_tokens': 32768, 'typical_latency_ms': 1800
+    },
+    'gemma2-9b-it': {
+        'input_per_million': 0.20, 'output_per_million': 0.20,
+        'context_window': 8192, 'max_output_tokens': 8192, 'typical_latency_ms': 800
+    },
+    # Retired models, kept so costs of stored rows can still be computed
+    'llama3-8b-8192': {
+        'input_per_million': 0.05, 'output_per_million': 0.08,
+        'context_window': 8192, 'max_output_tokens': 8192, 'typical_latency_ms': 700
+    },
+    'mixtral-8x7b-32768': {
+        'input_per_million': 0.24, 'output_per_million': 0.24,
+        'context_window': 32768, 'max_output_tokens': 32768, 'typical_latency_ms': 1200
+    },
+}
+
+# Candidate models in order of preference (quality first); AI_MODELS_<TASK>="a,b" overrides a list
+TASKS: Dict[str, Dict[str, Any]] = {
+    'meta_tags': {'models': ['llama-3.1-8b-instant', 'gemma2-9b-it'], 'latency_budget_ms': 3000},
+    'meta_tags_batch': {'models': ['llama-3.1-8b-instant', 'llama-3.3-70b-versatile'], 'latency_budget_ms': 15000},
+    'category_meta': {'models': ['llama-3.1-8b-instant', 'gemma2-9b-it'], 'latency_budget_ms': 3000},
+    'description': {'models': ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant'], 'latency_budget_ms': 6000},
+    'optimization': {'models': ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant'], 'latency_budget_ms': 8000},
+}
+
+def cost_cents(model: Optional[str], tokens_input: int, tokens_output: int = 0) -> float:
+    """Cost of a call in cents at the model's real pricing (0 for unknown models and fallbacks)"""
+    spec = MODELS.get(model or '')
+    if spec is None:
+        return 0.0
+    dollars = (tokens_input * spec['input_per_million'] + tokens_output * spec['output_per_million']) / 1_000_000
+    return dollars * 100
+
+
+class ModelRouter:
+    """
+    Picks a model per task from the registry. Health comes from AIUsageAnalytics over a recent
+    window (refreshed in the background) plus this process's own calls since the last refresh.
+    """
+
+    def __init__(self):
+        self.app = None
+        # Requests with at most this many output tokens go to the cheapest healthy candidate
+        self.short_task_max_tokens = int(os.getenv('AI_ROUTER_SHORT_MAX_TOKENS', '600'))
+        self.min_success_rate = float(os.getenv('AI_ROUTER_MIN_SUCCESS_RATE', '0.8'))
+        self.min_samples = int(os.getenv('AI_ROUTER_MIN_SAMPLES', '10'))
+        self.window_minutes = int(os.getenv('AI_ROUTER_WINDOW_MINUTES', '60'))
+        self.refresh_interval = float(os.getenv('AI_ROUTER_REFRESH_SECONDS', '60'))
+        self.tasks = {name: {**task, 'models': self._task_models(name, task['models'])} for name, task in TASKS.items()}
+        self._persisted: Dict[str, Dict[str, float]] = {}
+        self._local: Dict[str, Dict[str, float]] = {}
+        self._refreshed_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _task_models(self, task: str, defaults: List[str]) -> List[str]:
+        override = os.getenv(f"AI_MODELS_{task.upper()}", '')
+        return [m.strip() for m in override.split(',') if m.strip()] or defaults
+
+    def init_app(self, app):
+        """
+        Enable loading observed latency and success rates from AIUsageAnalytics.
+        Refuses to start with AI_MODELS_<TASK> overrides naming models the registry has no
+        pricing or limits for, since their calls would be costed at zero and never routed on fit.
+        """
+        unknown = {name: [m for m in task['models'] if m not in MODELS] for name, task in self.tasks.items()}
+        unknown = {name: models for name, models in unknown.items() if models}
+        if unknown:
+            raise RuntimeError(f"Unknown models in AI_MODELS_<TASK> overrides (add them to MODELS): {unknown}")
+        self.app = app
+
+    def record(self, model: str, latency_ms: int, success: bool):
+        """Count one call made by this process"""
+        with self._lock:
+            stats = self._local.setdefault(model, {'calls': 0, 'successes': 0, 'latency_ms': 0})
+            stats['calls'] += 1
+            stats['successes'] += int(success)
+            stats['latency_ms'] += latency_ms if success else 0
+
+    def _load_persisted(self) -> Dict[str, Dict[str, float]]:
+        since = datetime.utcnow() - timedelta(minutes=self.window_minutes)
+        with self.app.app_context():
+            rows = db.session.query(
+                AIUsageAnalytics.model_used,
+                func.count(AIUsageAnalytics.id),
+                func.sum(case((AIUsageAnalytics.success.is_(True), 1), else_=0)),
+                func.sum(case((AIUsageAnalytics.success.is_(True), AIUsageAnalytics.response_time_ms), else_=0))
+            ).filter(
+                AIUsageAnalytics.created_at >= since,
+                # Rows without a model (cache hits, fallbacks) made no call to sample
+                AIUsageAnalytics.model_used.in_(list(MODELS))
+            ).group_by(AIUsageAnalytics.model_used).all()
+        return {model: {'calls': calls, 'successes': successes or 0, 'latency_ms': latency or 0}
+                for model, calls, successes, latency in rows}
+
+    def _refresh(self):
+        try:
+            persisted = self._load_persisted()
+            with self._lock:
+                self._persisted = persisted
+                self._local = {}  # those calls are now part of the persisted window (or soon will be)
+                self._refreshed_at = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Could not load model stats from AIUsageAnalytics: {e}")
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def _maybe_refresh(self):
+        """Start a background refresh when the stats are stale; routing never waits on the database"""
+        if self.app is None:
+            return
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='ai-model-stats', daemon=True).start()
+
+    def model_stats(self, model: str) -> Dict[str, float]:
+        with self._lock:
+            persisted = self._persisted.get(model, {})
+            local = self._local.get(model, {})
+        calls = persisted.get('calls', 0) + local.get('calls', 0)
+        successes = persisted.get('successes', 0) + local.get('successes', 0)
+        latency = persisted.get('latency_ms', 0) + local.get('latency_ms', 0)
+        return {
+            'calls': calls,
+            'success_rate': successes / calls if calls else 1.0,
+            'avg_latency_ms': latency / successes if successes else MODELS.get(model, {}).get('typical_latency_ms', 0)
+        }
+
+    def _healthy(self, stats: Dict[str, float]) -> bool:
+        return stats['calls'] < self.min_samples or stats['success_rate'] >= self.min_success_rate
+
+    def choose(self, task: str, prompt_tokens: int, max_tokens: int) -> str:
+        """
+        The model for one request: candidates that fit the prompt, minus unhealthy ones, minus ones
+        whose observed latency exceeds the task's budget (unless none are left), then the cheapest
+        for short requests or the most preferred otherwise.
+        """
+        self._maybe_refresh()
+        config = self.tasks[task]
+        candidates = [
+            m for m in config['models']
+            if m in MODELS and prompt_tokens + max_tokens <= MODELS[m]['context_window']
+            and max_tokens <= MODELS[m]['max_output_tokens']
+        ] or config['models'][:1]
+
+        stats = {m: self.model_stats(m) for m in candidates}
+        pool = [m for m in candidates if self._healthy(stats[m])] or candidates
+        pool = [m for m in pool if stats[m]['avg_latency_ms'] <= config['latency_budget_ms']] or pool
+
+        if max_tokens <= self.short_task_max_tokens:
+            return min(pool, key=lambda m: cost_cents(m, prompt_tokens, max_tokens))
+        return pool[0]
+
+    def stats(self) -> Dict[str, Any]:
+        models = {m for task in self.tasks.values() for m in task['models']}
+        return {
+            'tasks': {name: task['models'] for name, task in self.tasks.items()},
+            'models': {m: self.model_stats(m) for m in sorted(models)}
+        }
+
+# Global instance
+model_router = ModelRouter()
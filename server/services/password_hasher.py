@@ -0,0 +1,73 @@
+"""
+Password Hasher - Bounded worker pool for password hashing and verification
+Keeps slow KDF work off the request path's critical section and sheds load when saturated
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+from werkzeug.security import generate_password_hash, check_password_hash
+import logging
+
+logger = logging.getLogger(__name__)
+
+class HasherBusyError(Exception):
+    """Raised when the hashing queue is full or a hash did not finish in time"""
+
+
+class PasswordHasher:
+    """Runs werkzeug hashing in a small thread pool with a cap on queued work"""
+
+    def __init__(self):
+        # Any werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+        self.method = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+        self.max_workers = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+        self.max_pending = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '16'))
+        self.timeout = float(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', '5'))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._current_prefix: Optional[str] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Recreate after a fork so each gunicorn worker has live threads
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusyError('Too many pending password operations')
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusyError('Password operation timed out')
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash: str, password: str) -> bool:
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash: str) -> bool:
+        """True when a hash was produced with different method parameters than configured"""
+        if self._current_prefix is None:
+            # werkzeug fills in default parameters, so derive the canonical prefix once
+            self._current_prefix = self._run(generate_password_hash, '', self.method).split('$', 1)[0]
+        return stored_hash.split('$', 1)[0] != self._current_prefix
+
+# Global instance
+password_hasher = PasswordHasher()
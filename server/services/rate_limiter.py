@@ -0,0 +1,137 @@
+"""
+Rate Limiter - Token buckets per route policy and client IP
+Shared across workers through Redis (atomic Lua script) or kept in-process per worker
+"""
+import math
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from flask import request, jsonify
+from services.groq_ai_service import groq_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# capacity = burst size, period = seconds to refill a full bucket
+DEFAULT_POLICIES: List[Dict[str, Any]] = [
+    {'name': 'login', 'prefix': '/login', 'methods': {'POST'}, 'capacity': 10, 'period': 60},
+    {'name': 'signup', 'prefix': '/signup', 'methods': {'POST'}, 'capacity': 5, 'period': 300},
+    {'name': 'admin_ai', 'prefix': '/admin/ai/', 'methods': None, 'capacity': 30, 'period': 60},
+    {'name': 'ai', 'prefix': '/ai/', 'methods': {'POST'}, 'capacity': 20, 'period': 60},
+]
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+class TokenBucketLimiter:
+    """Token-bucket limiter with per-route policies keyed by client IP"""
+
+    def __init__(self, redis_client=None, policies: Optional[List[Dict[str, Any]]] = None):
+        self.redis_client = redis_client
+        self.policies = [self._apply_env_override(dict(p)) for p in (policies or DEFAULT_POLICIES)]
+        self.enabled = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+        self.use_redis = os.getenv('RATE_LIMIT_BACKEND', 'redis').lower() == 'redis' and redis_client is not None
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT) if self.use_redis else None
+        # key -> (tokens, last update, time the bucket is full again and can be forgotten)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self.max_local_buckets = int(os.getenv('RATE_LIMIT_MAX_LOCAL_BUCKETS', '10000'))
+        self._lock = threading.Lock()
+
+    def _apply_env_override(self, policy: Dict[str, Any]) -> Dict[str, Any]:
+        """RATE_LIMIT_<NAME>=capacity/period_seconds, e.g. RATE_LIMIT_LOGIN=10/60"""
+        override = os.getenv(f"RATE_LIMIT_{policy['name'].upper()}")
+        if override:
+            try:
+                capacity, period = override.split('/')
+                policy['capacity'], policy['period'] = int(capacity), float(period)
+            except ValueError:
+                logger.warning(f"Ignoring malformed rate limit override for {policy['name']}: {override}")
+        return policy
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+
+    def match(self, path: str, method: str) -> Optional[Dict[str, Any]]:
+        for policy in self.policies:
+            if path.startswith(policy['prefix']) and (policy['methods'] is None or method in policy['methods']):
+                return policy
+        return None
+
+    def client_ip(self) -> str:
+        # X-Forwarded-For is client controlled; ProxyFix in app.py sets remote_addr from trusted hops only
+        return request.remote_addr or 'unknown'
+
+    def _prune(self, now: float):
+        """Forget buckets that have refilled; if that is not enough, the least recently used half"""
+        self._buckets = {key: b for key, b in self._buckets.items() if b[2] > now}
+        if len(self._buckets) >= self.max_local_buckets:
+            by_age = sorted(self._buckets, key=lambda key: self._buckets[key][1])
+            for key in by_age[:len(by_age) // 2 + 1]:
+                del self._buckets[key]
+
+    def consume(self, policy: Dict[str, Any], identity: str, cost: float = 1) -> Tuple[bool, float]:
+        """Take tokens from the bucket, returning (allowed, retry_after_seconds)"""
+        key = f"ratelimit:{policy['name']}:{identity}"
+        rate = policy['capacity'] / policy['period']
+        now = time.time()
+
+        if self._script is not None:
+            try:
+                allowed, retry_after = self._script(keys=[key], args=[policy['capacity'], rate, now, cost])
+                return bool(int(allowed)), float(retry_after)
+            except Exception as e:
+                logger.warning(f"Redis rate limiter unavailable, falling back to local buckets: {e}")
+
+        with self._lock:
+            if key not in self._buckets and len(self._buckets) >= self.max_local_buckets:
+                self._prune(now)
+            tokens, last, _ = self._buckets.get(key, (policy['capacity'], now, now))
+            tokens = min(policy['capacity'], tokens + max(0.0, now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (policy['capacity'] - tokens) / rate)
+            return (True, 0.0) if allowed else (False, (cost - tokens) / rate)
+
+    def _before_request(self):
+        if not self.enabled or request.method == 'OPTIONS':
+            return None
+
+        policy = self.match(request.path, request.method)
+        if policy is None:
+            return None
+
+        allowed, retry_after = self.consume(policy, self.client_ip())
+        if allowed:
+            return None
+
+        retry_seconds = max(1, math.ceil(retry_after))
+        response = jsonify({'error': 'Too many requests', 'retry_after_seconds': retry_seconds})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_seconds)
+        response.headers['X-RateLimit-Limit'] = str(policy['capacity'])
+        response.headers['X-RateLimit-Policy'] = policy['name']
+        return response
+
+# Global instance
+rate_limiter = TokenBucketLimiter(groq_service.redis_client)
@@ -0,0 +1,156 @@
+"""
+Single Flight - Coalesce concurrent AI generations for the same cache key
+In-process callers share one asyncio future; other workers wait on a Redis lock and result channel
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Delete the lock only if this worker still owns it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    """Runs one generation per key at a time; concurrent callers receive the leader's result"""
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        # Longest a leader may hold the cross-worker lock (should exceed one generation)
+        self.lock_ttl = float(os.getenv('AI_SINGLE_FLIGHT_LOCK_SECONDS', '60'))
+        # Followers give up waiting after this and generate on their own
+        self.wait_timeout = float(os.getenv('AI_SINGLE_FLIGHT_WAIT_SECONDS', '60'))
+        self._release = redis_client.register_script(RELEASE_SCRIPT) if redis_client is not None else None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'local_followers': 0, 'remote_followers': 0, 'wait_timeouts': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]],
+                 lookup: Optional[Callable[[], Optional[Dict[str, Any]]]] = None) -> Dict[str, Any]:
+        """
+        Await fn() unless an identical generation is already running, in which case share its result.
+        lookup() (synchronous; it runs on a thread) is consulted after winning or losing a race, so a
+        result cached meanwhile is reused. Must be called on the AI runtime loop.
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._count('local_followers')
+            # wait() never cancels the shared future, and raises CancelledError only if we are cancelled
+            await asyncio.wait([inflight])
+            if inflight.cancelled():
+                # The leader was cancelled (e.g. its own timeout), not us: try again
+                return await self.do(key, fn, lookup)
+            return inflight.result()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._run_distributed(key, fn, lookup)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # followers re-raise it; don't warn about an unretrieved exception
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_distributed(self, key: str, fn, lookup) -> Dict[str, Any]:
+        if self.redis_client is None:
+            self._count('leaders')
+            return await fn()
+
+        lock_key = f"singleflight:lock:{key}"
+        channel = f"singleflight:done:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            try:
+                acquired = await asyncio.to_thread(self.redis_client.set, lock_key, token,
+                                                   nx=True, px=int(self.lock_ttl * 1000))
+            except Exception as e:
+                logger.warning(f"Single-flight lock unavailable, generating without coalescing: {e}")
+                self._count('leaders')
+                return await fn()
+
+            if acquired:
+                return await self._lead(lock_key, channel, token, fn, lookup)
+
+            # Another worker is generating; block a thread (not the loop) until it publishes
+            self._count('remote_followers')
+            remaining = deadline - time.monotonic()
+            result = await asyncio.to_thread(self._wait_for_remote, lock_key, channel, lookup, remaining)
+            if result is not None:
+                return result
+            if time.monotonic() >= deadline:
+                self._count('wait_timeouts')
+                logger.warning(f"Timed out waiting for in-flight generation of {key}, generating locally")
+                self._count('leaders')
+                return await fn()
+            # Lock released without a result (leader failed or crashed): race for it again
+
+    async def _lead(self, lock_key: str, channel: str, token: str, fn, lookup) -> Dict[str, Any]:
+        self._count('leaders')
+        # Redis round trips (lookup included) run on threads so the AI loop keeps serving other calls
+        try:
+            cached = await asyncio.to_thread(lookup) if lookup else None
+            if cached is not None:
+                return cached
+            result = await fn()
+            try:
+                await asyncio.to_thread(self.redis_client.publish, channel, json.dumps(result, default=str))
+            except Exception as e:
+                logger.warning(f"Single-flight publish failed: {e}")
+            return result
+        finally:
+            try:
+                await asyncio.to_thread(self._release, keys=[lock_key], args=[token])
+            except Exception as e:
+                logger.warning(f"Single-flight lock release failed: {e}")
+
+    def _wait_for_remote(self, lock_key: str, channel: str, lookup, timeout: float) -> Optional[Dict[str, Any]]:
+        """Subscribe, then re-check so a result published before the subscription is not missed"""
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(channel)
+            deadline = time.monotonic() + max(0.0, timeout)
+            cached = lookup() if lookup else None
+            if cached is not None:
+                return cached
+            while True:
+                if not self.redis_client.exists(lock_key):
+                    # Finished between our checks, or gave up without publishing
+                    return lookup() if lookup else None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                message = pubsub.get_message(timeout=min(1.0, remaining))
+                if message and message.get('type') == 'message':
+                    return json.loads(message['data'])
+        except Exception as e:
+            logger.warning(f"Single-flight wait failed: {e}")
+            return None
+        finally:
+            pubsub.close()
@@ -0,0 +1,112 @@
+"""
+Sharded Stock Counters - Spread a hot product's stock across N rows
+Opt-in per product for flash sales; reads sum the shards, decrements lock a single shard
+"""
+import random
+from typing import Dict, Any
+from sqlalchemy import update
+from models import db, Product, StockShard
+from services.inventory_ledger import inventory_ledger
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ShardedStockCounter:
+    """Splits stock for selected products across counter shards"""
+
+    def __init__(self, max_shards: int = 64):
+        self.max_shards = max_shards
+
+    def shard_counts(self, product_id: int) -> Dict[int, int]:
+        """Current count per shard index (empty when the product is not sharded)"""
+        rows = db.session.query(StockShard.shard_index, StockShard.count).filter(
+            StockShard.product_id == product_id
+        ).all()
+        return {shard_index: count for shard_index, count in rows}
+
+    def _split(self, total: int, shard_count: int):
+        """Split total as evenly as possible across shard_count shards"""
+        base, remainder = divmod(max(total, 0), shard_count)
+        return [base + (1 if i < remainder else 0) for i in range(shard_count)]
+
+    def enable(self, product: Product, shard_count: int) -> Dict[str, Any]:
+        """Move a product's available stock into shard_count shards (the caller commits)"""
+        if shard_count < 1 or shard_count > self.max_shards:
+            raise ValueError(f"shard_count must be between 1 and {self.max_shards}")
+
+        # Hold off row sales (product lock) and shard sales (shard locks) until the split commits
+        product = inventory_ledger.lock_product(product.id)
+        StockShard.query.filter_by(product_id=product.id).with_for_update().all()
+        total = inventory_ledger.available_stock(product)
+        StockShard.query.filter_by(product_id=product.id).delete(synchronize_session=False)
+        db.session.add_all([
+            StockShard(product_id=product.id, shard_index=i, count=count)
+            for i, count in enumerate(self._split(total, shard_count))
+        ])
+        return {'product_id': product.id, 'shards': shard_count, 'stock': total}
+
+    def disable(self, product: Product) -> Dict[str, Any]:
+        """Fold the shards back into the product row via a ledger adjustment (the caller commits)"""
+        product = inventory_ledger.lock_product(product.id)
+        shards = StockShard.query.filter_by(product_id=product.id).order_by(
+            StockShard.shard_index
+        ).with_for_update().all()
+        if not shards:
+            return {'product_id': product.id, 'shards': 0, 'stock': inventory_ledger.available_stock(product)}
+
+        total = sum(s.count for s in shards)
+        delta = total - inventory_ledger.row_stock(product)
+        if delta:
+            inventory_ledger.record_movement(product.id, delta, 'unshard')
+        for shard in shards:
+            db.session.delete(shard)
+        return {'product_id': product.id, 'shards': 0, 'stock': total}
+
+    def set_total(self, product_id: int, total: int) -> int:
+        """Redistribute an absolute stock level across the existing shards, returning the delta"""
+        shards = StockShard.query.filter_by(product_id=product_id).order_by(
+            StockShard.shard_index
+        ).with_for_update().all()
+        previous = sum(s.count for s in shards)
+        for shard, count in zip(shards, self._split(total, len(shards))):
+            shard.count = count
+        return total - previous
+
+    def decrement(self, product_id: int, quantity: int, counts: Dict[int, int]) -> bool:
+        """
+        Take quantity from a random shard that can cover it, spilling over to
+        the remaining shards. Falls back to draining several shards under lock
+        only when no single shard has enough. The caller commits.
+        """
+        candidates = [index for index, count in counts.items() if count >= quantity]
+        random.shuffle(candidates)
+
+        for shard_index in candidates:
+            result = db.session.execute(
+                update(StockShard).where(
+                    StockShard.product_id == product_id,
+                    StockShard.shard_index == shard_index,
+                    StockShard.count >= quantity
+                ).values(count=StockShard.count - quantity)
+            )
+            if result.rowcount == 1:
+                return True
+
+        # No single shard could cover it: lock all shards in index order and drain across them
+        shards = StockShard.query.filter_by(product_id=product_id).order_by(
+            StockShard.shard_index
+        ).with_for_update().all()
+        if sum(s.count for s in shards) < quantity:
+            return False
+
+        remaining = quantity
+        for shard in sorted(shards, key=lambda s: s.count, reverse=True):
+            take = min(shard.count, remaining)
+            shard.count -= take
+            remaining -= take
+            if remaining == 0:
+                break
+        return True
+
+# Global instance
+stock_shards = ShardedStockCounter()
@@ -0,0 +1,215 @@
+"""
+Token Budget - Daily, hourly and per-endpoint token budgets for Groq calls
+Prompt size is estimated locally before sending; actual usage is settled after the response
+"""
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Check every window first, then charge them all, so a rejected request costs nothing
+RESERVE_SCRIPT = """
+local amount = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[1 + i])
+    local used = tonumber(redis.call('GET', key) or '0')
+    if limit > 0 and amount > 0 and used + amount > limit then
+        return i
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('INCRBY', key, amount)
+    redis.call('EXPIRE', key, tonumber(ARGV[1 + #KEYS + i]))
+end
+return 0
+"""
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+class BudgetExceededError(Exception):
+    """Raised when a request would push a token budget past its limit"""
+
+    def __init__(self, budget: str, retry_after: int):
+        super().__init__(f"Token budget '{budget}' exhausted, retry in {retry_after}s")
+        self.budget = budget
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'error': 'AI token budget exhausted', 'budget': self.budget, 'retry_after_seconds': self.retry_after}
+
+
+class TokenBudget:
+    """Reserve estimated tokens before a completion and settle the difference afterwards"""
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        self.enabled = os.getenv('AI_TOKEN_BUDGET_ENABLED', 'true').lower() == 'true'
+        # 0 disables a limit
+        self.daily_limit = int(os.getenv('AI_TOKEN_BUDGET_DAILY', '2000000'))
+        self.hourly_limit = int(os.getenv('AI_TOKEN_BUDGET_HOURLY', '250000'))
+        # AI_TOKEN_BUDGET_ENDPOINTS="intelligent_optimization=300000,generate_product_description=500000" (per day)
+        self.endpoint_limits = self._parse_endpoint_limits(os.getenv('AI_TOKEN_BUDGET_ENDPOINTS', ''))
+        # Over budget: 'fallback' serves fallback content (never stored as AI content), 'reject' answers 429,
+        # 'defer' queues batch requests as a job to run when the window resets; interactive requests
+        # have nothing to queue, so under 'defer' they are rejected like 'reject'
+        self.policy = os.getenv('AI_TOKEN_BUDGET_POLICY', 'fallback').lower()
+        self._script = redis_client.register_script(RESERVE_SCRIPT) if redis_client is not None else None
+        self._counters: Dict[str, Tuple[int, float]] = {}  # key -> (tokens, monotonic expiry)
+        self._lock = threading.Lock()
+
+    def _parse_endpoint_limits(self, spec: str) -> Dict[str, int]:
+        limits = {}
+        for part in filter(None, (p.strip() for p in spec.split(','))):
+            try:
+                name, limit = part.split('=')
+                limits[name.strip()] = int(limit)
+            except ValueError:
+                logger.warning(f"Ignoring malformed token budget entry: {part}")
+        return limits
+
+    def estimate_tokens(self, text: str) -> int:
+        """Fast approximation of a BPE token count: ~4 characters or ~0.75 words per token"""
+        if not text:
+            return 0
+        return max(math.ceil(len(text) / 4), math.ceil(len(WORD_PATTERN.findall(text)) * 0.75))
+
+    def estimate_request(self, prompt: str, max_tokens: int) -> int:
+        """Worst-case cost of a completion: estimated prompt plus the full output allowance"""
+        return self.estimate_tokens(prompt) + max_tokens
+
+    def _windows(self, endpoint: str) -> List[Tuple[str, str, int, int]]:
+        """(budget name, counter key, limit, seconds until the window resets) for each active limit"""
+        now = datetime.utcnow()
+        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        next_day = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        until_hour = max(1, int((next_hour - now).total_seconds()))
+        until_day = max(1, int((next_day - now).total_seconds()))
+        day, hour = now.strftime('%Y%m%d'), now.strftime('%Y%m%d%H')
+
+        windows = [
+            ('daily', f"aibudget:daily:{day}", self.daily_limit, until_day),
+            ('hourly', f"aibudget:hourly:{hour}", self.hourly_limit, until_hour),
+        ]
+        if endpoint in self.endpoint_limits:
+            windows.append((f"endpoint:{endpoint}", f"aibudget:endpoint:{endpoint}:{day}",
+                            self.endpoint_limits[endpoint], until_day))
+        return windows
+
+    def _charge(self, windows, amount: int, enforce: bool) -> Optional[Tuple[str, int]]:
+        """Add amount to every window; returns the first (budget, retry_after) that would overflow"""
+        limits = [limit if enforce else 0 for _, _, limit, _ in windows]
+
+        if self._script is not None:
+            try:
+                exceeded = int(self._script(
+                    keys=[key for _, key, _, _ in windows],
+                    args=[amount, *limits, *[ttl + 60 for _, _, _, ttl in windows]]
+                ))
+                if exceeded:
+                    name, _, _, ttl = windows[exceeded - 1]
+                    return name, ttl
+                return None
+            except Exception as e:
+                logger.warning(f"Redis token budget unavailable, using local counters: {e}")
+
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (_, expires_at) in self._counters.items() if expires_at <= now]:
+                del self._counters[key]
+            for (name, key, _, ttl), limit in zip(windows, limits):
+                if limit > 0 and amount > 0 and self._counters.get(key, (0, 0))[0] + amount > limit:
+                    return name, ttl
+            for _, key, _, ttl in windows:
+                used, expires_at = self._counters.get(key, (0, now + ttl + 60))
+                self._counters[key] = (used + amount, expires_at)
+        return None
+
+    def reserve(self, endpoint: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """Reserve the worst-case cost of a request, raising BudgetExceededError if any budget would overflow"""
+        amount = self.estimate_request(prompt, max_tokens)
+        if not self.enabled:
+            return {'endpoint': endpoint, 'amount': 0}
+
+        windows = self._windows(endpoint)
+        exceeded = self._charge(windows, amount, enforce=True)
+        if exceeded:
+            logger.warning(f"Token budget {exceeded[0]} exhausted, refusing ~{amount} tokens for {endpoint}")
+            raise BudgetExceededError(*exceeded)
+        return {'endpoint': endpoint, 'amount': amount, 'windows': windows}
+
+    def settle(self, reservation: Dict[str, Any], actual_tokens: int):
+        """Replace a reservation's estimate with the tokens actually billed (0 if the call failed)"""
+        if not self.enabled or not reservation.get('amount'):
+            return
+        delta = actual_tokens - reservation['amount']
+        if delta:
+            self._charge(reservation['windows'], delta, enforce=False)
+
+    async def areserve(self, endpoint: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """reserve() for coroutines on the AI loop; the Redis script runs on a thread"""
+        if self._script is None:
+            return self.reserve(endpoint, prompt, max_tokens)
+        return await asyncio.to_thread(self.reserve, endpoint, prompt, max_tokens)
+
+    async def asettle(self, reservation: Dict[str, Any], actual_tokens: int):
+        """settle() for coroutines on the AI loop"""
+        if self._script is None:
+            self.settle(reservation, actual_tokens)
+        else:
+            await asyncio.to_thread(self.settle, reservation, actual_tokens)
+
+    def check(self, endpoint: str, tokens: int) -> Optional[BudgetExceededError]:
+        """
+        Pre-flight for a whole batch: the error it would hit, without reserving anything.
+        A batch larger than a whole window only needs that window to be unused.
+        """
+        if not self.enabled:
+            return None
+        windows = self._windows(endpoint)
+        usage = self._current_usage(windows)
+        for name, _, limit, ttl in windows:
+            if limit > 0 and usage.get(name, 0) + min(tokens, limit) > limit:
+                return BudgetExceededError(name, ttl)
+        return None
+
+    def _current_usage(self, windows) -> Dict[str, int]:
+        if self.redis_client is not None:
+            try:
+                values = self.redis_client.mget([key for _, key, _, _ in windows])
+                return {name: int(value or 0) for (name, _, _, _), value in zip(windows, values)}
+            except Exception as e:
+                logger.warning(f"Redis token budget unavailable, using local counters: {e}")
+        with self._lock:
+            return {name: self._counters.get(key, (0, 0))[0] for name, key, _, _ in windows}
+
+    def over_budget(self, error: BudgetExceededError, fallback: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Apply the configured policy for an interactive request: fallback content (ai_generated False,
+        so callers do not store it) under 'fallback', otherwise re-raise ('defer' only applies to batches)
+        """
+        if self.policy == 'fallback':
+            return {**fallback, 'budget_exhausted': True}
+        raise error
+
+    def usage(self, endpoint: Optional[str] = None) -> Dict[str, Any]:
+        """Tokens used and remaining in each current window"""
+        windows = self._windows(endpoint or '')
+        used = self._current_usage(windows)
+        return {
+            'enabled': self.enabled,
+            'policy': self.policy,
+            'budgets': {
+                name: {'used': used.get(name, 0), 'limit': limit,
+                       'remaining': max(0, limit - used.get(name, 0)) if limit else None,
+                       'resets_in_seconds': ttl}
+                for name, _, limit, ttl in windows
+            },
+            'endpoint_limits': self.endpoint_limits
+        }
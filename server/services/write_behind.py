@@ -0,0 +1,74 @@
+"""
+Write-Behind Worker - Periodically flush buffered writes to the database
+Runs a daemon thread per process with its own Flask app context
+"""
+import atexit
+import os
+import threading
+from typing import Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindWorker:
+    """Calls flush_fn every interval seconds, and once more on interpreter shutdown"""
+
+    def __init__(self, name: str, flush_fn: Callable[[], int], interval: float = 5.0):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.app = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Bind to the Flask app and start the flush thread"""
+        self.app = app
+        self.start()
+        atexit.register(self.stop)
+
+    def start(self):
+        """Start the flush thread (again, if the process has been forked)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Ask the worker to flush now instead of waiting for the interval"""
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the thread and flush whatever is still buffered"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    def flush(self) -> int:
+        """Run one flush inside an app context, returning the number of records written"""
+        if self.app is None:
+            return 0
+        try:
+            with self.app.app_context():
+                return self.flush_fn() or 0
+        except Exception as e:
+            logger.error(f"Write-behind flush failed for {self.name}: {e}")
+            return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            written = self.flush()
+            if written:
+                logger.info(f"Write-behind {self.name}: flushed {written} records")
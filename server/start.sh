@@ -1,4 +1,4 @@
 #!/bin/bash
 #gunicorn -b 0.0.0.0:5000 -w 4 app:app
 #!/bin/bash
-gunicorn -b 0.0.0.0:$PORT -w 4 app:app
+gunicorn -b 0.0.0.0:$PORT -w 4 --threads 4 app:app
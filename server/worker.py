@@ -0,0 +1,14 @@
+"""
+AI Job Worker - Runs queued AI batch jobs outside the web processes
+Usage: python worker.py [--burst]   (--burst exits once the queue is empty)
+"""
+import sys
+import logging
+from app import app
+from services.job_queue import job_queue
+import services.ai_batch_jobs  # registers the batch job handlers
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+if __name__ == '__main__':
+    job_queue.work(app, burst='--burst' in sys.argv[1:])